@@ -0,0 +1,303 @@
+# document_index.py - Per-user partitioned document chunk index with cosine search
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from agents.document_ingest import EMBED_BATCH_SIZE, ingest_report, iter_chunk_batches, merge_chunks
+from agents.embeddings import get_embedder
+from agents.lexical_index import BM25Index, LEXICAL_CONFIDENCE, RETRIEVAL_MODE, fuse, top_k
+from agents.quantization import EMBEDDING_QUANTIZATION, QuantizedMatrix
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOCUMENTS_DIR = os.path.join(os.getenv('DATA_DIR', 'data'), 'documents')
+MANIFEST = "chunks.json"
+COUNTS = "_counts.json"
+
+
+class _Partition:
+    """One user's chunks: a unit-vector matrix plus chunk records, replaced as a unit."""
+
+    __slots__ = ("matrix", "chunks", "_lexical", "_quantized")
+
+    def __init__(self, matrix: np.ndarray, chunks: List[Dict]):
+        self.matrix = matrix
+        self.chunks = chunks
+        self._lexical = None
+        self._quantized = None
+
+    @property
+    def lexical(self) -> BM25Index:
+        """BM25 over the chunk texts, built on the first search of this partition."""
+        if self._lexical is None:
+            self._lexical = BM25Index([c["text"] for c in self.chunks])
+        return self._lexical
+
+    @property
+    def quantized(self) -> QuantizedMatrix:
+        """Int8 codes of the matrix, built on the first vector search of this partition."""
+        if self._quantized is None:
+            self._quantized = QuantizedMatrix(self.matrix)
+        return self._quantized
+
+
+class UserDocumentIndex:
+    """
+    Document chunks partitioned by user: each user has their own directory
+    with a memory-mapped .npy matrix of chunk embeddings and a JSON manifest
+    of chunk text and metadata, so a query only ever scores that user's
+    vectors (exact cosine top-k; per-user corpora are small enough that an
+    approximate structure would not pay off). A per-user document count is
+    kept in memory and on disk; users with no documents return immediately
+    without embedding the query. Searches are hybrid like the scam pattern
+    index (see agents.lexical_index): BM25 first, and the query is only
+    embedded when no chunk covers it well lexically. With
+    EMBEDDING_QUANTIZATION=int8, loaded partitions keep int8 codes in memory
+    and re-rank candidates against the memory-mapped float matrix.
+    """
+
+    def __init__(self, root: str = None, embedder=None, mode: str = None, quantization: str = None):
+        self.root = root or os.getenv("DOCUMENTS_DIR", DEFAULT_DOCUMENTS_DIR)
+        self.embedder = embedder or get_embedder()
+        # Document chunks go straight to the model; they would only churn the query-embedding cache
+        self._model = getattr(self.embedder, "embedder", self.embedder)
+        self._partitions: Dict[str, _Partition] = {}
+        self.mode = mode or RETRIEVAL_MODE
+        self.lexical_confidence = LEXICAL_CONFIDENCE
+        self.quantization = quantization or EMBEDDING_QUANTIZATION
+        self._write_lock = threading.Lock()
+        self.queries = 0
+        self.skipped_queries = 0
+        self.lexical_only = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._counts: Dict[str, int] = self._load_counts()
+
+    # --- Layout ---
+
+    def _partition_dir(self, user_id: str) -> str:
+        digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.root, f"user={digest}")
+
+    def _load_counts(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.root, COUNTS), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Rebuilding document counts, {COUNTS} unreadable: {e}")
+            counts = {}
+            for name in os.listdir(self.root):
+                try:
+                    with open(os.path.join(self.root, name, MANIFEST), "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                documents = {c["metadata"]["document_id"] for c in manifest["chunks"]}
+                if documents:
+                    counts[manifest["user_id"]] = len(documents)
+            return counts
+
+    def _save_counts(self):
+        tmp_path = os.path.join(self.root, f"{COUNTS}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._counts, f)
+        os.replace(tmp_path, os.path.join(self.root, COUNTS))
+
+    def _partition(self, user_id: str) -> Optional[_Partition]:
+        partition = self._partitions.get(user_id)
+        if partition is not None:
+            return partition
+        directory = self._partition_dir(user_id)
+        try:
+            with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        if manifest.get("embedder") != self.embedder.name:
+            logger.warning(f"Documents for {user_id} were embedded with {manifest.get('embedder')}, re-embedding")
+            matrix = self._model.embed([c["text"] for c in manifest["chunks"]])
+            partition = _Partition(matrix, manifest["chunks"])
+            self._save_partition(user_id, partition)
+        else:
+            partition = _Partition(np.load(os.path.join(directory, manifest["vectors"]), mmap_mode="r"),
+                                   manifest["chunks"])
+        self._partitions[user_id] = partition
+        return partition
+
+    def _save_partition(self, user_id: str, partition: _Partition):
+        directory = self._partition_dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        vectors = f"vectors-{time.time_ns()}.npy"
+        np.save(os.path.join(directory, vectors), partition.matrix)
+        tmp_path = os.path.join(directory, f"{MANIFEST}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"user_id": user_id, "embedder": self.embedder.name, "vectors": vectors,
+                       "chunks": partition.chunks}, f)
+        os.replace(tmp_path, os.path.join(directory, MANIFEST))
+        for name in os.listdir(directory):
+            if name.startswith("vectors-") and name != vectors:
+                os.remove(os.path.join(directory, name))
+        if self.quantization == "int8":
+            # Serve the float rows from the file so only re-ranked candidates are paged in
+            partition.matrix = np.load(os.path.join(directory, vectors), mmap_mode="r")
+
+    # --- Writes ---
+
+    def add_documents(self, user_id: str, documents: List[Dict], batch_size: int = EMBED_BATCH_SIZE) -> Dict:
+        """
+        Chunk and batch-embed documents (see agents.document_ingest) into the
+        user's partition, written once at the end. A document_id that is
+        already stored is replaced, not appended to. Raises ValueError for a
+        document with no text. Returns counts and pages/s.
+        """
+        empty = [i for i, d in enumerate(documents) if not (d.get("text") or "").strip()]
+        if empty:
+            raise ValueError(f"Documents at positions {empty} have no text")
+        stats, batches = {}, 0
+        start = time.perf_counter()
+        matrices, chunks = [], []
+        for ids, texts, metadatas in iter_chunk_batches(user_id, documents, batch_size, stats=stats):
+            matrices.append(self._model.embed(texts))
+            chunks.extend({"id": i, "text": t, "metadata": m} for i, t, m in zip(ids, texts, metadatas))
+            batches += 1
+
+        if chunks:
+            with self._write_lock:
+                current = self._partition(user_id)
+                if current is not None:
+                    replaced = {d["document_id"] for d in documents}
+                    keep = [i for i, c in enumerate(current.chunks) if c["metadata"]["document_id"] not in replaced]
+                    matrices.insert(0, np.asarray(current.matrix)[keep])
+                    chunks = [current.chunks[i] for i in keep] + chunks
+                partition = _Partition(np.vstack(matrices), chunks)
+                self._save_partition(user_id, partition)
+                self._partitions[user_id] = partition
+                self._counts[user_id] = len({c["metadata"]["document_id"] for c in chunks})
+                self._save_counts()
+        return ingest_report(stats, batches, time.perf_counter() - start)
+
+    def delete_document(self, user_id: str, document_id: str) -> bool:
+        with self._write_lock:
+            current = self._partition(user_id)
+            if current is None:
+                return False
+            keep = [i for i, c in enumerate(current.chunks) if c["metadata"]["document_id"] != document_id]
+            if len(keep) == len(current.chunks):
+                return False
+            partition = _Partition(np.asarray(current.matrix)[keep], [current.chunks[i] for i in keep])
+            self._save_partition(user_id, partition)
+            self._partitions[user_id] = partition
+            documents = len({c["metadata"]["document_id"] for c in partition.chunks})
+            if documents:
+                self._counts[user_id] = documents
+            else:
+                self._counts.pop(user_id, None)
+            self._save_counts()
+        return True
+
+    # --- Reads ---
+
+    def document_count(self, user_id: str) -> int:
+        """Documents stored for a user (a dict lookup; no partition is touched)."""
+        return self._counts.get(user_id, 0)
+
+    def get_user_documents(self, user_id: str) -> List[Dict]:
+        if not self.document_count(user_id):
+            return []
+        partition = self._partition(user_id)
+        return merge_chunks(partition.chunks) if partition else []
+
+    def query_user_documents(self, user_id: str, query_text: str, document_type: str = None,
+                             n_results: int = 3, query_vector: np.ndarray = None) -> List[Dict]:
+        """Top chunks of this user's documents (ChromaHelper result shape plus lexical/vector components)."""
+        if not self.document_count(user_id):
+            self.skipped_queries += 1
+            return []
+        partition = self._partition(user_id)
+        if partition is None or len(partition.chunks) == 0:
+            return []
+        self.queries += 1
+        mask = None
+        if document_type:
+            mask = np.fromiter((c["metadata"].get("document_type") == document_type for c in partition.chunks),
+                               dtype=bool, count=len(partition.chunks))
+
+        lexical = []
+        if self.mode != "vector":
+            lexical = partition.lexical.search(query_text, n_results, normalize="query", mask=mask)
+        if self.mode == "lexical" or (query_vector is None and lexical and lexical[0][1] >= self.lexical_confidence):
+            self.lexical_only += 1
+            hits = fuse(lexical, None, n_results)
+        else:
+            if query_vector is None:
+                query_vector = self.embedder.embed_one(query_text)
+            if self.quantization == "int8":
+                scores = partition.quantized.scores(query_vector, n_results, mask=mask)
+            else:
+                scores = partition.matrix @ query_vector
+                if mask is not None:
+                    scores = np.where(mask, scores, -np.inf)
+            if self.mode == "vector":
+                hits = [{"row": row, "score": score, "lexical": None, "vector": score}
+                        for row, score in top_k(scores, n_results)]
+            else:
+                hits = fuse(lexical, scores, n_results)
+        return [{
+            "text": partition.chunks[hit["row"]]["text"],
+            "metadata": partition.chunks[hit["row"]]["metadata"],
+            "similarity": hit["score"],
+            "lexical_score": hit["lexical"],
+            "vector_score": hit["vector"],
+        } for hit in hits]
+
+    def stats(self) -> Dict:
+        return {
+            "users_with_documents": len(self._counts),
+            "documents": sum(self._counts.values()),
+            "partitions_loaded": len(self._partitions),
+            "quantization": self.quantization,
+            "resident_vector_bytes": sum(p._quantized.nbytes if p._quantized is not None else
+                                         (0 if isinstance(p.matrix, np.memmap) else int(p.matrix.nbytes))
+                                         for p in list(self._partitions.values())),
+            "mode": self.mode,
+            "queries": self.queries,
+            "answered_lexically": self.lexical_only,
+            "skipped_no_documents": self.skipped_queries,
+        }
+
+
+def benchmark(users: int = 2000, chunks_per_user: int = 20, queries: int = 2000) -> Dict:
+    """Query cost scoring only one user's partition versus one shared matrix filtered by user."""
+    rng = np.random.default_rng(0)
+    dim = get_embedder().dim
+    matrix = rng.standard_normal((users * chunks_per_user, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    owners = np.repeat(np.arange(users), chunks_per_user)
+    partitions = [matrix[owners == u].copy() for u in range(users)]
+    query_vectors = matrix[rng.integers(0, len(matrix), 16)]
+
+    start = time.perf_counter()
+    for i in range(queries):
+        user = i % users
+        scores = matrix @ query_vectors[i % 16]
+        top_k(np.where(owners == user, scores, -np.inf), 3)
+    shared = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    for i in range(queries):
+        top_k(partitions[i % users] @ query_vectors[i % 16], 3)
+    partitioned = (time.perf_counter() - start) / queries
+
+    return {"users": users, "chunks": len(matrix), "shared_filtered_us": round(shared * 1e6, 1),
+            "per_user_us": round(partitioned * 1e6, 1), "speedup": round(shared / partitioned, 1)}
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,267 @@
+# embeddings.py - Text embedders for the in-process similarity indexes
+import hashlib
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from agents.text_normalizer import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# "hashing" needs only NumPy; "minilm" uses ChromaDB's bundled all-MiniLM-L6-v2 ONNX model when installed
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing").lower()
+HASHING_DIM = 1024
+# Query-embedding LRU size, and whether to keep a SQLite tier that survives restarts
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+DEFAULT_CACHE_DB = os.path.join(os.getenv('DATA_DIR', 'data'), 'embedding_cache.db')
+# Persisted-tier writes are buffered and committed in batches of this size
+CACHE_WRITE_BATCH = 64
+# Hashed feature -> (dimension, sign) memo; words and trigrams repeat heavily across messages
+MAX_CACHED_FEATURES = 200_000
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its me my of on or our so that the this to "
+    "was we will with you your".split()
+)
+_WORD = re.compile(r"[a-z0-9$]+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedding: word unigrams, word bigrams and character
+    trigrams of the normalized text, feature-hashed (crc32, signed) into a
+    fixed number of dimensions, log-scaled and L2-normalized. Captures
+    lexical overlap and spelling variants, not paraphrase.
+    """
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        # Cosine similarity above which a scam pattern counts as a match (lexical overlap scores lower than MiniLM)
+        self.match_threshold = 0.3
+        # Similarity above which a new scam exemplar is a near-duplicate of a stored one (rewordings score ~0.7+)
+        self.dedup_threshold = 0.7
+        self._slots: Dict[str, Tuple[int, float]] = {}
+
+    def _slot(self, feature: str) -> Tuple[int, float]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        # The top hash bit picks the sign so colliding features tend to cancel rather than add up
+        slot = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+        if len(self._slots) >= MAX_CACHED_FEATURES:
+            self._slots.clear()
+        self._slots[feature] = slot
+        return slot
+
+    def _features(self, text: str) -> List[str]:
+        words = [w for w in _WORD.findall(normalize_text(text)) if w not in STOPWORDS]
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 matrix of unit vectors (all-zero rows for empty texts)."""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self._features(text):
+                counts[feature] = counts.get(feature, 0) + 1
+            if not counts:
+                continue
+            indices, weights = [], []
+            for feature, count in counts.items():
+                slot = self._slots.get(feature)
+                if slot is None:
+                    slot = self._slot(feature)
+                indices.append(slot[0])
+                weights.append(slot[1] * (1.0 + math.log(count)) if count > 1 else slot[1])
+            vectors[row] = np.bincount(indices, weights=weights, minlength=self.dim)
+        return _normalize_rows(vectors)
+
+
+class MiniLMEmbedder:
+    """all-MiniLM-L6-v2 via ChromaDB's DefaultEmbeddingFunction (the model the ChromaDB collections use)."""
+
+    def __init__(self):
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+        self._function = DefaultEmbeddingFunction()
+        self.dim = 384
+        self.name = "minilm-l6-v2"
+        self.match_threshold = 0.7
+        self.dedup_threshold = 0.9
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return _normalize_rows(np.asarray(self._function(list(texts)), dtype=np.float32))
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class CachedEmbedder:
+    """
+    Wraps an embedder with an LRU keyed by a hash of the normalized text, so
+    a message is embedded once however many indexes it is queried against,
+    and recurring scam texts (or trivially re-spaced/re-cased copies) are
+    not re-embedded. An optional SQLite tier keeps embeddings across
+    restarts. Misses in a batch are embedded together in one call.
+    """
+
+    def __init__(self, embedder, capacity: int = EMBEDDING_CACHE_SIZE, persist_path: str = None):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.dim = embedder.dim
+        self.match_threshold = embedder.match_threshold
+        self.dedup_threshold = embedder.dedup_threshold
+        self.capacity = capacity
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.embed_seconds = 0.0
+
+        self._db = None
+        self._pending: List[Tuple[bytes, bytes]] = []
+        if persist_path:
+            os.makedirs(os.path.dirname(persist_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.name}\x1f{normalize_text(text)}".encode("utf-8"), digest_size=16).digest()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._lru[key] = vector
+        if len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def _disk_get(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        if not self._db or not keys:
+            return {}
+        with self._lock:
+            rows = self._db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})",
+                                    keys).fetchall()
+        return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Same contract as the wrapped embedder's embed(); only cache misses reach it."""
+        keys = [self.key(text) for text in texts]
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for row, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    vectors[row] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(row)
+
+        if missing:
+            stored = self._disk_get(list(missing))
+            with self._lock:
+                for key, vector in stored.items():
+                    vectors[missing.pop(key)] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+
+        if missing:
+            start = time.perf_counter()
+            fresh = self.embedder.embed([texts[rows[0]] for rows in missing.values()])
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.embed_seconds += elapsed
+                self.misses += len(missing)
+                for (key, rows), vector in zip(missing.items(), fresh):
+                    vectors[rows] = vector
+                    self._remember(key, vector)
+                    if self._db:
+                        self._pending.append((key, vector.tobytes()))
+            if len(self._pending) >= CACHE_WRITE_BATCH:
+                self.flush()
+        return vectors
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def flush(self) -> int:
+        """Commit buffered embeddings to the persisted tier."""
+        if not self._db:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending:
+                self._db.executemany("INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)", pending)
+                self._db.commit()
+        return len(pending)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        per_embed = self.embed_seconds / self.misses if self.misses else 0.0
+        return {
+            "embedder": self.name,
+            "entries": len(self._lru),
+            "capacity": self.capacity,
+            "persisted": self._db is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "avg_embed_ms": round(per_embed * 1000, 3),
+            "embed_ms_total": round(self.embed_seconds * 1000, 2),
+            "estimated_ms_saved": round((self.hits + self.disk_hits) * per_embed * 1000, 2),
+        }
+
+
+class ChromaEmbeddingFunction:
+    """Adapter so ChromaDB collections embed documents and queries through the shared cache."""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embedder.embed(list(input)).tolist()
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    Process-wide cached embedder for EMBEDDING_BACKEND, falling back to
+    hashing if MiniLM can't load.
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                embedder = None
+                if EMBEDDING_BACKEND == "minilm":
+                    try:
+                        embedder = MiniLMEmbedder()
+                    except Exception as e:
+                        logger.warning(f"MiniLM embeddings unavailable ({e}); using hashing embeddings")
+                _embedder = CachedEmbedder(embedder or HashingEmbedder(),
+                                           persist_path=DEFAULT_CACHE_DB if EMBEDDING_CACHE_PERSIST else None)
+    return _embedder
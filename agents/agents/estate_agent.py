@@ -3,6 +3,17 @@ import os
 import google.generativeai as genai
 from typing import Dict, List
 from tabulate import tabulate
+from agents.prompt_builder import PromptBuilder, encode_fields
+from agents.llm_gateway import generate_content
+
+# Profile fields that are relevant to the estate document review, in prompt order
+ESTATE_DOCUMENTS = [
+    ("last_will_update", "Last Will & Testament"),
+    ("power_of_attorney", "Power of Attorney"),
+    ("healthcare_proxy", "Healthcare Proxy"),
+    ("trust_documents", "Trust Documents"),
+]
+ESTATE_PROFILE_FIELDS = ["age", "marital_status", "children", "assets"] + [field for field, _ in ESTATE_DOCUMENTS]
 
 class EstateAgent:
     def __init__(self, api_key: str = None, elderly_mode: bool = True):
@@ -86,21 +97,20 @@ class EstateAgent:
         
         checklist_text = self.generate_checklist(profile)
         
-        base_prompt = f"""
-        You are an estate planning advisor for elderly clients.
-        Review this user profile: {profile}
-        
-        1. Summarize what documents are missing and why they matter.
-        2. Suggest next steps in very simple, friendly language.
-        3. Include reminders about legal risks or family benefits.
-        4. Provide gentle reassurance and encouragement.
-        
-        Use short sentences. Use plain language. Avoid legal terms.
-        Speak warmly, like explaining to a senior family member.
-        """
+        missing_docs = [name for field, name in ESTATE_DOCUMENTS if not profile.get(field)]
+        prompt = (
+            PromptBuilder("estate")
+            .add("You are an estate planning advisor for elderly clients.")
+            .add_text(encode_fields(profile, ESTATE_PROFILE_FIELDS), label="User profile")
+            .add(f"Missing documents: {', '.join(missing_docs) or 'none'}\n"
+                 "Explain why the missing documents matter, suggest simple next steps, mention legal risks "
+                 "or family benefits, and end with gentle encouragement. "
+                 "Use short sentences, plain language and no legal terms. Speak warmly, like to a senior family member.")
+            .build()
+        )
         
         try:
-            response = self.model.generate_content(base_prompt)
+            response = generate_content(self.model, prompt, agent="estate", operation="check_documents")
             recommendation_text = response.text if response and hasattr(response, 'text') else "Unable to generate recommendations at this time."
             
             # Determine risk level based on missing documents
@@ -1,10 +1,43 @@
 # family_agent.py
 import os
+import json
+import time
+import threading
 import google.generativeai as genai
 from typing import Dict, List
+from agents.prompt_builder import PromptBuilder, truncate_to_tokens
+from agents.llm_gateway import generate_content, usage_tracker
+
+# Batched alert generation: events per Gemini call and per-event description budget
+FAMILY_ALERT_BATCH_SIZE = 20
+FAMILY_ALERT_BATCH_EVENT_TOKENS = 150
+# Seconds queued alerts wait for others to share their Gemini call
+FAMILY_ALERT_FLUSH_INTERVAL = float(os.getenv("FAMILY_ALERT_FLUSH_INTERVAL", "2"))
+
+FAMILY_ALERT_INSTRUCTIONS = (
+    "You are a family safety and financial assistant. "
+    "Your response must be a structured alert in a **plain text format**, using simple line breaks (\\n) and dashes (-) for bullet points. **DO NOT use Markdown or special characters** like '*', '##', or '**'.\n"
+    "The alert must contain the following three sections, separated by a blank line:\n"
+    "1. A **Concise Headline** (one sentence, reassuring tone).\n"
+    "2. **Immediate Action Steps** (2-3 dashed list items with clear, actionable instructions).\n"
+    "3. **Contact Protocol** (1 dashed list item confirming the emergency contact is being notified)."
+)
+
+FAMILY_ALERT_EXAMPLE = (
+    "Format Example for 'Missing money in account':\n"
+    "Concise Headline: We have identified an unexpected financial discrepancy and are investigating.\n\n"
+    "Immediate Action Steps:\n"
+    "- Temporarily halt all transfers from the affected account.\n"
+    "- Review your transaction history for any unauthorized activity and save screenshots.\n"
+    "- Wait for the family administrator to provide next steps before contacting the bank.\n\n"
+    "Contact Protocol:\n"
+    "- The emergency family contact has been automatically notified and will be in touch shortly."
+)
 
 class FamilyAgent:
     def __init__(self, api_key: str = None):
+        self.last_batch_stats = {}
+        
         # Initialize Gemini API
         api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not api_key:
@@ -61,31 +94,118 @@ class FamilyAgent:
         if not self.model:
             return self._basic_family_alert(event_description, risk_level)
         
-        prompt = (
-            "You are a family safety and financial assistant. "
-            "Your response must be a structured alert in a **plain text format**, using simple line breaks (\\n) and dashes (-) for bullet points. **DO NOT use Markdown or special characters** like '*', '##', or '**'.\n"
-            "The alert must contain the following three sections, separated by a blank line:\n"
-            "1. A **Concise Headline** (one sentence, reassuring tone).\n"
-            "2. **Immediate Action Steps** (2-3 dashed list items with clear, actionable instructions).\n"
-            "3. **Contact Protocol** (1 dashed list item confirming the emergency contact is being notified).\n"
-            f"Event: {event_description}\n"
-            f"Risk Level: {risk_level}\n\n"
-            "Format Example for 'Missing money in account':\n"
-            "Concise Headline: We have identified an unexpected financial discrepancy and are investigating.\n\n"
-            "Immediate Action Steps:\n"
-            "- Temporarily halt all transfers from the affected account.\n"
-            "- Review your transaction history for any unauthorized activity and save screenshots.\n"
-            "- Wait for the family administrator to provide next steps before contacting the bank.\n\n"
-            "Contact Protocol:\n"
-            "- The emergency family contact has been automatically notified and will be in touch shortly."
-        )
+        prompt = self._build_family_alert_prompt(event_description, risk_level)
         
         try:
-            response = self.model.generate_content(prompt)
+            response = generate_content(self.model, prompt, agent="family", operation="family_alert")
             return response.text if response and hasattr(response, 'text') else self._basic_family_alert(event_description, risk_level)
         except Exception as e:
             return self._basic_family_alert(event_description, risk_level)
     
+    def _build_family_alert_prompt(self, event_description: str, risk_level: str):
+        return (
+            PromptBuilder("family")
+            .add(FAMILY_ALERT_INSTRUCTIONS)
+            .add_text(event_description, label="Event")
+            .add(f"Risk Level: {risk_level}\n\n{FAMILY_ALERT_EXAMPLE}")
+            .build()
+        )
+    
+    def generate_family_alerts_batch(self, events: List[Dict], batch_size: int = FAMILY_ALERT_BATCH_SIZE) -> Dict[str, str]:
+        """
+        Generate many family alerts with one Gemini call per batch.
+        Each event is a dict with alert_id, event_description and risk_level.
+        Returns alert_id -> alert text; items the model misses or garbles fall
+        back to _basic_family_alert. Savings versus one call per alert are
+        recorded in self.last_batch_stats.
+        """
+        alerts = {}
+        stats = {
+            "alerts": len(events),
+            "llm_calls": 0,
+            "fallbacks": 0,
+            "prompt_tokens": 0,
+            "single_call_prompt_tokens": 0,
+            "latency_ms": 0.0,
+        }
+        
+        for start in range(0, len(events), batch_size):
+            batch = events[start:start + batch_size]
+            stats["single_call_prompt_tokens"] += sum(
+                self._build_family_alert_prompt(event["event_description"], event.get("risk_level", "MEDIUM")).token_count
+                for event in batch
+            )
+            
+            generated = {}
+            if self.model:
+                prompt = self._build_family_alert_batch_prompt(batch)
+                started = time.perf_counter()
+                try:
+                    response = generate_content(self.model, prompt, agent="family", operation="family_alert_batch")
+                    generated = self._parse_family_alert_batch(response.text if response and hasattr(response, 'text') else "")
+                except Exception as e:
+                    print(f"⚠️ Warning: Batched family alert generation failed: {e}")
+                stats["latency_ms"] += (time.perf_counter() - started) * 1000
+                stats["llm_calls"] += 1
+                stats["prompt_tokens"] += prompt.token_count
+            
+            for event in batch:
+                alert_id = str(event["alert_id"])
+                if alert_id in generated:
+                    alerts[alert_id] = generated[alert_id]
+                else:
+                    stats["fallbacks"] += 1
+                    alerts[alert_id] = self._basic_family_alert(event["event_description"], event.get("risk_level", "MEDIUM"))
+        
+        # Compare against what one call per alert would have cost
+        single_latency = usage_tracker.average_latency_ms("family", "family_alert")
+        stats["token_savings"] = stats["single_call_prompt_tokens"] - stats["prompt_tokens"] if stats["llm_calls"] else 0
+        stats["estimated_single_call_latency_ms"] = round(single_latency * len(events), 1) if single_latency else None
+        stats["latency_ms"] = round(stats["latency_ms"], 1)
+        self.last_batch_stats = stats
+        return alerts
+    
+    def _build_family_alert_batch_prompt(self, batch: List[Dict]):
+        rows = [
+            {
+                "alert_id": event["alert_id"],
+                "risk_level": event.get("risk_level", "MEDIUM"),
+                "event": truncate_to_tokens(event["event_description"], FAMILY_ALERT_BATCH_EVENT_TOKENS)
+            }
+            for event in batch
+        ]
+        return (
+            PromptBuilder("family_batch")
+            .add(FAMILY_ALERT_INSTRUCTIONS)
+            .add(FAMILY_ALERT_EXAMPLE)
+            .add_table(rows, ["alert_id", "risk_level", "event"], label="Events (one per line, '|' separated)")
+            .add("Write one alert per event. Respond with only a JSON array of objects with keys "
+                 "\"alert_id\" (copied exactly from the event) and \"alert\" (the full plain text alert).")
+            .build()
+        )
+    
+    @staticmethod
+    def _parse_family_alert_batch(response_text: str) -> Dict[str, str]:
+        """Parse the JSON array of alerts, keeping only well-formed items"""
+        start_idx = response_text.find('[')
+        end_idx = response_text.rfind(']') + 1
+        if start_idx == -1 or end_idx <= start_idx:
+            return {}
+        
+        try:
+            items = json.loads(response_text[start_idx:end_idx])
+        except json.JSONDecodeError:
+            return {}
+        
+        parsed = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            alert_id, alert = item.get("alert_id"), item.get("alert")
+            if alert_id is not None and isinstance(alert, str) and alert.strip():
+                parsed[str(alert_id)] = alert.strip()
+        return parsed
+    
     def _basic_family_alert(self, event_description: str, risk_level: str) -> str:
         """Generate basic family alert without AI"""
         urgency = "URGENT" if risk_level == "HIGH" else "ATTENTION"
@@ -393,4 +513,86 @@ I'm here to help you stay connected with your family and ensure everyone can com
 • "What information is safe to share with family members?"
 • "How can I protect my family from scams targeting seniors?"
 
-**Need Specific Assistance?** Ask me about any family communication concern, emergency planning, or safety question. I'm here to help you build strong, secure connections with the people who matter most to you."""
\ No newline at end of file
+**Need Specific Assistance?** Ask me about any family communication concern, emergency planning, or safety question. I'm here to help you build strong, secure connections with the people who matter most to you."""
+
+
+class FamilyAlertBatcher:
+    """
+    Queues family alerts whose text should come from Gemini and writes it
+    in batches: alerts are stored right away with the basic template text,
+    and a daemon thread replaces it with generate_family_alerts_batch()
+    output every flush interval, or as soon as a full batch is waiting.
+    An incident spike therefore costs one Gemini call per batch instead of
+    one per alert.
+    """
+    
+    def __init__(self, agent: FamilyAgent, db, interval: float = FAMILY_ALERT_FLUSH_INTERVAL,
+                 batch_size: int = FAMILY_ALERT_BATCH_SIZE):
+        self.agent = agent
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self._queue: List[Dict] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.llm_calls = 0
+        self.fallbacks = 0
+    
+    def enqueue(self, alert_id: int, event_description: str, risk_level: str = "MEDIUM"):
+        with self._lock:
+            self._queue.append({"alert_id": alert_id, "event_description": event_description, "risk_level": risk_level})
+            full = len(self._queue) >= self.batch_size
+        if full:
+            self._wake.set()
+    
+    def flush(self) -> int:
+        """Generate and store the text of every queued alert. Returns how many were written."""
+        with self._lock:
+            events, self._queue = self._queue, []
+        if not events:
+            return 0
+        alerts = self.agent.generate_family_alerts_batch(events, self.batch_size)
+        for event in events:
+            self.db.update_alert_message(event["alert_id"], alerts[str(event["alert_id"])])
+        stats = self.agent.last_batch_stats
+        self.flushed += len(events)
+        self.llm_calls += stats.get("llm_calls", 0)
+        self.fallbacks += stats.get("fallbacks", 0)
+        return len(events)
+    
+    def start(self):
+        """Flush in a daemon thread every interval seconds, or early when a batch fills."""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️ Warning: Family alert batch flush failed: {e}")
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="family-alert-batcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> int:
+        """Stop the thread and write whatever is still queued."""
+        self._stop.set()
+        self._wake.set()
+        return self.flush()
+    
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self._queue),
+            "alerts_flushed": self.flushed,
+            "llm_calls": self.llm_calls,
+            "fallbacks": self.fallbacks,
+            "flush_interval_s": self.interval,
+            "batch_size": self.batch_size,
+        }
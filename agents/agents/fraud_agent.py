@@ -1,16 +1,43 @@
 import json
-# import pandas as pd  # Temporarily disabled for deployment
 import google.generativeai as genai
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Any
-# import numpy as np  # Temporarily disabled for deployment
+import numpy as np
 import os
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from agents.prompt_builder import PromptBuilder, count_tokens, encode_table, get_token_budget
+from agents.llm_gateway import generate_content, usage_tracker, LLM_MAX_CONCURRENCY
+from agents.transaction_rules import TransactionRuleEngine, columns_from_records, records_from_columns, column_length
+from agents.transaction_ingest import iter_transaction_chunks, DEFAULT_CHUNK_SIZE
+from agents.spending_baselines import batch_zscores
+from agents.parallel_analysis import ShardedRuleAnalyzer
+from agents.indicator_reputation import INDICATOR_LABELS
+from agents.text_rules import get_text_rules
+from agents.rule_metrics import get_rule_metrics
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Columns sent to Gemini for transaction analysis, in prompt order
+TRANSACTION_PROMPT_COLUMNS = ["id", "amount", "merchant", "category", "channel", "fraud_score"]
+
+# Upper bound on transactions kept in memory for the Gemini pass of a file analysis
+AI_MAX_TRANSACTIONS = 500
+
+# Cascade mode: transactions scoring inside [low, high) are ambiguous and go to Gemini;
+# below is decided safe, at or above is decided suspicious by rules/statistics alone
+CASCADE_UNCERTAINTY_BAND = (0.3, 0.8)
+RULE_LEVEL_WEIGHTS = {"HIGH": 1.0, "MEDIUM": 0.6, "LOW": 0.2}
+# Prompt tokens reserved for instructions when sizing transaction batches
+TRANSACTION_PROMPT_OVERHEAD_TOKENS = 300
+
+# Attempts per transaction chunk before its transactions are reported unanalyzed
+AI_CHUNK_ATTEMPTS = 3
+AI_RETRY_BACKOFF_SECONDS = 0.5
+
 @dataclass
 class FraudAlert:
     transaction_id: str
@@ -66,72 +93,57 @@ class ElderlyFraudAgentWithGemini:
             }
         }
         
+        self.rule_engine = TransactionRuleEngine()
+        # Optional SpendingBaselines (attached by the coordinator) for cascade scoring
+        self.baselines = None
+        # Optional IndicatorReputationIndex (attached by the coordinator) of known scam contacts
+        self.reputation = None
+        
         self.elderly_friendly_messages = {
             "safe": "✅ This transaction looks normal and safe.",
             "caution": "⚠️ Please review this transaction carefully.",
             "danger": "🚨 ALERT: This transaction shows signs of fraud!"
         }
     
-    def analyze_text_for_fraud(self, text: str) -> Dict:
-        """Analyze text input for fraud indicators"""
-        risk_indicators = []
-        risk_level = "LOW"
-        actions = []
-        
-        text_lower = text.lower()
-        
-        # High-risk patterns - Personal Information Requests
-        if any(keyword in text_lower for keyword in ["ssn", "social security", "bank account", "credit card", "password"]):
-            risk_indicators.append("Request for sensitive personal information")
-            risk_level = "HIGH"
-            actions.extend(["BLOCK_CALLER", "ALERT_FAMILY"])
-        
-        # High-risk patterns - Pressure Tactics
-        if any(keyword in text_lower for keyword in ["urgent", "immediate", "act now", "limited time"]):
-            risk_indicators.append("High-pressure tactics detected")
-            if risk_level != "HIGH":
-                risk_level = "MEDIUM"
-            actions.append("VERIFY_INDEPENDENTLY")
-        
-        # High-risk patterns - Suspicious Payment Methods
-        if any(keyword in text_lower for keyword in ["gift card", "bitcoin", "wire transfer", "money order"]):
-            risk_indicators.append("Suspicious payment method requested")
-            risk_level = "HIGH"
-            actions.extend(["DO_NOT_PAY", "ALERT_FAMILY"])
-        
-        # High-risk patterns - Government Impersonation
-        if any(keyword in text_lower for keyword in ["irs", "arrest", "warrant", "police"]):
-            risk_indicators.append("Government impersonation scam indicators")
-            risk_level = "HIGH"
-            actions.extend(["HANG_UP", "CONTACT_AUTHORITIES"])
-        
-        # High-risk patterns - Large Money Requests
-        money_keywords = ["pay", "payment", "money", "amount", "lakh", "lakhs", "crore", "crores", "thousand", "million", "dollars", "rupees", "$"]
-        large_amounts = ["lakh", "lakhs", "crore", "crores", "million", "thousand"]
-        if any(keyword in text_lower for keyword in money_keywords) and any(amount in text_lower for amount in large_amounts):
-            risk_indicators.append("Large monetary payment request detected")
-            risk_level = "HIGH"
-            actions.extend(["DO_NOT_PAY", "VERIFY_SENDER", "CONTACT_FAMILY"])
-        
-        # High-risk patterns - Mail/Email Payment Demands
-        if any(keyword in text_lower for keyword in ["received", "mail", "email", "letter"]) and any(pay in text_lower for pay in ["pay", "payment", "send", "transfer"]):
-            risk_indicators.append("Unsolicited payment demand via mail/email")
-            if risk_level != "HIGH":
-                risk_level = "MEDIUM"
-            actions.extend(["VERIFY_SENDER", "DO_NOT_PAY"])
-        
-        # High-risk patterns - Tech Support Scams
-        if any(keyword in text_lower for keyword in ["computer", "virus", "infected", "microsoft", "apple", "tech support", "remote access"]):
-            risk_indicators.append("Tech support scam indicators")
-            risk_level = "HIGH"
-            actions.extend(["HANG_UP", "DO_NOT_ALLOW_ACCESS"])
-        
-        # Medium-risk patterns - Sweepstakes/Prize Scams
-        if any(keyword in text_lower for keyword in ["winner", "won", "prize", "lottery", "sweepstakes", "congratulations"]):
-            risk_indicators.append("Prize/lottery scam indicators")
-            if risk_level != "HIGH":
-                risk_level = "MEDIUM"
-            actions.append("VERIFY_INDEPENDENTLY")
+    def analyze_text_for_fraud(self, text: str, normalized: str = None) -> Dict:
+        """
+        Analyze text input for fraud indicators. Keywords are matched on the
+        normalized text so "g1ft c a r d" or "ＩＲＳ" still count; pass
+        `normalized` when the caller has already computed it. The rules that
+        fired and their stage timings are returned in metadata; the caller
+        records them in RuleMetrics once the message's final risk is known.
+        """
+        timing = get_rule_metrics().timing
+        timings = {} if timing else None
+        started = time.perf_counter_ns() if timing else 0
+        
+        # Keyword rules live in agents/data/text_rules.json and are evaluated in one pass
+        matched = get_text_rules().analyze(text, normalized=normalized)
+        risk_indicators = matched["risk_indicators"]
+        risk_level = matched["risk_level"]
+        actions = matched["actions"]
+        rules_fired = matched["rules"]
+        if timings is not None:
+            now = time.perf_counter_ns()
+            timings["keyword_rules"], started = now - started, now
+        
+        # Known-bad phone numbers, links and payment IDs from earlier incidents, even without keywords
+        known_bad = self.reputation.check(text) if self.reputation is not None else []
+        for hit in known_bad:
+            risk_indicators.append(f"Contains a {INDICATOR_LABELS[hit['kind']]} ({hit['value']}) "
+                                   f"already reported in scam incidents from {hit['reports']} separate sources")
+        if known_bad:
+            # Backed by a scam rule the message is HIGH; a reported contact on its own only calls for caution
+            if rules_fired:
+                risk_level = "HIGH"
+                actions.extend(["DO_NOT_PAY", "BLOCK_CALLER", "ALERT_FAMILY"])
+            else:
+                risk_level = "MEDIUM" if risk_level == "LOW" else risk_level
+                actions.append("VERIFY_INDEPENDENTLY")
+            rules_fired = rules_fired + ["known_bad_indicator"]
+        if timings is not None and self.reputation is not None:
+            timings["known_bad_indicators"] = time.perf_counter_ns() - started
+
         
         # Generate detailed structured response based on risk
         if risk_level == "HIGH":
@@ -146,7 +158,9 @@ class ElderlyFraudAgentWithGemini:
             "response": response,
             "risk_indicators": risk_indicators,
             "actions": actions,
-            "confidence_score": 0.9 if risk_level == "HIGH" else 0.7 if risk_level == "MEDIUM" else 0.5
+            "known_bad_indicators": known_bad,
+            "confidence_score": 0.9 if risk_level == "HIGH" else 0.7 if risk_level == "MEDIUM" else 0.5,
+            "metadata": {"rules_fired": rules_fired, "rule_timings_ns": timings}
         }
     
     def _generate_high_risk_response(self, risk_indicators: List[str], original_text: str) -> str:
@@ -271,148 +285,175 @@ By staying alert and asking questions, you're protecting yourself effectively. T
 
 **Need Help?** If you have any concerns, don't hesitate to ask me about specific contacts or situations."""
     
-    def load_transaction_data(self, file_path: str):
+    def load_transaction_data(self, file_path: str) -> Dict:
         """
-        Load transaction data from CSV file
-        Temporarily disabled for deployment compatibility
+        Load a whole transaction file (NDJSON, JSON array or CSV) as columns.
+        Prefer iter_transaction_chunks for large files - this holds everything in memory.
         """
-        logger.warning("Transaction data loading temporarily disabled for deployment")
-        return []
-        """Load and prepare transaction data"""
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        df = pd.DataFrame(data)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['amount'] = pd.to_numeric(df['amount'])
-        return df
+        chunks = list(iter_transaction_chunks(file_path))
+        if not chunks:
+            return columns_from_records([])
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
     
     def analyze_with_gemini(self, transactions: List[Dict]) -> Dict:
-        """Use Gemini AI to analyze transaction patterns"""
+        """
+        Use Gemini AI to analyze transaction patterns.
+        Transactions are split into token-bounded chunks analyzed concurrently
+        (under the gateway's shared concurrency limit) and merged; a chunk that
+        still fails after retries only leaves its own transactions unanalyzed.
+        """
         if not self.model:
             return {"error": "Gemini AI not available"}
+        if not transactions:
+            return {"ai_alerts": [], "chunks": 0, "failed_chunks": 0, "unanalyzed_transactions": []}
         
-        # Prepare transaction data for AI analysis
-        transaction_summary = []
-        for tx in transactions:
-            summary = {
-                "id": tx['transaction_id'],
-                "amount": tx['amount'],
-                "merchant": tx['merchant_name'],
-                "category": tx['merchant_category'],
-                "channel": tx['channel'],
-                "existing_fraud_score": tx.get('fraud_score', 0)
-            }
-            transaction_summary.append(summary)
-        
-        prompt = f"""
-        You are a fraud detection expert specializing in protecting elderly customers from financial scams and fraud.
-        
-        Analyze these transactions for patterns that might indicate fraud targeting seniors:
-        
-        {json.dumps(transaction_summary, indent=2)}
-        
-        Focus on these elderly-specific fraud indicators:
-        1. Merchant category mismatches (e.g., Shell categorized as grocery)
-        2. Unusually high amounts for common categories (pharmacy, gas station)
-        3. ATM withdrawals over $1000 (often indicates coercion)
-        4. Card-not-present transactions over $500 (phone/online scams)
-        5. Multiple transactions at same merchant type in short time
-        
-        For each suspicious transaction, provide:
-        - Transaction ID
-        - Risk level (LOW/MEDIUM/HIGH)
-        - Specific concern for elderly users
-        - Recommended action
-        - Confidence score (0.0-1.0)
-        
-        Respond in JSON format with an array of alerts.
-        """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            # Try to parse JSON from response
-            response_text = response.text
-            
-            # Clean up the response to extract JSON
-            start_idx = response_text.find('[')
-            end_idx = response_text.rfind(']') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return {"ai_alerts": json.loads(json_str)}
-            else:
-                return {"ai_analysis": response_text, "parsed": False}
+        batches = self._token_bounded_batches(transactions)
+        if len(batches) == 1:
+            chunk_results = [self._analyze_transaction_chunk(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(batches), LLM_MAX_CONCURRENCY)) as pool:
+                chunk_results = list(pool.map(self._analyze_transaction_chunk, batches))
+        
+        # Merge in chunk order, keeping the first alert per transaction
+        alerts, seen, unanalyzed, errors = [], set(), [], []
+        for batch, result in zip(batches, chunk_results):
+            if "error" in result:
+                errors.append(result["error"])
+                unanalyzed.extend(str(tx['transaction_id']) for tx in batch)
+                continue
+            for alert in result["ai_alerts"]:
+                key = str(alert.get("transaction_id")) if isinstance(alert, dict) else None
+                if key is None or key not in seen:
+                    seen.add(key)
+                    alerts.append(alert)
+        
+        merged = {
+            "ai_alerts": alerts,
+            "chunks": len(batches),
+            "failed_chunks": len(errors),
+            "unanalyzed_transactions": unanalyzed,
+        }
+        if errors:
+            merged["error"] = f"{len(errors)} of {len(batches)} chunks failed - {errors[0]}"
+        return merged
+    
+    def _analyze_transaction_chunk(self, transactions: List[Dict]) -> Dict:
+        """Analyze one chunk, retrying on call or parse failures"""
+        prompt = (
+            PromptBuilder("fraud")
+            .add("You are a fraud detection expert protecting elderly customers from financial scams.\n"
+                 "Analyze these transactions (one per line, '|' separated, header first) for fraud targeting seniors:")
+            .add_table(self._transaction_prompt_rows(transactions), TRANSACTION_PROMPT_COLUMNS, label="Transactions",
+                       summarize=self._summarize_omitted_transactions)
+            .add("Focus on these elderly-specific fraud indicators:\n"
+                 "1. Merchant category mismatches (e.g., Shell categorized as grocery)\n"
+                 "2. Unusually high amounts for common categories (pharmacy, gas station)\n"
+                 "3. ATM withdrawals over $1000 (often indicates coercion)\n"
+                 "4. Card-not-present transactions over $500 (phone/online scams)\n"
+                 "5. Multiple transactions at same merchant type in short time\n\n"
+                 "Respond with only a JSON array of alerts for suspicious transactions, each with keys: "
+                 "transaction_id, risk_level (LOW/MEDIUM/HIGH), elderly_concern, recommendation, confidence_score (0.0-1.0).")
+            .build()
+        )
+        
+        last_error = None
+        for attempt in range(AI_CHUNK_ATTEMPTS):
+            if attempt:
+                time.sleep(AI_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            try:
+                response = generate_content(self.model, prompt, agent="fraud", operation="analyze_transactions")
+                response_text = response.text
                 
-        except Exception as e:
-            return {"error": f"Gemini analysis failed: {str(e)}"}
+                # Clean up the response to extract JSON
+                start_idx = response_text.find('[')
+                end_idx = response_text.rfind(']') + 1
+                if start_idx == -1 or end_idx <= start_idx:
+                    raise ValueError("no JSON array in response")
+                alerts = json.loads(response_text[start_idx:end_idx])
+                if not isinstance(alerts, list):
+                    raise ValueError("response JSON is not an array")
+                return {"ai_alerts": alerts}
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Transaction chunk analysis attempt {attempt + 1}/{AI_CHUNK_ATTEMPTS} failed: {e}")
+        
+        return {"error": f"Gemini analysis failed: {last_error}"}
     
-    def rule_based_analysis(self, data) -> List[FraudAlert]:
+    @staticmethod
+    def _summarize_omitted_transactions(omitted: List[Dict]) -> str:
+        """One-line summary of transactions that did not fit the prompt budget"""
+        total = sum(float(tx.get('amount') or 0) for tx in omitted)
+        channels = sorted({str(tx.get('channel')) for tx in omitted if tx.get('channel')})
+        return f"total amount {total:.2f}, channels {', '.join(channels) or 'n/a'}"
+    
+    def _transaction_prompt_rows(self, transactions: List[Dict]) -> List[Dict]:
+        return [{
+            "id": tx['transaction_id'],
+            "amount": tx['amount'],
+            "merchant": tx['merchant_name'],
+            "category": tx['merchant_category'],
+            "channel": tx['channel'],
+            "fraud_score": tx.get('fraud_score', 0)
+        } for tx in transactions]
+    
+    def _token_bounded_batches(self, transactions: List[Dict], budget: int = None) -> List[List[Dict]]:
+        """Split transactions so each batch's table fits the fraud prompt budget"""
+        budget = (budget or get_token_budget("fraud")) - TRANSACTION_PROMPT_OVERHEAD_TOKENS
+        rows = self._transaction_prompt_rows(transactions)
+        batches, batch, used = [], [], 0
+        for tx, row in zip(transactions, rows):
+            tokens = count_tokens(encode_table([row], TRANSACTION_PROMPT_COLUMNS).split("\n", 1)[1]) + 1
+            if batch and used + tokens > budget:
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append(tx)
+            used += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def cascade_scores(self, data) -> np.ndarray:
         """
-        Rule-based analysis for transactions
-        Temporarily simplified for deployment compatibility
+        Combined rule/statistical risk score in [0, 1] per transaction.
+        Rule hits contribute their confidence weighted by risk level; amount
+        z-scores (against stored baselines when attached, otherwise the batch's
+        own category distribution) map the anomaly threshold to the middle of the scale.
         """
-        logger.warning("Rule-based analysis temporarily simplified for deployment")
-        return []
-        """Traditional rule-based fraud detection"""
+        return np.maximum(*self._cascade_components(data))
+    
+    def _cascade_components(self, data) -> Tuple[np.ndarray, np.ndarray]:
+        """(rule scores, amount anomaly scores) per transaction, each in [0, 1]"""
+        rule_scores = self.rule_engine.risk_scores(data, RULE_LEVEL_WEIGHTS)
+        zscores = self.baselines.zscores(data) if self.baselines is not None else batch_zscores(data)
+        threshold = self.fraud_patterns["amount_anomaly"]["threshold"]
+        stat_scores = np.clip(np.nan_to_num(zscores, nan=0.0) / (2 * threshold), 0.0, 1.0)
+        return rule_scores, stat_scores
+    
+    def _amount_anomaly_alerts(self, columns: Dict[str, np.ndarray], rows: np.ndarray, stat_scores: np.ndarray,
+                               risk_level: str) -> List[FraudAlert]:
+        """Alerts for rows flagged by their amount anomaly score rather than by a rule"""
         alerts = []
-        
-        for _, tx in df.iterrows():
-            # Check merchant category mismatches
-            if (tx['merchant_name'] == 'Shell' and tx['merchant_category'] == 'grocery' and tx['amount'] > 2000):
-                alerts.append(FraudAlert(
-                    transaction_id=tx['transaction_id'],
-                    risk_level="HIGH",
-                    reason=f"Shell gas station categorized as grocery with ${tx['amount']:.2f} charge",
-                    elderly_concern="This is a common fraud pattern - gas stations don't sell $2000 in groceries",
-                    recommendation="Contact bank immediately to verify this transaction",
-                    confidence_score=0.9
-                ))
-            
-            # Check for high pharmacy charges
-            if tx['merchant_category'] == 'pharmacy' and tx['amount'] > 1300:
-                alerts.append(FraudAlert(
-                    transaction_id=tx['transaction_id'],
-                    risk_level="HIGH",
-                    reason=f"Unusually high pharmacy charge: ${tx['amount']:.2f}",
-                    elderly_concern="Seniors are often targeted with fake medical billing scams",
-                    recommendation="Verify this charge with the pharmacy directly",
-                    confidence_score=0.85
-                ))
-            
-            # Check for large ATM withdrawals
-            if tx['channel'] == 'ATM' and tx['amount'] > 1000:
-                alerts.append(FraudAlert(
-                    transaction_id=tx['transaction_id'],
-                    risk_level="HIGH",
-                    reason=f"Large ATM withdrawal: ${tx['amount']:.2f}",
-                    elderly_concern="Large cash withdrawals often indicate elder financial abuse or coercion",
-                    recommendation="Contact customer immediately to verify they made this withdrawal",
-                    confidence_score=0.95
-                ))
-            
-            # Check for large CNP (Card Not Present) transactions
-            if tx['channel'] == 'CNP' and tx['amount'] > 700:
-                alerts.append(FraudAlert(
-                    transaction_id=tx['transaction_id'],
-                    risk_level="MEDIUM",
-                    reason=f"Large online/phone transaction: ${tx['amount']:.2f}",
-                    elderly_concern="Seniors are frequent targets of phone and online scams",
-                    recommendation="Verify this purchase was intentional and from a trusted source",
-                    confidence_score=0.75
-                ))
-            
-            # Check for restaurant charges at gas stations
-            if tx['merchant_name'] in ['Exxon', 'Shell'] and tx['merchant_category'] == 'restaurant':
-                alerts.append(FraudAlert(
-                    transaction_id=tx['transaction_id'],
-                    risk_level="MEDIUM",
-                    reason=f"Gas station {tx['merchant_name']} categorized as restaurant: ${tx['amount']:.2f}",
-                    elderly_concern="This category mismatch could indicate card skimming or data theft",
-                    recommendation="Check if customer actually made a purchase at this location",
-                    confidence_score=0.8
-                ))
-        
+        for row, tx in zip(rows.tolist(), records_from_columns(columns, rows.tolist())):
+            category = str(tx.get("merchant_category") or "this kind of").replace("_", " ")
+            alerts.append(FraudAlert(
+                transaction_id=str(tx["transaction_id"]),
+                risk_level=risk_level,
+                reason=f"Amount anomaly: ${tx['amount']:,.2f} is unusually high for {category} spending",
+                elderly_concern="A purchase much larger than usual can mean someone else is using the card or pressuring a payment",
+                recommendation="Confirm this purchase with the account holder before it settles",
+                confidence_score=round(float(stat_scores[row]), 3),
+            ))
+        return alerts
+    
+    def rule_based_analysis(self, data) -> List[FraudAlert]:
+        """Traditional rule-based fraud detection, evaluated column-wise over all transactions"""
+        return self.rule_engine.build_alerts(data, FraudAlert)
+    
+    def analyze_store(self, store, months: List[str] = None, accounts: List[str] = None) -> List[FraudAlert]:
+        """Re-run the rules over a TransactionStore, mapping only the partitions and columns they use"""
+        alerts = []
+        for segment in store.scan(self.rule_engine.required_columns(), months=months, accounts=accounts):
+            alerts.extend(self.rule_based_analysis(segment))
         return alerts
     
     def generate_family_alert(self, high_risk_alerts: List[FraudAlert]) -> str:
@@ -448,29 +489,80 @@ By staying alert and asking questions, you're protecting yourself effectively. T
         
         return "\n".join(alert_message)
     
-    def comprehensive_fraud_analysis(self, file_path: str) -> Dict:
-        """Run complete fraud analysis combining rule-based and AI detection"""
-        df = self.load_transaction_data(file_path)
-        
+    def comprehensive_fraud_analysis(self, file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                     cascade: bool = False,
+                                     uncertainty_band: Tuple[float, float] = CASCADE_UNCERTAINTY_BAND,
+                                     workers: int = 1) -> Dict:
+        """
+        Run complete fraud analysis combining rule-based and AI detection.
+        With cascade=True only transactions whose rule/statistical score falls in
+        uncertainty_band are sent to Gemini, in token-bounded batches. Rows the
+        amount statistics decide are suspicious get an "amount anomaly" alert;
+        uncertain rows Gemini cannot take (no model, or past AI_MAX_TRANSACTIONS)
+        get a MEDIUM one when their amount is what made them uncertain.
+        With workers > 1 rule evaluation is sharded by account across a process pool.
+        """
         print("🔍 Starting comprehensive fraud analysis...")
         
-        # Rule-based analysis
+        # Rule-based analysis, streamed chunk by chunk so memory stays flat
         print("📋 Running rule-based detection...")
-        rule_alerts = self.rule_based_analysis(df)
+        rule_alerts = []
+        ai_transactions = []
+        total_transactions = 0
+        chunk_count = 0
+        decided_safe = decided_suspicious = uncertain = stat_alerts = 0
+        low, high = uncertainty_band
+        sample = []
+        for chunk, chunk_alerts in self._rule_alert_chunks(file_path, chunk_size, workers):
+            chunk_count += 1
+            total_transactions += column_length(chunk)
+            rule_alerts.extend(chunk_alerts)
+            
+            # Gemini only ever sees a bounded number of transactions
+            room = AI_MAX_TRANSACTIONS - len(ai_transactions)
+            if cascade:
+                if not sample:
+                    sample = records_from_columns(chunk, range(min(50, column_length(chunk))))
+                rule_scores, stat_scores = self._cascade_components(chunk)
+                scores = np.maximum(rule_scores, stat_scores)
+                ambiguous = np.flatnonzero((scores >= low) & (scores < high))
+                decided_safe += int(np.count_nonzero(scores < low))
+                decided_suspicious += int(np.count_nonzero(scores >= high))
+                uncertain += int(ambiguous.size)
+                # Rule-decided rows already have their rule alerts; statistics-decided ones need their own
+                anomalies = self._amount_anomaly_alerts(
+                    chunk, np.flatnonzero((stat_scores >= high) & (rule_scores < high)), stat_scores,
+                    self.fraud_patterns["amount_anomaly"]["risk_level"])
+                sent = ambiguous[:room] if self.model and room > 0 else ambiguous[:0]
+                ai_transactions.extend(records_from_columns(chunk, sent.tolist()))
+                unsent = ambiguous[len(sent):]
+                anomalies += self._amount_anomaly_alerts(chunk, unsent[stat_scores[unsent] >= low], stat_scores, "MEDIUM")
+                rule_alerts.extend(anomalies)
+                stat_alerts += len(anomalies)
+            elif self.model and room > 0:
+                ai_transactions.extend(records_from_columns(chunk, range(min(room, column_length(chunk)))))
         
         # AI-powered analysis
         ai_results = {}
-        if self.model:
+        cascade_report = None
+        if cascade:
+            if self.model and ai_transactions:
+                print(f"🤖 Running Gemini AI analysis on {len(ai_transactions)} ambiguous transactions...")
+                ai_results = self.analyze_with_gemini(ai_transactions)
+            cascade_report = self._cascade_report(total_transactions, decided_safe, decided_suspicious, uncertain,
+                                                  len(ai_transactions), ai_results.get("chunks", 0),
+                                                  uncertainty_band, sample, stat_alerts)
+        elif self.model and ai_transactions:
             print("🤖 Running Gemini AI analysis...")
-            transactions_list = df.to_dict('records')
-            ai_results = self.analyze_with_gemini(transactions_list)
+            ai_results = self.analyze_with_gemini(ai_transactions)
         
         # Combine results
         high_risk_alerts = [alert for alert in rule_alerts if alert.risk_level == "HIGH"]
         
         results = {
             "analysis_timestamp": datetime.now().isoformat(),
-            "total_transactions_analyzed": len(df),
+            "total_transactions_analyzed": total_transactions,
+            "chunks_processed": chunk_count,
             "rule_based_alerts": [
                 {
                     "transaction_id": alert.transaction_id,
@@ -485,12 +577,52 @@ By staying alert and asking questions, you're protecting yourself effectively. T
             "high_risk_count": len(high_risk_alerts),
             "family_alert": self.generate_family_alert(high_risk_alerts)
         }
+        if cascade_report is not None:
+            results["cascade"] = cascade_report
         
         # Generate elderly-friendly summary
         results["elderly_summary"] = self.generate_elderly_summary(rule_alerts)
         
         return results
     
+    def _rule_alert_chunks(self, file_path: str, chunk_size: int, workers: int):
+        """Yield (chunk, rule alerts) per chunk, serially or from the sharded process pool"""
+        chunks = iter_transaction_chunks(file_path, chunk_size)
+        if workers <= 1:
+            for chunk in chunks:
+                yield chunk, self.rule_based_analysis(chunk)
+            return
+        
+        with ShardedRuleAnalyzer(workers, self.rule_engine.rules) as analyzer:
+            for chunk, alert_fields in analyzer.analyze_chunks(chunks):
+                yield chunk, [FraudAlert(**fields) for fields in alert_fields]
+    
+    def _cascade_report(self, total: int, decided_safe: int, decided_suspicious: int, uncertain: int,
+                        sent: int, batch_count: int, uncertainty_band: Tuple[float, float],
+                        sample: List[Dict], stat_alerts: int = 0) -> Dict:
+        """How the cascade split the work, and the estimated tokens/latency it saved"""
+        # Savings are measured against giving every transaction an LLM review, sized from a sample of rows
+        rows = self._transaction_prompt_rows(sample)
+        tokens_per_tx = (count_tokens(encode_table(rows, TRANSACTION_PROMPT_COLUMNS)) / len(rows)) if rows else 0.0
+        rows_per_batch = int((get_token_budget("fraud") - TRANSACTION_PROMPT_OVERHEAD_TOKENS) / tokens_per_tx) if tokens_per_tx else 1
+        full_batches = -(-total // max(1, rows_per_batch))
+        calls_saved = max(0, full_batches - batch_count)
+        
+        return {
+            "uncertainty_band": list(uncertainty_band),
+            "rule_decided_safe": decided_safe,
+            "rule_decided_suspicious": decided_suspicious,
+            "uncertain": uncertain,
+            "uncertain_not_sent": max(0, uncertain - sent),
+            "amount_anomaly_alerts": stat_alerts,
+            "llm_decided": sent,
+            "llm_batches": batch_count,
+            "llm_share": round(sent / total, 4) if total else 0.0,
+            "estimated_prompt_tokens_saved": round(max(0, total - sent) * tokens_per_tx),
+            "estimated_llm_calls_saved": calls_saved,
+            "estimated_latency_saved_ms": round(calls_saved * usage_tracker.average_latency_ms("fraud", "analyze_transactions"), 1),
+        }
+    
     def generate_elderly_summary(self, alerts: List[FraudAlert]) -> str:
         """Generate clear, simple summary for elderly users"""
         high_risk = [a for a in alerts if a.risk_level == "HIGH"]
@@ -3,6 +3,9 @@ import google.generativeai as genai
 import os
 import re
 from typing import Dict, List
+from agents.policy_catalog import get_policy_catalog, format_inr
+from agents.prompt_builder import get_token_budget, truncate_to_tokens
+from agents.llm_gateway import send_message
 
 # --- Healthcare Tools ---
 
@@ -38,25 +41,32 @@ def calculate_tax_deduction(premium_amount: int, is_senior_citizen: bool = False
 
 def get_policy_recommendations(age: int, coverage_amount: int) -> dict:
     """Provides policy recommendations based on age and coverage needs."""
-    if coverage_amount <= 500000:  # Up to 5 lakh
-        recommended = "Arogya Sanjeevani Policy"
-        features = ["Standardized benefits", "Basic hospitalization coverage", "Affordable premiums"]
-    elif coverage_amount <= 5000000:  # Up to 50 lakh
-        recommended = "Star Comprehensive Insurance"
-        features = ["No room rent cap", "Health check-ups included", "Personal accident cover"]
-    else:  # Above 50 lakh
-        recommended = "HDFC ERGO Optima Restore"
-        features = ["Sum insured restoration", "Multiplier benefits", "Premium coverage"]
+    catalog = get_policy_catalog()
+    policy = catalog.recommend(age, coverage_amount)
+    if policy is None:
+        return {"error": f"No policy in the catalog covers ₹{coverage_amount:,.0f} at entry age {age}."}
     
-    waiting_period = "48 months" if coverage_amount <= 500000 else "36 months"
+    alternatives = [p.policy_name for p in catalog.search(coverage_amount=coverage_amount, age=age) if p is not policy][:2]
     
     return {
-        "recommended_policy": recommended,
-        "key_features": features,
-        "waiting_period": waiting_period,
-        "coverage_range": f"₹{coverage_amount:,.0f}"
+        "recommended_policy": policy.policy_name,
+        "key_features": policy.key_features,
+        "waiting_period": f"{policy.waiting_months} months",
+        "coverage_range": f"₹{coverage_amount:,.0f}",
+        "alternatives": alternatives
     }
 
+def lookup_policy_details(policy_name: str) -> dict:
+    """Looks up the details for a specific health insurance policy by name."""
+    policy = get_policy_catalog().get(policy_name)
+    if policy is None:
+        return {"error": f"Policy '{policy_name}' not found in the catalog."}
+    return policy.details()
+
+def compare_policies(policy_names: List[str]) -> dict:
+    """Compares two or more health insurance policies side by side."""
+    return get_policy_catalog().compare(policy_names)
+
 # --- Healthcare Finance Agent Class ---
 
 class HealthcareFinanceAgent:
@@ -75,6 +85,7 @@ class HealthcareFinanceAgent:
             "When users ask about premium calculations, always use the calculate_estimated_premium tool. "
             "For tax questions, use calculate_tax_deduction tool. "
             "For policy recommendations, use get_policy_recommendations tool. "
+            "For details about a named policy, use lookup_policy_details tool, and to compare policies use compare_policies tool. "
             "Always provide clear, actionable advice suitable for seniors. "
             "Use tools whenever possible instead of making up numbers."
         )
@@ -84,7 +95,8 @@ class HealthcareFinanceAgent:
             self.model = genai.GenerativeModel(
                 model_name='gemini-2.0-flash-exp',
                 system_instruction=self.system_instruction,
-                tools=[calculate_estimated_premium, calculate_tax_deduction, get_policy_recommendations]
+                tools=[calculate_estimated_premium, calculate_tax_deduction, get_policy_recommendations,
+                       lookup_policy_details, compare_policies]
             )
             self.chat = self.model.start_chat(enable_automatic_function_calling=True)
         except Exception as e:
@@ -102,12 +114,22 @@ class HealthcareFinanceAgent:
         
         text_lower = text.lower()
         
+        wants_calculation = (any(keyword in text_lower for keyword in ["calculate", "premium", "cost", "price"])
+                             and any(keyword in text_lower for keyword in ["insurance", "coverage", "policy"]))
+        wants_recommendation = any(keyword in text_lower for keyword in ["recommend", "suggest", "which policy", "best policy", "should i"])
+        
+        # Named policies can be answered straight from the catalog, unless a premium calculation
+        # or a recommendation was asked for (handled below and by Gemini's tools)
+        mentioned_policies = get_policy_catalog().find_mentions(text)
+        if mentioned_policies and not wants_calculation and not wants_recommendation:
+            return self._policy_catalog_response(mentioned_policies)
+        
         # Check if this is a premium calculation request
-        if any(keyword in text_lower for keyword in ["calculate", "premium", "cost", "price"]) and any(keyword in text_lower for keyword in ["insurance", "coverage", "policy"]):
+        if wants_calculation:
             # Extract age and coverage for direct calculation
             try:
                 import re
-                age_match = re.search(r'(\d+)\s*year', text_lower)
+                age_match = re.search(r'(\d+)\s*year', text_lower) or re.search(r'\bage\s*(?:of\s*|is\s*)?(\d+)', text_lower)
                 coverage_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:lakh|crore)', text_lower)
                 
                 age = int(age_match.group(1)) if age_match else 40
@@ -129,6 +151,10 @@ class HealthcareFinanceAgent:
                 
                 # Calculate premium directly using our tool
                 premium_data = calculate_estimated_premium(age, coverage_amount, "tier2")
+                top_policies = "\n".join(
+                    f"• **{policy.insurer}**: {policy.policy_name}"
+                    for policy in get_policy_catalog().search(coverage_amount=coverage_amount, age=age)[:4]
+                ) or "• Compare plans from insurers with a 95%+ claim settlement ratio"
                 
                 response = f"""💳 **HEALTH INSURANCE PREMIUM CALCULATION** 💳
 
@@ -184,11 +210,8 @@ class HealthcareFinanceAgent:
 3. **Health Declaration**: Be completely honest about medical history
 4. **Start Soon**: Premiums increase significantly with age
 
-**🏆 Top Insurers for ₹1 Crore Coverage:**
-• **HDFC ERGO**: Optima Restore plan
-• **Star Health**: Comprehensive plan
-• **Care Health**: Supreme plan
-• **ICICI Lombard**: Complete Health plan
+**🏆 Top Insurers for {format_inr(coverage_amount)} Coverage:**
+{top_policies}
 
 Would you like me to explain any specific aspect of this premium calculation or help you compare different coverage options?"""
 
@@ -208,7 +231,8 @@ Would you like me to explain any specific aspect of this premium calculation or
         
         # Try AI with tools for other healthcare questions
         try:
-            response = self.chat.send_message(text)
+            prompt = truncate_to_tokens(text, get_token_budget("healthcare"))
+            response = send_message(self.chat, prompt, agent="healthcare", operation="chat")
             ai_response = response.text
             
             # Determine risk level based on content
@@ -238,6 +262,49 @@ Would you like me to explain any specific aspect of this premium calculation or
                 "confidence_score": 0.5
             }
     
+    def _policy_catalog_response(self, policies: List) -> Dict:
+        """Answer questions about named policies directly from the policy catalog"""
+        if len(policies) >= 2:
+            comparison = get_policy_catalog().compare([policy.policy_name for policy in policies])
+            lines = ["⚖️ **POLICY COMPARISON** ⚖️", ""]
+            for row in comparison["policies"]:
+                lines.extend([
+                    f"**{row['policy_name']}** ({row['insurer']})",
+                    f"• **Coverage**: {row['coverage_range']}",
+                    f"• **Pre-existing Disease Waiting Period**: {row['waiting_period']}",
+                    f"• **Entry Age**: {row['entry_age']} years",
+                    ""
+                ])
+            lines.extend([
+                f"**⏱️ Shortest Waiting Period:** {comparison['shortest_waiting_period']}",
+                f"**💰 Highest Coverage Available:** {comparison['highest_cover']}",
+                "",
+                "Always read the policy wording and check the network hospitals near you before buying."
+            ])
+            actions = ["COMPARE_POLICIES"]
+        else:
+            details = policies[0].details()
+            lines = [
+                f"📄 **{details['policy_name'].upper()}** 📄",
+                "",
+                f"• **Insurer**: {details['insurer']}",
+                f"• **Coverage**: {details['coverage_range']}",
+                f"• **Pre-existing Disease Waiting Period**: {details['pre_existing_disease_waiting_period']}",
+                f"• **Entry Age**: {details['entry_age']}",
+                "",
+                "**✅ Key Features:**"
+            ]
+            lines.extend(f"• {feature}" for feature in details["key_features"])
+            lines.extend(["", "Would you like me to compare this policy with others or estimate your premium?"])
+            actions = ["REVIEW_POLICY"]
+        
+        return {
+            "risk_level": "LOW",
+            "response": "\n".join(lines),
+            "actions": actions,
+            "confidence_score": 0.95
+        }
+    
     def _generate_fallback_response(self, text: str) -> str:
         """Generate fallback response when AI tools fail"""
         text_lower = text.lower()
@@ -0,0 +1,277 @@
+# indicator_reputation.py - Reputation index for scam phone numbers, URLs, UPI IDs and handles
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from agents.text_rules import get_text_rules
+
+logger = logging.getLogger(__name__)
+
+# Distinct request sources that must report an indicator before it is treated as known-bad;
+# at least 2, so no single source can make an indicator known-bad on its own
+MIN_REPORTS = max(2, int(os.getenv("INDICATOR_MIN_REPORTS", "2")))
+# Reports older than this stop counting
+REPORT_TTL_DAYS = float(os.getenv("INDICATOR_REPORT_TTL_DAYS", "90"))
+# Reporters remembered per indicator (enough to count towards MIN_REPORTS); the oldest are dropped first
+MAX_REPORTERS_TRACKED = 32
+# Reporter key for incidents without a recorded source (logged before sources were kept); they count as one
+UNVERIFIED_SOURCE = "unverified"
+
+# Official contacts that legitimately appear in scam reports ("the IRS says to call ...")
+ALLOWLIST = {
+    "phone:8773824357",   # FTC 1-877-FTC-HELP
+    "phone:8006334227",   # 1-800-MEDICARE
+    "phone:8007721213",   # Social Security Administration
+}
+ALLOWLISTED_DOMAIN_SUFFIXES = (".gov", ".gov.in", ".nic.in")
+# Well-known brands that scams name-drop ("your amazon.com order", "@PayPal support"); subdomains included.
+# Look-alikes such as amazon-refunds.xyz are different hosts and are still tracked.
+ALLOWLISTED_DOMAINS = {
+    "amazon.com", "amazon.in", "apple.com", "icloud.com", "microsoft.com", "outlook.com", "live.com",
+    "google.com", "gmail.com", "youtube.com", "facebook.com", "instagram.com", "whatsapp.com", "yahoo.com",
+    "paypal.com", "ebay.com", "walmart.com", "bestbuy.com", "netflix.com", "fedex.com", "ups.com", "usps.com",
+    "chase.com", "bankofamerica.com", "wellsfargo.com", "citi.com", "capitalone.com", "aarp.org",
+    "medicare.gov", "ssa.gov", "irs.gov", "ftc.gov", "flipkart.com", "paytm.com", "phonepe.com", "onlinesbi.sbi",
+}
+ALLOWLISTED_HANDLES = {
+    "@amazon", "@amazonhelp", "@apple", "@applesupport", "@microsoft", "@microsofthelps", "@google",
+    "@paypal", "@askpaypal", "@netflix", "@whatsapp", "@facebook", "@instagram", "@fedex", "@ups", "@usps",
+    "@aarp", "@medicaregov", "@socialsecurity", "@irsnews", "@ftc",
+}
+# Matches of these rules alone do not make an incident a confirmed scam worth learning indicators from
+NON_SCAM_RULES = {"known_bad_indicator"}
+
+INDICATOR_LABELS = {
+    "phone": "phone number",
+    "url": "website",
+    "email": "email address",
+    "upi": "UPI payment ID",
+    "handle": "messaging handle",
+}
+
+_TLDS = "com|net|org|info|biz|xyz|top|online|site|io|co|in|us|uk|gov|me|app|link|live|shop|club|ly|cc|tk"
+
+# One alternation, scanned once per message; earlier alternatives win at the same position
+INDICATOR_PATTERN = re.compile(
+    r"(?P<email>\b[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)+\b)"
+    r"|(?P<upi>\b[a-z0-9._-]{2,}@[a-z]{2,}\b)"
+    r"|(?P<url>\b(?:https?://)?(?:www\.)?(?P<host>[a-z0-9-]+(?:\.[a-z0-9-]+)*\.(?:" + _TLDS + r")))\b(?:/\S*)?"
+    r"|(?P<phone>(?<![\w+])\+?\d[\d\s().-]{8,}\d(?!\w))"
+    r"|(?P<handle>(?<![\w@.])@[a-z0-9_]{4,32}\b)"
+)
+
+
+def extract_indicators(text: str) -> List[Tuple[str, str]]:
+    """Distinct (kind, canonical value) indicators in a message, in order of appearance."""
+    found = []
+    for match in INDICATOR_PATTERN.finditer(text.lower()):
+        if match.group("email"):
+            kind, value = "email", match.group("email")
+        elif match.group("upi"):
+            kind, value = "upi", match.group("upi")
+        elif match.group("url"):
+            kind, value = "url", match.group("host")
+        elif match.group("phone"):
+            digits = re.sub(r"\D", "", match.group("phone"))
+            if not 10 <= len(digits) <= 15:
+                continue
+            kind, value = "phone", digits[-10:]
+        else:
+            kind, value = "handle", match.group("handle")
+        indicator = (kind, value)
+        if indicator not in found:
+            found.append(indicator)
+    return found
+
+
+def is_allowlisted(kind: str, value: str) -> bool:
+    if f"{kind}:{value}" in ALLOWLIST:
+        return True
+    if kind == "handle":
+        return value in ALLOWLISTED_HANDLES
+    if kind not in ("url", "email"):
+        return False
+    domain = value.split("@")[-1]
+    if domain.endswith(ALLOWLISTED_DOMAIN_SUFFIXES):
+        return True
+    labels = domain.split(".")
+    return any(".".join(labels[i:]) in ALLOWLISTED_DOMAINS for i in range(len(labels) - 1))
+
+
+def source_key(source: Optional[str]) -> str:
+    """
+    Reporter key for a request source observed by the server (the client
+    address). Hashed so incidents never store raw addresses.
+    """
+    if not source:
+        return UNVERIFIED_SOURCE
+    return hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def scam_rules(rules_fired: List[str]) -> List[str]:
+    """The fired text rules that are evidence of a scam in the message itself."""
+    return [rule for rule in rules_fired if rule not in NON_SCAM_RULES]
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter (double hashing over one blake2b digest)."""
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class IndicatorReputationIndex:
+    """
+    In-memory reputation of indicators seen in MEDIUM/HIGH risk incidents
+    where a scam text rule fired; a message flagged only because it repeats
+    a known-bad indicator is not recorded, so the index cannot feed itself.
+    Reporters are request sources seen by the server (never the client's
+    user_id, which anyone can make up), and a report stops counting after
+    REPORT_TTL_DAYS.
+    A Bloom filter answers "never reported" without touching the map; the map
+    holds report counts per indicator. Built from incident history at start-up
+    and updated incrementally as incidents are logged.
+    """
+
+    def __init__(self, min_reports: int = MIN_REPORTS, capacity: int = 100_000,
+                 report_ttl_days: float = REPORT_TTL_DAYS):
+        self.min_reports = max(2, min_reports)
+        self.report_ttl = report_ttl_days * 86400
+        self._entries: Dict[str, Dict] = {}
+        self._bloom = BloomFilter(capacity)
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.bloom_negatives = 0
+
+    @staticmethod
+    def _key(kind: str, value: str) -> str:
+        return f"{kind}:{value}"
+
+    def record(self, text: str, risk_level: str, rules_fired: List[str], source: str = UNVERIFIED_SOURCE,
+               incident_id: int = None, reported_at: float = None) -> int:
+        """
+        Add the indicators of a risky incident reported from `source` (a
+        source_key()); returns how many were recorded.
+        """
+        if risk_level not in ("MEDIUM", "HIGH") or not scam_rules(rules_fired):
+            return 0
+        recorded = 0
+        now = reported_at or time.time()
+        with self._lock:
+            for kind, value in extract_indicators(text):
+                if is_allowlisted(kind, value):
+                    continue
+                key = self._key(kind, value)
+                entry = self._entries.get(key)
+                if entry is None:
+                    if self._bloom.count >= self._bloom.capacity:
+                        self._grow()
+                    entry = self._entries[key] = {
+                        "kind": kind, "value": value, "reporters": {}, "incidents": 0,
+                        "high_risk_incidents": 0, "first_seen": now, "last_seen": now, "last_incident_id": None,
+                    }
+                    self._bloom.add(key)
+                reporters = entry["reporters"]
+                reporters[source] = max(now, reporters.get(source, now))
+                if len(reporters) > MAX_REPORTERS_TRACKED:
+                    del reporters[min(reporters, key=reporters.get)]
+                entry["incidents"] += 1
+                entry["high_risk_incidents"] += risk_level == "HIGH"
+                entry["last_seen"] = max(now, entry["last_seen"])
+                entry["last_incident_id"] = incident_id
+                recorded += 1
+        return recorded
+
+    def _active_reporters(self, entry: Dict, now: float) -> int:
+        """Distinct sources that reported the indicator within the TTL."""
+        cutoff = now - self.report_ttl
+        return sum(1 for reported_at in list(entry["reporters"].values()) if reported_at >= cutoff)
+
+    def _grow(self):
+        bloom = BloomFilter(self._bloom.capacity * 2)
+        for key in self._entries:
+            bloom.add(key)
+        self._bloom = bloom
+
+    def lookup(self, kind: str, value: str) -> Optional[Dict]:
+        """Reputation of one indicator if it is known-bad, else None."""
+        key = self._key(kind, value)
+        self.checks += 1
+        if key not in self._bloom:
+            self.bloom_negatives += 1
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        reports = self._active_reporters(entry, time.time())
+        if reports < self.min_reports:
+            return None
+        return {
+            "kind": kind,
+            "value": value,
+            "reports": reports,
+            "incidents": entry["incidents"],
+            "high_risk_incidents": entry["high_risk_incidents"],
+        }
+
+    def check(self, text: str) -> List[Dict]:
+        """Known-bad indicators contained in a message."""
+        hits = []
+        for kind, value in extract_indicators(text):
+            reputation = self.lookup(kind, value)
+            if reputation:
+                hits.append(reputation)
+        return hits
+
+    def load_from_incidents(self, db) -> int:
+        """Rebuild from the incidents table; returns the number of incidents read."""
+        count = 0
+        rules = get_text_rules()
+        cutoff = time.time() - self.report_ttl
+        for incident_id, source, text, risk_level, created_at in db.iter_incident_reports(["MEDIUM", "HIGH"]):
+            count += 1
+            if created_at is not None and created_at < cutoff:
+                continue
+            # Incidents don't store the rules that fired, so they are re-evaluated
+            self.record(text, risk_level, rules.analyze(text)["rules"], source=source or UNVERIFIED_SOURCE,
+                        incident_id=incident_id, reported_at=created_at)
+        return count
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            known_bad = sum(1 for e in self._entries.values() if self._active_reporters(e, now) >= self.min_reports)
+            by_kind: Dict[str, int] = {}
+            for entry in self._entries.values():
+                by_kind[entry["kind"]] = by_kind.get(entry["kind"], 0) + 1
+        return {
+            "indicators": len(self._entries),
+            "known_bad": known_bad,
+            "by_kind": by_kind,
+            "min_reports": self.min_reports,
+            "report_ttl_days": self.report_ttl / 86400,
+            "checks": self.checks,
+            "bloom_negatives": self.bloom_negatives,
+        }
@@ -0,0 +1,191 @@
+# lexical_index.py - In-memory BM25 inverted index and lexical/vector score fusion
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agents.embeddings import STOPWORDS, _WORD
+from agents.text_normalizer import normalize_text
+
+# "hybrid" (lexical first, vectors when lexical is not confident), "vector" or "lexical"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+# Normalized BM25 score at which the lexical stage answers on its own, without embedding the query
+LEXICAL_CONFIDENCE = float(os.getenv("LEXICAL_CONFIDENCE", "0.6"))
+# Weight of the cosine similarity when fusing it with the normalized BM25 score
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "0.5"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Words (minus stopwords) and word bigrams of the normalized text; bigrams reward exact phrases."""
+    words = [w for w in _WORD.findall(normalize_text(text)) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts. Postings are NumPy arrays of
+    (row, weight) per term with idf and length normalization folded into the
+    weight at build time, so a query is a single bincount over the postings
+    of its terms. The index is immutable; callers build a new one when the
+    corpus changes and swap it in.
+
+    Raw BM25 scores are unbounded, so search() also reports them normalized
+    to [0, 1] in one of two ways:
+      "document" - share of the matched text's own BM25 weight found in the
+                   query (a short scam script quoted inside a long message)
+      "query"    - share of the query's best attainable score (a short
+                   question against long document chunks)
+    """
+
+    def __init__(self, texts: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.size = len(texts)
+        frequencies: List[Dict[str, int]] = []
+        document_frequency: Dict[str, int] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: Dict[str, int] = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            frequencies.append(counts)
+            lengths[row] = sum(counts.values())
+            for term in counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        average_length = float(lengths.mean()) if self.size and lengths.any() else 1.0
+        norms = k1 * (1 - b + b * lengths / average_length)
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        self.self_scores = np.zeros(self.size, dtype=np.float32)
+        for row, counts in enumerate(frequencies):
+            for term, tf in counts.items():
+                df = document_frequency[term]
+                idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+                weight = idf * tf * (k1 + 1) / (tf + norms[row])
+                rows, weights = postings.setdefault(term, ([], []))
+                rows.append(row)
+                weights.append(weight)
+                self.self_scores[row] += weight
+
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            term: (np.asarray(rows, dtype=np.int32), np.asarray(weights, dtype=np.float32))
+            for term, (rows, weights) in postings.items()
+        }
+        self.max_weights = {term: float(weights.max()) for term, (_, weights) in self.postings.items()}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def scores(self, query: str) -> Tuple[np.ndarray, float]:
+        """BM25 score of every row for the query, and the query's best attainable score."""
+        rows, weights = [], []
+        bound = 0.0
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                rows.append(posting[0])
+                weights.append(posting[1])
+                bound += self.max_weights[term]
+        if not rows:
+            return np.zeros(self.size, dtype=np.float32), 0.0
+        # One bincount over the matched postings beats a scatter-add per term
+        scores = np.bincount(np.concatenate(rows), weights=np.concatenate(weights), minlength=self.size)
+        return scores.astype(np.float32), bound
+
+    def search(self, query: str, k: int = 3, normalize: str = "document",
+               mask: np.ndarray = None) -> List[Tuple[int, float]]:
+        """(row, normalized score) of the k best rows with any term in common, best first."""
+        if not self.size:
+            return []
+        scores, bound = self.scores(query)
+        if not bound:
+            return []
+        if normalize == "document":
+            scores = np.divide(scores, self.self_scores, out=np.zeros_like(scores), where=self.self_scores > 0)
+        else:
+            scores /= bound
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        return [(row, score) for row, score in top_k(scores, k) if score > 0]
+
+
+def top_k(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """(row, score) of the k best finite scores, best first."""
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return []
+    rows = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    rows = rows[np.argsort(-scores[rows])][:k]
+    return [(int(row), float(scores[row])) for row in rows]
+
+
+def fuse(lexical: List[Tuple[int, float]], vector_scores: Optional[np.ndarray], k: int,
+         vector_weight: float = HYBRID_VECTOR_WEIGHT) -> List[Dict]:
+    """
+    Combine lexical hits with cosine scores over the same rows:
+    score = w * cosine + (1 - w) * lexical. Candidates are the union of the
+    lexical hits and the vector top-k. Without vector scores (the lexical
+    stage was confident) the lexical score stands alone. Returns
+    {"row", "score", "lexical", "vector"} dicts, best first.
+    """
+    lexical_scores = dict(lexical)
+    if vector_scores is None:
+        return [{"row": row, "score": score, "lexical": score, "vector": None} for row, score in lexical[:k]]
+    candidates = set(lexical_scores)
+    candidates.update(row for row, _ in top_k(vector_scores, k))
+    fused = []
+    for row in candidates:
+        cosine = float(vector_scores[row])
+        if not np.isfinite(cosine):
+            continue
+        lexical_score = lexical_scores.get(row, 0.0)
+        fused.append({"row": row, "score": vector_weight * cosine + (1 - vector_weight) * lexical_score,
+                      "lexical": lexical_score, "vector": cosine})
+    fused.sort(key=lambda hit: -hit["score"])
+    return fused[:k]
+
+
+def benchmark(sizes: List[int] = None, queries: int = 2000) -> List[Dict]:
+    """Lexical-only search latency versus embedding plus vector search, as the corpus grows."""
+    from agents.embeddings import get_embedder
+    from agents.scam_pattern_index import load_seed_patterns
+
+    embedder = get_embedder().embedder  # the raw model: every vector-path query pays an embedding
+    seeds = [p["text"] for p in load_seed_patterns()]
+    messages = ["Someone from the IRS called saying I owe taxes and will be arrested unless I pay today",
+                "He said my grandson is in jail and needs bail money, send $2000 via Western Union immediately",
+                "Microsoft says my computer has a virus and wants remote access",
+                "can you help me understand my medicare coverage"]
+    rng = np.random.default_rng(0)
+    vocabulary = sorted({w for text in seeds for w in _WORD.findall(text.lower())})
+    results = []
+    for size in sizes or [8, 1_000, 10_000]:
+        texts = seeds + [" ".join(rng.choice(vocabulary, 14)) for _ in range(size - len(seeds))]
+        start = time.perf_counter()
+        index = BM25Index(texts)
+        build_ms = (time.perf_counter() - start) * 1000
+        matrix = embedder.embed(texts)
+
+        start = time.perf_counter()
+        confident = 0
+        for i in range(queries):
+            hits = index.search(messages[i % len(messages)], 3)
+            confident += bool(hits) and hits[0][1] >= LEXICAL_CONFIDENCE
+        lexical_us = (time.perf_counter() - start) / queries * 1e6
+
+        start = time.perf_counter()
+        for i in range(queries):
+            top_k(matrix @ embedder.embed([messages[i % len(messages)]])[0], 3)
+        vector_us = (time.perf_counter() - start) / queries * 1e6
+        results.append({"texts": size, "build_ms": round(build_ms, 1), "lexical_us": round(lexical_us, 1),
+                        "embed_and_vector_us": round(vector_us, 1),
+                        "lexical_confident_rate": round(confident / queries, 2)})
+    return results
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print(row)
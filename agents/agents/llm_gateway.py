@@ -0,0 +1,153 @@
+# llm_gateway.py - Shared Gemini call path with per-agent token accounting
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Tuple, Union
+
+from agents.prompt_builder import Prompt, count_tokens
+from agents.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUsageTracker:
+    """Aggregates prompt/response token counts and latency per agent."""
+
+    def __init__(self, recent_calls: int = 100):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._recent = deque(maxlen=recent_calls)
+
+    def record(self, agent: str, operation: str, prompt_tokens: int, response_tokens: int,
+               latency_ms: float, estimated: bool, truncated: bool = False, error: bool = False):
+        call = {
+            "agent": agent,
+            "operation": operation,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "latency_ms": round(latency_ms, 1),
+            "estimated": estimated,
+            "truncated": truncated,
+            "error": error,
+        }
+        with self._lock:
+            totals = self._totals.setdefault(agent, {
+                "calls": 0, "errors": 0, "truncated_prompts": 0,
+                "prompt_tokens": 0, "response_tokens": 0, "latency_ms": 0.0,
+            })
+            totals["calls"] += 1
+            totals["errors"] += int(error)
+            totals["truncated_prompts"] += int(truncated)
+            totals["prompt_tokens"] += prompt_tokens
+            totals["response_tokens"] += response_tokens
+            totals["latency_ms"] += latency_ms
+            self._recent.append(call)
+
+        logger.info(f"LLM call [{agent}/{operation}] prompt_tokens={prompt_tokens} "
+                    f"response_tokens={response_tokens} latency_ms={latency_ms:.0f}"
+                    f"{' (estimated)' if estimated else ''}{' ERROR' if error else ''}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-agent totals and averages plus the most recent calls."""
+        with self._lock:
+            agents = {}
+            for agent, totals in self._totals.items():
+                calls = totals["calls"] or 1
+                agents[agent] = {
+                    **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in totals.items()},
+                    "avg_prompt_tokens": round(totals["prompt_tokens"] / calls, 1),
+                    "avg_response_tokens": round(totals["response_tokens"] / calls, 1),
+                    "avg_latency_ms": round(totals["latency_ms"] / calls, 1),
+                }
+            return {"agents": agents, "recent_calls": list(self._recent)}
+
+    def average_latency_ms(self, agent: str, operation: str) -> float:
+        """Mean latency of recent successful calls for one agent operation (0.0 if none)."""
+        with self._lock:
+            latencies = [c["latency_ms"] for c in self._recent
+                         if c["agent"] == agent and c["operation"] == operation and not c["error"]]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+
+usage_tracker = TokenUsageTracker()
+
+# Identical prompts in flight at the same time (e.g. a viral scam script) share one Gemini call
+single_flight = SingleFlight(timeout=float(os.getenv("LLM_COALESCE_TIMEOUT", "30")))
+
+# Deadline for each Gemini request, so a hung call cannot hold its coalescing key and concurrency slot
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", str(single_flight.timeout)))
+
+# Process-wide cap on concurrent Gemini calls, shared by every agent and fan-out
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+concurrency_limit = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+def _prompt_text(prompt: Union[Prompt, str]) -> Tuple[str, bool]:
+    if isinstance(prompt, Prompt):
+        return prompt.text, prompt.truncated
+    return prompt, False
+
+
+def _response_usage(response: Any, prompt_text: str) -> Tuple[int, int, bool]:
+    """Token counts reported by Gemini, falling back to local estimates."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    response_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if prompt_tokens is not None and response_tokens is not None:
+        return int(prompt_tokens), int(response_tokens), False
+
+    try:
+        response_text = response.text
+    except Exception:
+        response_text = ""
+    return count_tokens(prompt_text), count_tokens(response_text), True
+
+
+def _call(agent: str, operation: str, prompt: Union[Prompt, str], target: Any, send, coalesce: bool) -> Any:
+    text, truncated = _prompt_text(prompt)
+
+    def execute():
+        with concurrency_limit:
+            return send_and_record()
+
+    def send_and_record():
+        start = time.perf_counter()
+        try:
+            response = send(text, request_options={"timeout": LLM_REQUEST_TIMEOUT})
+        except Exception:
+            usage_tracker.record(agent, operation, count_tokens(text), 0,
+                                 (time.perf_counter() - start) * 1000, estimated=True,
+                                 truncated=truncated, error=True)
+            raise
+
+        prompt_tokens, response_tokens, estimated = _response_usage(response, text)
+        usage_tracker.record(agent, operation, prompt_tokens, response_tokens,
+                             (time.perf_counter() - start) * 1000, estimated, truncated)
+        return response
+
+    if not coalesce:
+        return execute()
+
+    key = SingleFlight.make_key(agent, operation, id(target), getattr(target, "model_name", ""), text)
+    return single_flight.do(key, execute)
+
+
+def generate_content(model: Any, prompt: Union[Prompt, str], agent: str, operation: str = "generate",
+                     coalesce: bool = True) -> Any:
+    """model.generate_content with token accounting and request coalescing."""
+    return _call(agent, operation, prompt, model, model.generate_content, coalesce)
+
+
+def send_message(chat: Any, prompt: Union[Prompt, str], agent: str, operation: str = "chat") -> Any:
+    """
+    chat.send_message with token accounting. Never coalesced: each call
+    appends to the chat's history, so a shared result would skip a turn.
+    """
+    return _call(agent, operation, prompt, chat, chat.send_message, coalesce=False)
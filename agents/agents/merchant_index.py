@@ -0,0 +1,169 @@
+# merchant_index.py - Merchant descriptor normalization and expected-category lookups
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_MERCHANTS_PATH = os.path.join(os.path.dirname(__file__), "data", "merchants.json")
+
+FUZZY_MATCH_THRESHOLD = 0.5
+# Descriptor tokens that carry no merchant identity (processor prefixes, legal suffixes)
+NOISE_TOKENS = {"sq", "tst", "pos", "pp", "debit", "purchase", "inc", "llc", "corp", "co", "the", "store", "stores"}
+MAX_CACHED_DESCRIPTORS = 100_000
+
+
+def normalize_descriptor(descriptor: str) -> str:
+    """'SHELL OIL 57442 AUSTIN TX' -> 'shell oil austin tx': lowercase, drop punctuation, store numbers and noise."""
+    text = re.sub(r"[^a-z0-9 ]+", " ", str(descriptor).lower().replace("'", ""))
+    tokens = [t for t in text.split() if t not in NOISE_TOKENS and not any(ch.isdigit() for ch in t)]
+    return " ".join(tokens)
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class Merchant:
+    name: str
+    kind: str
+    expected_categories: frozenset
+    aliases: List[str] = field(default_factory=list)
+
+    def expects(self, category: str) -> bool:
+        return category in self.expected_categories
+
+
+class MerchantIndex:
+    """
+    Resolves raw card descriptors to known merchants and their expected
+    categories. Exact names and aliases are a dict lookup, descriptors with
+    trailing location/store text match by longest token prefix, and anything
+    else falls back to trigram similarity. Resolutions are cached per
+    descriptor, so repeated descriptors cost one dict lookup.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("MERCHANTS_PATH", DEFAULT_MERCHANTS_PATH)
+        self.merchants: Dict[str, Merchant] = {}
+        self._names: Dict[str, str] = {}
+        self._max_name_tokens = 1
+        self._trigram_index: Dict[str, set] = {}
+        self._name_trigrams: Dict[str, set] = {}
+        self._cache: Dict[str, Optional[Merchant]] = {}
+        self.load()
+
+    def load(self):
+        """Load the data file and (re)build every index."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        merchants, names, trigram_index, name_trigrams = {}, {}, {}, {}
+        for entry in data.get("merchants", []):
+            key = normalize_descriptor(entry["name"])
+            merchant = Merchant(
+                name=entry["name"],
+                kind=entry.get("kind", ""),
+                expected_categories=frozenset(entry.get("expected_categories", [])),
+                aliases=[normalize_descriptor(a) for a in entry.get("aliases", [])],
+            )
+            merchants[key] = merchant
+            for name in [key] + merchant.aliases:
+                names.setdefault(name, key)
+                grams = _trigrams(name)
+                name_trigrams[name] = grams
+                for gram in grams:
+                    trigram_index.setdefault(gram, set()).add(name)
+
+        self.merchants = merchants
+        self._names = names
+        self._max_name_tokens = max((len(n.split()) for n in names), default=1)
+        self._trigram_index = trigram_index
+        self._name_trigrams = name_trigrams
+        self._cache = {}
+
+    # --- Single lookups (real-time path) ---
+
+    def lookup(self, descriptor: str) -> Optional[Merchant]:
+        """Resolve a raw descriptor to a known merchant, or None."""
+        cached = self._cache.get(descriptor, False)
+        if cached is not False:
+            return cached
+        merchant = self._resolve(normalize_descriptor(descriptor))
+        if len(self._cache) >= MAX_CACHED_DESCRIPTORS:
+            self._cache.clear()
+        self._cache[descriptor] = merchant
+        return merchant
+
+    def _resolve(self, query: str) -> Optional[Merchant]:
+        if not query:
+            return None
+        key = self._names.get(query)
+        if key:
+            return self.merchants[key]
+
+        # Longest known name that the descriptor starts with ("shell oil austin tx" -> "shell oil")
+        tokens = query.split()
+        for length in range(min(len(tokens), self._max_name_tokens), 0, -1):
+            key = self._names.get(" ".join(tokens[:length]))
+            if key:
+                return self.merchants[key]
+
+        query_grams = _trigrams(query)
+        scores: Dict[str, int] = {}
+        for gram in query_grams:
+            for candidate in self._trigram_index.get(gram, ()):
+                scores[candidate] = scores.get(candidate, 0) + 1
+
+        best_name, best_score = None, 0.0
+        for candidate, common in scores.items():
+            score = common / (len(query_grams) + len(self._name_trigrams[candidate]) - common)
+            if score > best_score:
+                best_name, best_score = candidate, score
+
+        if best_name and best_score >= FUZZY_MATCH_THRESHOLD:
+            return self.merchants[self._names[best_name]]
+        return None
+
+    def is_category_mismatch(self, descriptor: str, category: str) -> bool:
+        """True when a known merchant is charged under a category it doesn't sell."""
+        merchant = self.lookup(descriptor)
+        return merchant is not None and bool(category) and not merchant.expects(category)
+
+    # --- Column lookups (vectorized rule engine) ---
+
+    def kinds(self, descriptors: np.ndarray) -> np.ndarray:
+        """Merchant kind per row ('' for unknown merchants); each distinct descriptor is resolved once."""
+        unique, inverse = np.unique(np.asarray(descriptors).astype(str), return_inverse=True)
+        resolved = [self.lookup(d) for d in unique.tolist()]
+        return np.array([m.kind if m else "" for m in resolved], dtype=str)[inverse] if len(unique) else np.array([], dtype=str)
+
+    def mismatch_mask(self, descriptors: np.ndarray, categories: np.ndarray) -> np.ndarray:
+        """Boolean is_category_mismatch per row, evaluated once per distinct (descriptor, category) pair."""
+        descriptors = np.asarray(descriptors).astype(str)
+        if len(descriptors) == 0:
+            return np.zeros(0, dtype=bool)
+        pairs = np.char.add(np.char.add(descriptors, "\x1f"), np.asarray(categories).astype(str))
+        unique, inverse = np.unique(pairs, return_inverse=True)
+        flags = np.fromiter((self.is_category_mismatch(*pair.split("\x1f", 1)) for pair in unique.tolist()),
+                            dtype=bool, count=len(unique))
+        return flags[inverse]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_merchant_index() -> MerchantIndex:
+    """Process-wide merchant index, loaded on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = MerchantIndex()
+    return _index
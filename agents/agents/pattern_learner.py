@@ -0,0 +1,273 @@
+# pattern_learner.py - Background learning of new scam patterns from confirmed HIGH-risk incidents
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from agents.indicator_reputation import INDICATOR_PATTERN
+from agents.scam_pattern_index import LEARNED_MAX_RISK
+from agents.text_rules import get_text_rules
+
+logger = logging.getLogger(__name__)
+
+# Seconds between passes over new HIGH incidents
+LEARN_INTERVAL = float(os.getenv("PATTERN_LEARN_INTERVAL", "300"))
+# Learned patterns kept at most; beyond this the learner stops adding so the index stays small
+MAX_LEARNED_PATTERNS = int(os.getenv("MAX_LEARNED_PATTERNS", "5000"))
+# Incidents embedded and deduplicated together
+LEARN_BATCH_SIZE = 256
+# Shorter messages carry too little wording to be a useful exemplar
+MIN_WORDS = 5
+STATE_FILE = "learner.json"
+# Text rules that are scam-specific enough to confirm an incident for learning. Broad rules such as
+# sensitive_info_request also fire on ordinary questions ("how do I reset my password?"), so a HIGH
+# risk from them alone would teach the index to flag those questions too.
+CONFIRMING_RULES = ("suspicious_payment_method", "government_impersonation", "tech_support_scam",
+                    "large_money_request")
+
+GENERIC_CONCERN = "Other users reported a message like this as a scam; verify it independently before acting"
+
+
+def redact_indicators(text: str) -> str:
+    """Replace phone numbers, URLs, emails, UPI IDs and handles with their kind; the reputation index tracks those."""
+    return INDICATOR_PATTERN.sub(lambda match: f"<{match.lastgroup if match.lastgroup != 'host' else 'url'}>",
+                                 text.lower())
+
+
+class ScamPatternLearner:
+    """
+    Periodically reads HIGH-risk incidents logged since its last pass and
+    adds the novel ones to the scam pattern index. Only incidents where a
+    CONFIRMING_RULES rule fired are learned from, and learned patterns are
+    stored at LEARNED_MAX_RISK (the index also requires a vector match for
+    them), so a false positive cannot promote similar messages to HIGH.
+    Each batch is embedded
+    once; an incident is dropped when its closest existing pattern, or an
+    incident accepted earlier in the same pass, is above the dedup threshold
+    (PATTERN_DEDUP_THRESHOLD, default set per embedder).
+    Survivors are added in a single add_patterns() call per pass, so the
+    index is rewritten once per pass rather than once per incident. The
+    last incident id seen is kept next to the index so restarts resume
+    where they stopped.
+    """
+
+    def __init__(self, index, db, interval: float = LEARN_INTERVAL, dedup_threshold: float = None,
+                 max_learned: int = MAX_LEARNED_PATTERNS, batch_size: int = LEARN_BATCH_SIZE):
+        self.index = index
+        self.db = db
+        self.interval = interval
+        # Cosine similarity to an existing (or already accepted) pattern at which an incident is a duplicate
+        self.dedup_threshold = dedup_threshold or float(os.getenv("PATTERN_DEDUP_THRESHOLD",
+                                                                  index.embedder.dedup_threshold))
+        self.max_learned = max_learned
+        self.batch_size = batch_size
+        self.state_path = os.path.join(index.index_dir, STATE_FILE)
+        self.last_incident_id = self._load_state()
+
+        self.runs = 0
+        self.incidents_seen = 0
+        self.learned = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.unconfirmed = 0
+        self.last_run_ms = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_state(self) -> int:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return int(json.load(f)["last_incident_id"])
+        except (FileNotFoundError, ValueError, KeyError):
+            return 0
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_incident_id": self.last_incident_id}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def learned_count(self) -> int:
+        return sum(1 for pattern in self.index._state[1] if pattern.get("learned"))
+
+    def _novel(self, vectors: np.ndarray, accepted: List[np.ndarray]) -> Tuple[List[int], np.ndarray, np.ndarray]:
+        """
+        Rows of the batch that are not near-duplicates of the index or of
+        patterns accepted earlier in this pass, plus each row's best
+        similarity to the index and the index row it came from.
+        """
+        matrix, patterns = self.index._state[:2]
+        if len(patterns):
+            # One (patterns x batch) product for the whole batch against the float vectors
+            similarity = np.asarray(matrix, dtype=np.float32) @ vectors.T
+            nearest, closest = similarity.max(axis=0), similarity.argmax(axis=0)
+        else:
+            nearest, closest = np.full(len(vectors), -1.0), np.zeros(len(vectors), dtype=int)
+
+        if accepted:
+            # Patterns accepted from earlier batches of this pass are not in the index yet
+            nearest_pass = (np.stack(accepted) @ vectors.T).max(axis=0)
+        else:
+            nearest_pass = np.full(len(vectors), -1.0)
+        within = vectors @ vectors.T
+
+        novel = []
+        for row in range(len(vectors)):
+            if nearest[row] >= self.dedup_threshold or nearest_pass[row] >= self.dedup_threshold:
+                continue
+            if novel and within[row, novel].max() >= self.dedup_threshold:
+                continue
+            novel.append(row)
+        accepted.extend(vectors[novel])
+        return novel, nearest, closest
+
+    def run_once(self) -> Dict:
+        """Learn from confirmed HIGH incidents logged since the last pass. Returns this pass's counts."""
+        with self._run_lock:
+            started = time.perf_counter()
+            counts = {"incidents": 0, "learned": 0, "duplicates": 0, "skipped": 0, "unconfirmed": 0,
+                      "over_limit": 0}
+            rules = get_text_rules()
+            room = self.max_learned - self.learned_count()
+            incidents = list(self.db.iter_incident_texts(["HIGH"], after_id=self.last_incident_id))
+            patterns, vectors, accepted = [], [], []
+            for start in range(0, len(incidents), self.batch_size):
+                batch = []
+                for incident_id, _, text, _ in incidents[start:start + self.batch_size]:
+                    counts["incidents"] += 1
+                    confirmed = [rule for rule in rules.analyze(text)["rules"] if rule in CONFIRMING_RULES]
+                    redacted = redact_indicators(text)
+                    if not confirmed:
+                        counts["unconfirmed"] += 1
+                    elif len(redacted.split()) < MIN_WORDS:
+                        counts["skipped"] += 1
+                    else:
+                        batch.append((incident_id, redacted, confirmed[0]))
+                if not batch:
+                    continue
+                embedded = self.index.embedder.embed([text for _, text, _ in batch])
+                novel, nearest, closest = self._novel(embedded, accepted)
+                counts["duplicates"] += len(batch) - len(novel)
+                take = novel[:max(room - len(patterns), 0)]
+                counts["over_limit"] += len(novel) - len(take)
+                for row in take:
+                    incident_id, text, category = batch[row]
+                    concern = GENERIC_CONCERN
+                    if nearest[row] > self.index.match_threshold:
+                        concern = self.index._state[1][closest[row]].get("elderly_concern", GENERIC_CONCERN)
+                    patterns.append({"text": text, "category": category, "risk_level": LEARNED_MAX_RISK,
+                                     "elderly_concern": concern, "learned": True,
+                                     "source_incident_id": incident_id})
+                    vectors.append(embedded[row])
+            if counts["over_limit"]:
+                logger.warning(f"Learned pattern limit ({self.max_learned}) reached; "
+                               f"{counts['over_limit']} novel incidents not added")
+
+            if patterns:
+                self.index.add_patterns(patterns, np.stack(vectors))
+            counts["learned"] = len(patterns)
+            if incidents:
+                self.last_incident_id = incidents[-1][0]
+                self._save_state()
+
+            self.runs += 1
+            self.incidents_seen += counts["incidents"]
+            self.learned += counts["learned"]
+            self.duplicates += counts["duplicates"]
+            self.skipped += counts["skipped"]
+            self.unconfirmed += counts["unconfirmed"]
+            self.last_run_ms = round((time.perf_counter() - started) * 1000, 2)
+            if counts["learned"]:
+                logger.info(f"Learned {counts['learned']} scam patterns from {counts['incidents']} HIGH incidents "
+                            f"({counts['duplicates']} near-duplicates dropped)")
+            return counts
+
+    def start(self):
+        """Run a pass in a daemon thread every interval seconds."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.warning(f"Scam pattern learning failed: {e}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="pattern-learner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        return {
+            "interval_s": self.interval,
+            "dedup_threshold": self.dedup_threshold,
+            "last_incident_id": self.last_incident_id,
+            "runs": self.runs,
+            "incidents_seen": self.incidents_seen,
+            "learned": self.learned,
+            "duplicates_dropped": self.duplicates,
+            "skipped_short": self.skipped,
+            "skipped_unconfirmed": self.unconfirmed,
+            "learned_patterns": self.learned_count(),
+            "max_learned_patterns": self.max_learned,
+            "last_run_ms": self.last_run_ms,
+        }
+
+
+def benchmark(variants_per_seed: int = 250, novel: int = 40) -> Dict:
+    """
+    Feed the learner HIGH incidents that are mostly reworded copies of the
+    seed scams plus a few new scripts (which fire confirming rules), and
+    compare index size and query latency before and after.
+    """
+    import tempfile
+
+    from agents.scam_pattern_index import ScamPatternIndex, load_seed_patterns
+    from database.sqlite_helper import SQLiteHelper
+
+    rng = np.random.default_rng(0)
+    openers = ["", "hi, ", "urgent: ", "mom, ", "hello this is a message: "]
+    closers = ["", " please hurry", " do not tell anyone", " call back today", " thank you"]
+    seeds = [p["text"] for p in load_seed_patterns()]
+    fresh = [f"your {item} subscription renewed for ${amount}, let support take remote access to refund your bank"
+             if i % 2 else f"we found {item} money owed to you, pay a ${amount} release fee with a gift card today"
+             for i, (item, amount) in enumerate(zip(rng.choice(["norton", "amazon", "geek squad", "paypal", "apple",
+                                                                  "unclaimed", "estate", "pension", "stimulus"], novel),
+                                                    rng.integers(100, 999, novel)))]
+    messages = [f"{rng.choice(openers)}{seeds[i % len(seeds)]}{rng.choice(closers)}"
+                for i in range(variants_per_seed * len(seeds))] + fresh
+    rng.shuffle(messages)
+    query = "Someone from the IRS called saying I owe taxes and will be arrested unless I pay today"
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = SQLiteHelper(os.path.join(directory, "incidents.db"))
+        for i, message in enumerate(messages):
+            db.insert_incident(f"user{i % 50}", message, "HIGH", "blocked")
+        index = ScamPatternIndex(os.path.join(directory, "index"))
+        vector = index.embedder.embed_one(query)
+
+        def query_us() -> float:
+            start = time.perf_counter()
+            for _ in range(2000):
+                index.top_k(vector, 3)
+            return round((time.perf_counter() - start) / 2000 * 1e6, 1)
+
+        before, latency_before = len(index), query_us()
+        learner = ScamPatternLearner(index, db)
+        counts = learner.run_once()
+        return {"incidents": len(messages), "patterns_before": before, "patterns_after": len(index),
+                **{k: v for k, v in counts.items() if k != "incidents"}, "pass_ms": learner.last_run_ms,
+                "top3_us_before": latency_before, "top3_us_after": query_us()}
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,306 @@
+# policy_catalog.py - In-memory insurer policy catalog
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), "data", "policies.json")
+
+# Coverage bands used by the recommendation index (upper bound inclusive, in rupees)
+COVERAGE_BANDS = [
+    ("up_to_5_lakh", 500000),
+    ("5_to_50_lakh", 5000000),
+    ("above_50_lakh", float("inf")),
+]
+
+FUZZY_MATCH_THRESHOLD = 0.35
+
+
+def format_inr(amount: float) -> str:
+    """Format a rupee amount the way policy brochures do (Lakh / Crore)."""
+    if amount >= 10000000:
+        value, unit = amount / 10000000, "Crore"
+    elif amount >= 100000:
+        value, unit = amount / 100000, "Lakh"
+    else:
+        return f"₹{amount:,.0f}"
+    number = f"{value:.1f}".rstrip("0").rstrip(".")
+    return f"₹{number} {unit}{'s' if value > 1 and unit == 'Lakh' else ''}"
+
+
+def normalize_policy_name(name: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace for name matching."""
+    name = re.sub(r"[^a-z0-9. ]+", " ", name.lower())
+    return re.sub(r"\s+", " ", name).strip()
+
+
+def coverage_band(amount: float) -> str:
+    """Return the coverage band name for a sum insured."""
+    for band, upper in COVERAGE_BANDS:
+        if amount <= upper:
+            return band
+    return COVERAGE_BANDS[-1][0]
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class Policy:
+    key: str
+    policy_name: str
+    insurer: str
+    min_cover: int
+    max_cover: int
+    min_entry_age: int
+    max_entry_age: int
+    waiting_months: int
+    rank: int
+    features: List[str]
+    key_features: List[str]
+    aliases: List[str] = field(default_factory=list)
+
+    def covers(self, amount: float) -> bool:
+        return self.min_cover <= amount <= self.max_cover
+
+    def accepts_age(self, age: int) -> bool:
+        return self.min_entry_age <= age <= self.max_entry_age
+
+    def details(self) -> Dict:
+        """Details in the shape returned by the lookup_policy_details tool."""
+        return {
+            "policy_name": self.policy_name,
+            "insurer": self.insurer,
+            "coverage_range": f"{format_inr(self.min_cover)} to {format_inr(self.max_cover)}",
+            "pre_existing_disease_waiting_period": f"{self.waiting_months} months",
+            "entry_age": f"{self.min_entry_age} to {self.max_entry_age} years",
+            "key_features": list(self.key_features),
+        }
+
+
+class PolicyCatalog:
+    """
+    Insurer policy catalog loaded from a JSON data file.
+    Builds lookup indexes once at load time so tool calls and fast paths
+    only do dictionary and set operations per query.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("POLICY_CATALOG_PATH", DEFAULT_CATALOG_PATH)
+        self.policies: Dict[str, Policy] = {}
+        self.by_band: Dict[str, List[str]] = {band: [] for band, _ in COVERAGE_BANDS}
+        self.by_waiting_period: Dict[int, List[str]] = {}
+        self.by_feature: Dict[str, set] = {}
+        self._names: Dict[str, str] = {}
+        self._trigram_index: Dict[str, set] = {}
+        self._name_trigrams: Dict[str, set] = {}
+        self._mention_pattern = None
+        self._comparison_rows: Dict[str, Dict] = {}
+        self._comparisons: Dict[Tuple[str, ...], Dict] = {}
+        self.load()
+
+    def load(self):
+        """Load the data file and (re)build every index."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        policies = {}
+        for entry in data.get("policies", []):
+            key = normalize_policy_name(entry["policy_name"])
+            entry_age = entry.get("entry_age", [18, 65])
+            policies[key] = Policy(
+                key=key,
+                policy_name=entry["policy_name"],
+                insurer=entry.get("insurer", ""),
+                min_cover=int(entry["min_cover"]),
+                max_cover=int(entry["max_cover"]),
+                min_entry_age=int(entry_age[0]),
+                max_entry_age=int(entry_age[1]),
+                waiting_months=int(entry["pre_existing_disease_waiting_months"]),
+                rank=int(entry.get("rank", 100)),
+                features=list(entry.get("features", [])),
+                key_features=list(entry.get("key_features", [])),
+                aliases=[normalize_policy_name(a) for a in entry.get("aliases", [])],
+            )
+
+        self.policies = policies
+        self._build_indexes()
+
+    def _build_indexes(self):
+        by_band = {band: [] for band, _ in COVERAGE_BANDS}
+        by_waiting: Dict[int, List[str]] = {}
+        by_feature: Dict[str, set] = {}
+        names: Dict[str, str] = {}
+        trigram_index: Dict[str, set] = {}
+        name_trigrams: Dict[str, set] = {}
+
+        lower = 0
+        for band, upper in COVERAGE_BANDS:
+            for policy in self.policies.values():
+                if policy.min_cover <= upper and policy.max_cover > lower:
+                    by_band[band].append(policy.key)
+            by_band[band].sort(key=lambda k: (self.policies[k].rank, self.policies[k].waiting_months))
+            lower = upper
+
+        for policy in self.policies.values():
+            by_waiting.setdefault(policy.waiting_months, []).append(policy.key)
+            for feature in policy.features:
+                by_feature.setdefault(feature, set()).add(policy.key)
+            for name in [policy.key] + policy.aliases:
+                names.setdefault(name, policy.key)
+                grams = _trigrams(name)
+                name_trigrams[name] = grams
+                for gram in grams:
+                    trigram_index.setdefault(gram, set()).add(name)
+
+        # One alternation over every name and alias, longest first, for free-text mentions
+        alternatives = sorted(names, key=len, reverse=True)
+        mention_pattern = re.compile(r"\b(" + "|".join(re.escape(n) for n in alternatives) + r")\b") if alternatives else None
+
+        self.by_band = by_band
+        self.by_waiting_period = by_waiting
+        self.by_feature = by_feature
+        self._names = names
+        self._trigram_index = trigram_index
+        self._name_trigrams = name_trigrams
+        self._mention_pattern = mention_pattern
+        self._comparison_rows = {key: self._comparison_row(p) for key, p in self.policies.items()}
+        self._comparisons = {}
+        # Precompute the side-by-side table of the top picks in every band
+        for band, keys in by_band.items():
+            if len(keys) > 1:
+                self._comparisons[tuple(sorted(keys[:3]))] = self._build_comparison(keys[:3])
+
+    def _comparison_row(self, policy: Policy) -> Dict:
+        return {
+            "policy_name": policy.policy_name,
+            "insurer": policy.insurer,
+            "coverage_range": f"{format_inr(policy.min_cover)} to {format_inr(policy.max_cover)}",
+            "waiting_period": f"{policy.waiting_months} months",
+            "entry_age": f"{policy.min_entry_age}-{policy.max_entry_age}",
+            "features": sorted(policy.features),
+        }
+
+    def _build_comparison(self, keys: List[str]) -> Dict:
+        rows = [self._comparison_rows.get(k) or self._comparison_row(self.policies[k]) for k in keys]
+        shared = set.intersection(*(set(self.policies[k].features) for k in keys)) if keys else set()
+        return {
+            "policies": rows,
+            "shortest_waiting_period": min(keys, key=lambda k: self.policies[k].waiting_months),
+            "highest_cover": max(keys, key=lambda k: self.policies[k].max_cover),
+            "shared_features": sorted(shared),
+            "unique_features": {
+                self.policies[k].policy_name: sorted(set(self.policies[k].features) - shared) for k in keys
+            },
+        }
+
+    # --- Queries ---
+
+    def get(self, name: str) -> Optional[Policy]:
+        """Resolve a policy by exact name, alias or fuzzy trigram match."""
+        query = normalize_policy_name(name)
+        if not query:
+            return None
+        key = self._names.get(query)
+        if key:
+            return self.policies[key]
+
+        query_grams = _trigrams(query)
+        scores: Dict[str, int] = {}
+        for gram in query_grams:
+            for candidate in self._trigram_index.get(gram, ()):
+                scores[candidate] = scores.get(candidate, 0) + 1
+
+        best_name, best_score = None, 0.0
+        for candidate, common in scores.items():
+            union = len(query_grams) + len(self._name_trigrams[candidate]) - common
+            score = common / union
+            if score > best_score:
+                best_name, best_score = candidate, score
+
+        if best_name and best_score >= FUZZY_MATCH_THRESHOLD:
+            return self.policies[self._names[best_name]]
+        return None
+
+    def find_mentions(self, text: str) -> List[Policy]:
+        """Return the distinct policies named in free text, in order of mention."""
+        if not self._mention_pattern:
+            return []
+        found = []
+        for match in self._mention_pattern.finditer(normalize_policy_name(text)):
+            policy = self.policies[self._names[match.group(1)]]
+            if policy not in found:
+                found.append(policy)
+        return found
+
+    def search(self, coverage_amount: float = None, max_waiting_months: int = None,
+               features: List[str] = None, age: int = None) -> List[Policy]:
+        """Filter policies by coverage band, waiting period, features and entry age."""
+        if coverage_amount is not None:
+            keys = [k for k in self.by_band[coverage_band(coverage_amount)] if self.policies[k].covers(coverage_amount)]
+        else:
+            keys = sorted(self.policies, key=lambda k: (self.policies[k].rank, self.policies[k].waiting_months))
+
+        if max_waiting_months is not None:
+            allowed = set()
+            for months, waiting_keys in self.by_waiting_period.items():
+                if months <= max_waiting_months:
+                    allowed.update(waiting_keys)
+            keys = [k for k in keys if k in allowed]
+
+        for feature in features or []:
+            keys = [k for k in keys if k in self.by_feature.get(feature, ())]
+
+        if age is not None:
+            keys = [k for k in keys if self.policies[k].accepts_age(age)]
+
+        return [self.policies[k] for k in keys]
+
+    def recommend(self, age: int, coverage_amount: float) -> Optional[Policy]:
+        """Best-ranked policy that covers the amount and accepts the entry age, or None if none does."""
+        candidates = self.search(coverage_amount=coverage_amount, age=age)
+        return candidates[0] if candidates else None
+
+    def compare(self, names: List[str]) -> Dict:
+        """Side-by-side comparison of the named policies (memoized per policy set)."""
+        keys, missing = [], []
+        for name in names:
+            policy = self.get(name)
+            if policy is None:
+                missing.append(name)
+            elif policy.key not in keys:
+                keys.append(policy.key)
+
+        if len(keys) < 2:
+            return {"error": "Need at least two known policies to compare.", "not_found": missing}
+
+        cache_key = tuple(sorted(keys))
+        comparison = self._comparisons.get(cache_key)
+        if comparison is None:
+            comparison = self._build_comparison(list(cache_key))
+            self._comparisons[cache_key] = comparison
+
+        result = dict(comparison)
+        result["shortest_waiting_period"] = self.policies[comparison["shortest_waiting_period"]].policy_name
+        result["highest_cover"] = self.policies[comparison["highest_cover"]].policy_name
+        if missing:
+            result["not_found"] = missing
+        return result
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_policy_catalog() -> PolicyCatalog:
+    """Process-wide catalog, loaded on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = PolicyCatalog()
+    return _catalog
@@ -0,0 +1,159 @@
+# prompt_builder.py - Token-budgeted prompt construction shared by all agents
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# Rough Gemini tokenizer ratio for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Default per-agent prompt budgets (tokens). Override with PROMPT_TOKEN_BUDGET_<AGENT>.
+AGENT_TOKEN_BUDGETS = {
+    "fraud": 6000,
+    "healthcare": 2000,
+    "estate": 1200,
+    "family": 800,
+    "family_batch": 6000,
+}
+DEFAULT_TOKEN_BUDGET = 2000
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text without calling the API."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def get_token_budget(agent: str) -> int:
+    """Prompt token budget for an agent, honouring environment overrides."""
+    override = os.getenv(f"PROMPT_TOKEN_BUDGET_{agent.upper()}")
+    if override:
+        try:
+            return int(override)
+        except ValueError:
+            pass
+    return AGENT_TOKEN_BUDGETS.get(agent, DEFAULT_TOKEN_BUDGET)
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def encode_table(rows: List[Dict], columns: List[str]) -> str:
+    """Encode records as a header line plus one pipe-separated line per row."""
+    lines = ["|".join(columns)]
+    lines.extend("|".join(_cell(row.get(col)) for col in columns) for row in rows)
+    return "\n".join(lines)
+
+
+def encode_fields(record: Dict, fields: List[str] = None) -> str:
+    """Encode a flat record as compact 'key: value' lines, skipping empty values."""
+    keys = fields or list(record.keys())
+    return "\n".join(f"{key}: {_cell(record.get(key))}" for key in keys if record.get(key) not in (None, "", [], {}))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens * CHARS_PER_TOKEN - 16)
+    return text[:keep].rstrip() + " ...[truncated]"
+
+
+@dataclass
+class Prompt:
+    text: str
+    agent: str
+    token_count: int
+    budget: int
+    truncated: bool = False
+
+
+class PromptBuilder:
+    """
+    Assembles a prompt from sections under a per-agent token budget.
+    Fixed sections are always kept; text and table sections are truncated
+    (tables drop trailing rows with a summary line) once the budget runs out.
+    """
+
+    def __init__(self, agent: str, budget: int = None):
+        self.agent = agent
+        self.budget = budget or get_token_budget(agent)
+        self._sections: List[Dict] = []
+
+    def add(self, text: str) -> "PromptBuilder":
+        """Add a section that must always be sent (instructions, output format)."""
+        self._sections.append({"kind": "fixed", "text": text.strip()})
+        return self
+
+    def add_text(self, text: str, label: str = None) -> "PromptBuilder":
+        """Add free text that may be truncated to fit the budget."""
+        self._sections.append({"kind": "text", "text": (text or "").strip(), "label": label})
+        return self
+
+    def add_table(self, rows: List[Dict], columns: List[str], label: str = None,
+                  summarize: Optional[callable] = None) -> "PromptBuilder":
+        """Add records as a compact table; rows that do not fit are summarized."""
+        self._sections.append({"kind": "table", "rows": rows, "columns": columns,
+                               "label": label, "summarize": summarize})
+        return self
+
+    def build(self) -> Prompt:
+        fixed_tokens = sum(count_tokens(s["text"]) for s in self._sections if s["kind"] == "fixed")
+        remaining = max(0, self.budget - fixed_tokens)
+        pending = sum(1 for s in self._sections if s["kind"] != "fixed")
+        truncated = False
+        parts = []
+
+        for section in self._sections:
+            if section["kind"] == "fixed":
+                parts.append(section["text"])
+                continue
+
+            # Split what is left evenly between the flexible sections still to come
+            share = remaining // pending
+            pending -= 1
+            label = f"{section['label']}:\n" if section.get("label") else ""
+
+            if section["kind"] == "text":
+                body = truncate_to_tokens(section["text"], max(0, share - count_tokens(label)))
+                truncated = truncated or body != section["text"]
+            else:
+                body, cut = self._fit_table(section, max(0, share - count_tokens(label)))
+                truncated = truncated or cut
+
+            text = label + body
+            remaining -= count_tokens(text)
+            parts.append(text)
+
+        text = "\n\n".join(p for p in parts if p)
+        return Prompt(text=text, agent=self.agent, token_count=count_tokens(text),
+                      budget=self.budget, truncated=truncated)
+
+    @staticmethod
+    def _fit_table(section: Dict, max_tokens: int):
+        rows, columns = section["rows"], section["columns"]
+        header = "|".join(columns)
+        used = count_tokens(header)
+        lines = [header]
+        kept = 0
+        for row in rows:
+            line = "|".join(_cell(row.get(col)) for col in columns)
+            cost = count_tokens(line) + 1
+            if used + cost > max_tokens:
+                break
+            lines.append(line)
+            used += cost
+            kept += 1
+
+        if kept == len(rows):
+            return "\n".join(lines), False
+
+        omitted = rows[kept:]
+        summary = section["summarize"](omitted) if section.get("summarize") else ""
+        lines.append(f"...{len(omitted)} more rows omitted{'; ' + summary if summary else ''}")
+        return "\n".join(lines), True
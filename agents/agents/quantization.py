@@ -0,0 +1,133 @@
+# quantization.py - Int8 embedding storage with float re-ranking for the similarity indexes
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from agents.lexical_index import top_k
+
+# "int8" keeps int8 codes plus a float32 scale per vector in memory; "none" scores the float matrix directly
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+# Candidates re-scored with the float vectors: max(k * factor, RERANK_MIN)
+RERANK_FACTOR = int(os.getenv("QUANTIZED_RERANK_FACTOR", "4"))
+RERANK_MIN = 32
+# Rows converted back to float32 at a time while scoring; small blocks stay in cache (1MB at dim 1024)
+SCORE_BLOCK_ROWS = 256
+
+
+def quantize_rows(matrix: np.ndarray):
+    """Symmetric per-row int8 quantization: row ~= codes * scale with |codes| <= 127."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+class QuantizedMatrix:
+    """
+    Int8 codes with a float32 scale per row for first-pass scoring, plus a
+    reference to the float32 rows (normally a memory-mapped .npy, so only
+    the re-ranked candidates are paged in). scores() returns approximate
+    cosines for every row with the best candidates replaced by exact ones,
+    so callers can treat it like `matrix @ vector`.
+    """
+
+    def __init__(self, matrix: np.ndarray, rerank_factor: int = RERANK_FACTOR):
+        self.float_rows = matrix
+        self.codes, self.scales = quantize_rows(matrix)
+        self.rerank_factor = rerank_factor
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """Resident bytes of the quantized form (the float rows stay on disk)."""
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def approximate_scores(self, vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ vector
+        return scores * self.scales
+
+    def scores(self, vector: np.ndarray, k: int = 3, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Approximate scores, exact for the top max(k * rerank_factor, RERANK_MIN)
+        candidates. Rows outside `mask` (if given) score -inf and are never
+        candidates, so the re-rank is spent on rows the caller can return.
+        """
+        scores = self.approximate_scores(vector)
+        allowed = len(scores)
+        if mask is not None:
+            scores[~mask] = -np.inf
+            allowed = int(np.count_nonzero(mask))
+        candidates = min(max(k * self.rerank_factor, RERANK_MIN), allowed)
+        if candidates == 0:
+            return scores
+        if candidates < len(scores):
+            rows = np.sort(np.argpartition(-scores, candidates - 1)[:candidates])
+        else:
+            rows = np.arange(len(scores))
+        scores[rows] = np.asarray(self.float_rows[rows], dtype=np.float32) @ vector
+        return scores
+
+
+def benchmark(sizes: List[int] = None, queries: int = 200, k: int = 10) -> List[Dict]:
+    """
+    Memory and recall@k of int8 scoring against exact float32 search, on
+    embedded synthetic scam-like texts; queries are corpus texts with words
+    dropped and swapped in.
+    """
+    from agents.embeddings import get_embedder
+    from agents.scam_pattern_index import load_seed_patterns
+
+    embedder = get_embedder().embedder
+    rng = np.random.default_rng(0)
+    vocabulary = sorted({w.strip(".,!?$").lower() for p in load_seed_patterns() for w in p["text"].split()} - {""})
+    results = []
+    for size in sizes or [1_000, 20_000]:
+        texts = [" ".join(rng.choice(vocabulary, rng.integers(8, 20))) for _ in range(size)]
+        matrix = embedder.embed(texts)
+        picked = rng.integers(0, size, queries)
+        query_texts = []
+        for row in picked:
+            words = texts[row].split()
+            keep = [w for w in words if rng.random() > 0.3] + list(rng.choice(vocabulary, 3))
+            query_texts.append(" ".join(keep))
+        query_vectors = embedder.embed(query_texts)
+        quantized = QuantizedMatrix(matrix)
+
+        recall_raw = recall_reranked = 0.0
+        float_s = int8_s = 0.0
+        for vector in query_vectors:
+            start = time.perf_counter()
+            exact = {row for row, _ in top_k(matrix @ vector, k)}
+            float_s += time.perf_counter() - start
+            start = time.perf_counter()
+            reranked = {row for row, _ in top_k(quantized.scores(vector, k), k)}
+            int8_s += time.perf_counter() - start
+            raw = {row for row, _ in top_k(quantized.approximate_scores(vector), k)}
+            recall_raw += len(raw & exact) / k
+            recall_reranked += len(reranked & exact) / k
+
+        results.append({
+            "vectors": size,
+            "float32_mb": round(matrix.nbytes / 1e6, 2),
+            "int8_mb": round(quantized.nbytes / 1e6, 2),
+            "memory_saved": f"{1 - quantized.nbytes / matrix.nbytes:.0%}",
+            f"recall@{k}_int8": round(recall_raw / queries, 3),
+            f"recall@{k}_reranked": round(recall_reranked / queries, 3),
+            "float_query_us": round(float_s / queries * 1e6, 1),
+            "int8_query_us": round(int8_s / queries * 1e6, 1),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print(row)
@@ -0,0 +1,348 @@
+# scam_pattern_index.py - In-process cosine similarity index over known scam patterns
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from agents.embeddings import get_embedder
+from agents.lexical_index import (BM25Index, HYBRID_VECTOR_WEIGHT, LEXICAL_CONFIDENCE, RETRIEVAL_MODE, fuse,
+                                  top_k)
+from agents.quantization import EMBEDDING_QUANTIZATION, QuantizedMatrix
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(os.getenv('DATA_DIR', 'data'), 'scam_index')
+DEFAULT_SEED_PATH = os.path.join(os.path.dirname(__file__), "data", "scam_patterns.json")
+DEFAULT_BENIGN_PATH = os.path.join(os.path.dirname(__file__), "data", "benign_messages.json")
+# Share of the benign messages allowed to match a pattern when the match threshold is calibrated
+MATCH_FALSE_POSITIVE_RATE = float(os.getenv("SCAM_MATCH_FALSE_POSITIVE_RATE", "0.02"))
+MANIFEST = "index.json"
+
+RISK_ORDER = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+# Patterns learned from incidents are unreviewed, so they never suggest more than this
+LEARNED_MAX_RISK = "MEDIUM"
+# Highest risk an embedding-only match may suggest without a lexical match or a fired text rule
+UNCORROBORATED_MAX_RISK = "MEDIUM"
+
+
+def load_seed_patterns(path: str = None) -> List[Dict]:
+    """The built-in scam patterns (text, category, risk_level, elderly_concern)."""
+    with open(path or DEFAULT_SEED_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)["patterns"]
+
+
+def load_benign_messages(path: str = None) -> List[str]:
+    """Ordinary user questions that no scam pattern should match."""
+    with open(path or DEFAULT_BENIGN_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)["messages"]
+
+
+class ScamPatternIndex:
+    """
+    Scam pattern embeddings held as one L2-normalized float32 matrix, so
+    cosine top-k for a query is a single matrix-vector product plus an
+    argpartition. The matrix is persisted as an .npy file and memory-mapped on
+    load; pattern text and metadata live in a JSON manifest that is replaced
+    atomically. Additions build a new matrix and swap it in, so queries never
+    see a partially written index.
+
+    A BM25 inverted index over the same patterns is rebuilt alongside the
+    matrix. In "hybrid" mode (RETRIEVAL_MODE) a query is scored lexically
+    first; when a pattern's wording is found nearly verbatim in the message
+    that answer stands and the message is never embedded, otherwise the
+    cosine scores are computed and fused with the lexical ones.
+
+    With EMBEDDING_QUANTIZATION=int8 the float matrix stays memory-mapped on
+    disk and queries score int8 codes, re-ranking the best candidates with
+    the float rows (see agents.quantization).
+
+    Unless SCAM_MATCH_THRESHOLD pins it, the cosine match threshold is
+    calibrated on agents/data/benign_messages.json so that at most
+    MATCH_FALSE_POSITIVE_RATE of those ordinary questions match a pattern,
+    and never drops below the embedder's default.
+    """
+
+    def __init__(self, index_dir: str = None, embedder=None, seed_path: str = None, mode: str = None,
+                 quantization: str = None):
+        self.index_dir = index_dir or os.getenv("SCAM_INDEX_DIR", DEFAULT_INDEX_DIR)
+        self.embedder = embedder or get_embedder()
+        self.seed_path = seed_path
+        self.match_threshold = self.embedder.match_threshold
+        self.mode = mode or RETRIEVAL_MODE
+        self.lexical_confidence = LEXICAL_CONFIDENCE
+        self.quantization = quantization or EMBEDDING_QUANTIZATION
+        self._write_lock = threading.Lock()
+        # (matrix, patterns, lexical index, int8 codes or None) replaced as a unit
+        self._state: Tuple[np.ndarray, List[Dict], BM25Index, QuantizedMatrix] = (
+            np.zeros((0, self.embedder.dim), dtype=np.float32), [], BM25Index([]), None)
+        self.queries = 0
+        self.lexical_only = 0
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        if not self.load():
+            self.rebuild(load_seed_patterns(seed_path))
+        pinned = os.getenv("SCAM_MATCH_THRESHOLD")
+        self.match_threshold = float(pinned) if pinned else self.calibrate_match_threshold()
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    # --- Persistence ---
+
+    def load(self) -> bool:
+        """Map the persisted index; False when missing or built with a different embedder."""
+        try:
+            with open(os.path.join(self.index_dir, MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if manifest.get("embedder") != self.embedder.name:
+            logger.info(f"Scam index was built with {manifest.get('embedder')}, rebuilding for {self.embedder.name}")
+            return False
+        matrix = np.load(os.path.join(self.index_dir, manifest["vectors"]), mmap_mode="r")
+        if matrix.shape != (len(manifest["patterns"]), self.embedder.dim):
+            return False
+        self._state = self._build_state(matrix, manifest["patterns"])
+        return True
+
+    def _build_state(self, matrix: np.ndarray, patterns: List[Dict]) -> Tuple:
+        quantized = QuantizedMatrix(matrix) if self.quantization == "int8" else None
+        return matrix, patterns, BM25Index([p["text"] for p in patterns]), quantized
+
+    def _save(self, matrix: np.ndarray, patterns: List[Dict]) -> np.ndarray:
+        """
+        Write the vectors under a new name, then point the manifest at them.
+        Returns the matrix to serve: the written file memory-mapped when
+        quantized (so the float rows leave the heap), else the input.
+        """
+        vectors = f"vectors-{time.time_ns()}.npy"
+        np.save(os.path.join(self.index_dir, vectors), matrix)
+        tmp_path = os.path.join(self.index_dir, f"{MANIFEST}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"embedder": self.embedder.name, "dim": self.embedder.dim, "vectors": vectors,
+                       "patterns": patterns}, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, MANIFEST))
+        # Mappings already handed to readers keep working after the unlink
+        for name in os.listdir(self.index_dir):
+            if name.startswith("vectors-") and name != vectors:
+                os.remove(os.path.join(self.index_dir, name))
+        if self.quantization == "int8":
+            return np.load(os.path.join(self.index_dir, vectors), mmap_mode="r")
+        return matrix
+
+    # --- Writes ---
+
+    def rebuild(self, patterns: List[Dict]) -> int:
+        """Replace the whole index with these patterns."""
+        matrix = self.embedder.embed([p["text"] for p in patterns])
+        records = [dict(p) for p in patterns]
+        with self._write_lock:
+            self._state = self._build_state(self._save(matrix, records), records)
+        return len(records)
+
+    def add_patterns(self, patterns: List[Dict], vectors: np.ndarray = None) -> int:
+        """Embed (unless vectors are given) and append patterns in one batch."""
+        if not patterns:
+            return 0
+        if vectors is None:
+            vectors = self.embedder.embed([p["text"] for p in patterns])
+        with self._write_lock:
+            matrix, records = self._state[:2]
+            matrix = np.vstack([np.asarray(matrix), vectors.astype(np.float32)])
+            records = records + [dict(p) for p in patterns]
+            self._state = self._build_state(self._save(matrix, records), records)
+        return len(patterns)
+
+    def add_scam_pattern(self, text: str, category: str, risk_level: str, elderly_concern: str) -> bool:
+        """Add one user-submitted pattern (same signature as ChromaHelper.add_scam_pattern)."""
+        return self.add_patterns([{"text": text, "category": category, "risk_level": risk_level,
+                                   "elderly_concern": elderly_concern, "user_submitted": True}]) == 1
+
+    # --- Reads ---
+
+    def top_k(self, vector: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+        """(row, cosine similarity) of the k nearest patterns to a unit query vector, best first."""
+        if len(self._state[0]) == 0:
+            return []
+        return top_k(self._vector_scores(self._state, vector, k), k)
+
+    @staticmethod
+    def _vector_scores(state: Tuple, vector: np.ndarray, k: int) -> np.ndarray:
+        """Cosine similarity of every pattern; int8 approximations except for the re-ranked top candidates."""
+        matrix, _, _, quantized = state
+        return quantized.scores(vector, k) if quantized is not None else matrix @ vector
+
+    def _result(self, row: int, similarity: float, lexical: float = None, vector: float = None) -> Dict:
+        pattern = self._state[1][row]
+        return {
+            "text": pattern["text"],
+            "metadata": {key: value for key, value in pattern.items() if key != "text"},
+            "similarity": similarity,
+            "lexical_score": lexical,
+            "vector_score": vector,
+        }
+
+    def query_vector(self, vector: np.ndarray, n_results: int = 3) -> List[Dict]:
+        self.queries += 1
+        return [self._result(row, similarity, vector=similarity) for row, similarity in self.top_k(vector, n_results)]
+
+    def query_scam_patterns(self, query_text: str, n_results: int = 3, vector: np.ndarray = None) -> List[Dict]:
+        """
+        Most similar patterns, in the shape ChromaHelper.query_scam_patterns
+        returns plus the lexical and vector components of "similarity".
+        """
+        if self.mode == "vector":
+            return self.query_vector(vector if vector is not None else self.embedder.embed_one(query_text), n_results)
+
+        self.queries += 1
+        state = self._state
+        lexical = state[2].search(query_text, n_results, normalize="document")
+        # Only a curated pattern can answer lexically; learned ones must also be close in embedding space
+        confident = lexical and lexical[0][1] >= self.lexical_confidence and not state[1][lexical[0][0]].get("learned")
+        if self.mode == "lexical" or (vector is None and confident):
+            self.lexical_only += 1
+            vector_scores = None
+        else:
+            if vector is None:
+                vector = self.embedder.embed_one(query_text)
+            vector_scores = self._vector_scores(state, vector, n_results)
+        return [self._result(hit["row"], hit["score"], hit["lexical"], hit["vector"])
+                for hit in fuse(lexical, vector_scores, n_results)]
+
+    def _lexical_match(self, pattern: Dict) -> bool:
+        return (not pattern["metadata"].get("learned") and pattern["lexical_score"] is not None
+                and pattern["lexical_score"] >= self.lexical_confidence)
+
+    def _matches(self, pattern: Dict) -> bool:
+        if self._lexical_match(pattern):
+            return True
+        return pattern["vector_score"] is not None and pattern["vector_score"] > self.match_threshold
+
+    def calibrate_match_threshold(self, benign: List[str] = None, rate: float = MATCH_FALSE_POSITIVE_RATE) -> float:
+        """Lowest cosine threshold (at or above the embedder default) that at most `rate` of benign messages exceed."""
+        matrix, patterns = self._state[:2]
+        curated = [row for row, pattern in enumerate(patterns) if not pattern.get("learned")]
+        benign = benign if benign is not None else load_benign_messages()
+        if not curated or not benign:
+            return self.embedder.match_threshold
+        nearest = (self.embedder.embed(benign) @ np.asarray(matrix[curated], dtype=np.float32).T).max(axis=1)
+        return max(self.embedder.match_threshold, float(np.quantile(nearest, 1.0 - rate, method="higher")))
+
+    def enhance_fraud_analysis(self, input_text: str, vector: np.ndarray = None, corroborated: bool = False) -> Dict:
+        """
+        Suggested risk level and elderly concerns from close pattern matches
+        (ChromaHelper-compatible). A pattern matches on a confident lexical
+        score or on cosine similarity above the threshold; learned patterns
+        only match on cosine similarity and suggest at most LEARNED_MAX_RISK.
+        An embedding-only match suggests at most UNCORROBORATED_MAX_RISK
+        unless the caller's text rules also fired (`corroborated`).
+        """
+        similar_patterns = self.query_scam_patterns(input_text, n_results=2, vector=vector)
+        if not similar_patterns:
+            return {"enhancement": None, "similar_patterns": []}
+
+        max_risk = "LOW"
+        elderly_concerns = []
+        for pattern in similar_patterns:
+            if self._matches(pattern):
+                pattern_risk = pattern["metadata"].get("risk_level", "LOW")
+                if pattern["metadata"].get("learned") and RISK_ORDER.get(pattern_risk, 0) > RISK_ORDER[LEARNED_MAX_RISK]:
+                    pattern_risk = LEARNED_MAX_RISK
+                if (not corroborated and not self._lexical_match(pattern)
+                        and RISK_ORDER.get(pattern_risk, 0) > RISK_ORDER[UNCORROBORATED_MAX_RISK]):
+                    pattern_risk = UNCORROBORATED_MAX_RISK
+                if RISK_ORDER.get(pattern_risk, 0) > RISK_ORDER[max_risk]:
+                    max_risk = pattern_risk
+                concern = pattern["metadata"].get("elderly_concern")
+                if concern:
+                    elderly_concerns.append(concern)
+
+        return {
+            "enhancement": {
+                "suggested_risk_level": max_risk,
+                "elderly_concerns": elderly_concerns[:2],
+                "pattern_match_confidence": max(p["similarity"] for p in similar_patterns),
+            },
+            "similar_patterns": similar_patterns,
+        }
+
+    def stats(self) -> Dict:
+        matrix, patterns, lexical, quantized = self._state
+        return {
+            "patterns": len(patterns),
+            "embedder": self.embedder.name,
+            "dim": self.embedder.dim,
+            "mode": self.mode,
+            "match_threshold": self.match_threshold,
+            "lexical_confidence": self.lexical_confidence,
+            "vector_weight": HYBRID_VECTOR_WEIGHT,
+            "quantization": self.quantization if quantized is not None else "none",
+            "bytes": quantized.nbytes if quantized is not None else int(matrix.nbytes),
+            "float_bytes": int(matrix.nbytes),
+            "lexical_terms": len(lexical.postings),
+            "queries": self.queries,
+            "answered_lexically": self.lexical_only,
+        }
+
+
+def benign_escalations(index: "ScamPatternIndex", messages: List[str] = None) -> Dict:
+    """How many ordinary questions a pattern match would escalate, and to which risk level."""
+    messages = messages if messages is not None else load_benign_messages()
+    escalated = {}
+    for message in messages:
+        enhancement = index.enhance_fraud_analysis(message)["enhancement"]
+        risk = enhancement["suggested_risk_level"] if enhancement else "LOW"
+        if risk != "LOW":
+            escalated[message] = risk
+    return {"benign_messages": len(messages), "match_threshold": round(index.match_threshold, 3),
+            "false_positive_rate": round(len(escalated) / len(messages), 3) if messages else 0.0,
+            "escalated": escalated}
+
+
+def benchmark(sizes: List[int] = None, queries: int = 2000, index_dir: str = None) -> List[Dict]:
+    """
+    Embedding and top-k latency per query as the pattern count grows, and
+    the benign-message false-positive check for the seed index.
+    """
+    import tempfile
+
+    seeds = load_seed_patterns()
+    texts = ["Someone from the IRS called saying I owe taxes and will be arrested unless I pay today",
+             "my grandson called from jail asking for bail money",
+             "Microsoft says my computer has a virus and wants remote access",
+             "can you help me understand my medicare coverage"]
+    results = []
+    for size in sizes or [8, 1_000, 10_000]:
+        with tempfile.TemporaryDirectory(dir=index_dir) as directory:
+            index = ScamPatternIndex(directory)
+            if size > len(seeds):
+                rng = np.random.default_rng(0)
+                extra = size - len(seeds)
+                vectors = rng.standard_normal((extra, index.embedder.dim)).astype(np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                index.add_patterns([{**seeds[i % len(seeds)], "synthetic": True} for i in range(extra)], vectors)
+
+            query_vectors = index.embedder.embed(texts)
+            start = time.perf_counter()
+            for i in range(queries):
+                index.embedder.embed([texts[i % len(texts)]])
+            embed_us = (time.perf_counter() - start) / queries * 1e6
+            start = time.perf_counter()
+            for i in range(queries):
+                index.top_k(query_vectors[i % len(texts)], 3)
+            search_us = (time.perf_counter() - start) / queries * 1e6
+            result = {"patterns": len(index), "embed_us": round(embed_us, 1), "top3_us": round(search_us, 1),
+                      "matrix_mb": round(index.stats()["bytes"] / 1e6, 2)}
+            if size <= len(seeds):
+                result["benign"] = benign_escalations(index)
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print(row)
@@ -0,0 +1,102 @@
+# single_flight.py - Coalesce identical concurrent calls into one execution
+import hashlib
+import threading
+from typing import Any, Callable, Dict
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised to a waiter whose shared in-flight call did not finish in time."""
+
+
+class _InFlightCall:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Concurrent callers with the same key share one execution of the call.
+    The first caller (the leader) runs the function; everyone else waits for
+    its result. Exceptions raised by the leader are re-raised in every waiter,
+    and waiters that give up after `timeout` seconds get SingleFlightTimeout.
+    Nothing is cached: once the call finishes the next caller runs it again.
+    """
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "waiter_timeouts": 0,
+            "max_waiters": 0,
+        }
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Stable key for a call from its identifying parts (agent, model, prompt...)."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float = None) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                self._stats["max_waiters"] = max(self._stats["max_waiters"], call.waiters)
+
+        if leader:
+            return self._execute(key, call, fn)
+
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self._stats["waiter_timeouts"] += 1
+            raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key[:12]}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _execute(self, key: str, call: _InFlightCall, fn: Callable[[], Any]) -> Any:
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["executions"] += 1
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        calls = stats["calls"] or 1
+        stats["coalesced_ratio"] = round(stats["coalesced"] / calls, 3)
+        return stats
@@ -0,0 +1,293 @@
+# spending_baselines.py - Incremental per-account, per-category spending statistics
+import logging
+import math
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from agents.transaction_ingest import DEFAULT_CHUNK_SIZE, iter_transaction_chunks
+from agents.transaction_rules import as_columns, column_length
+
+logger = logging.getLogger(__name__)
+
+# Below this many observations a baseline is too thin to call anything anomalous
+MIN_HISTORY = 5
+# Floor for the standard deviation so a run of identical amounts doesn't make every change infinite
+MIN_STD = 1.0
+
+
+def batch_zscores(data) -> np.ndarray:
+    """
+    Amount z-scores against each merchant category's distribution within the
+    batch itself; the fallback when no persisted baselines are available.
+    """
+    columns = as_columns(data)
+    if column_length(columns) == 0:
+        return np.zeros(0, dtype=np.float64)
+    _, inverse = np.unique(columns["merchant_category"].astype(str), return_inverse=True)
+    amounts = columns["amount"].astype(np.float64)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, weights=amounts) / counts
+    variances = np.bincount(inverse, weights=(amounts - means[inverse]) ** 2) / np.maximum(counts - 1, 1)
+    zscores = (amounts - means[inverse]) / np.maximum(np.sqrt(variances[inverse]), MIN_STD)
+    zscores[counts[inverse] < MIN_HISTORY] = np.nan
+    return zscores
+
+
+class RunningStats:
+    """Welford running mean/variance; merge() combines two partial aggregates (Chan et al.)."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, count: int, mean: float, m2: float):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def zscore(self, x: float) -> float:
+        return (x - self.mean) / max(self.std, MIN_STD)
+
+
+class SpendingBaselines:
+    """
+    Per (account, merchant category) spending baselines kept in memory and
+    persisted to the spending_baselines SQLite table. Scoring a transaction
+    is one dict lookup plus a Welford update; dirty baselines are flushed in
+    bulk on an interval rather than on every transaction.
+    """
+
+    def __init__(self, threshold: float = 2.5, risk_level: str = "HIGH", db=None,
+                 min_history: int = MIN_HISTORY, flush_interval: float = 60.0):
+        self.threshold = threshold
+        self.risk_level = risk_level
+        self.db = db
+        self.min_history = min_history
+        self.flush_interval = flush_interval
+
+        self._stats: Dict[Tuple[str, str], RunningStats] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flush_thread = None
+
+        self.load()
+
+    @classmethod
+    def from_fraud_patterns(cls, pattern: Dict, **kwargs) -> "SpendingBaselines":
+        """Build from the fraud agent's amount_anomaly pattern config."""
+        return cls(threshold=pattern.get("threshold", 2.5), risk_level=pattern.get("risk_level", "HIGH"), **kwargs)
+
+    def get(self, account_id: str, category: str) -> Optional[RunningStats]:
+        return self._stats.get((account_id, category or ""))
+
+    def score(self, account_id: str, category: str, amount: float, update: bool = True) -> Dict:
+        """
+        Z-score the amount against the baseline as it was *before* this
+        transaction, then fold the transaction into the baseline.
+        Only unusually large amounts are flagged.
+        """
+        key = (account_id, category or "")
+        amount = float(amount)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = RunningStats()
+            history, mean = stats.count, stats.mean
+            zscore = stats.zscore(amount) if history >= self.min_history else None
+            if update:
+                stats.update(amount)
+                self._dirty.add(key)
+
+        anomalous = zscore is not None and zscore > self.threshold
+        return {
+            "merchant_category": key[1],
+            "risk_level": self.risk_level if anomalous else "LOW",
+            "amount_zscore": round(zscore, 2) if zscore is not None else None,
+            "baseline_mean": round(mean, 2),
+            "baseline_count": history,
+            "violations": [f"${amount:,.2f} is {zscore:.1f} standard deviations above this account's "
+                           f"usual {key[1] or 'spending'} (avg ${mean:,.2f})"] if anomalous else [],
+        }
+
+    def zscores(self, data) -> np.ndarray:
+        """Read-only z-scores for a batch against the stored baselines (NaN where history is too thin)."""
+        columns = as_columns(data)
+        zscores = np.full(column_length(columns), np.nan)
+        with self._lock:
+            for i, (account_id, category, amount) in enumerate(zip(columns["account_id"].tolist(),
+                                                                   columns["merchant_category"].tolist(),
+                                                                   columns["amount"].tolist())):
+                stats = self._stats.get((account_id, category))
+                if stats is not None and stats.count >= self.min_history:
+                    zscores[i] = stats.zscore(amount)
+        return zscores
+
+    def update_columns(self, data) -> int:
+        """
+        Fold a batch of transactions into the baselines. Each batch is reduced
+        to per-group (count, mean, M2) with NumPy and merged, so the per-row
+        work is vectorized.
+        """
+        columns = as_columns(data)
+        n = column_length(columns)
+        if n == 0:
+            return 0
+
+        keys = np.char.add(np.char.add(columns["account_id"].astype(str), "\x1f"),
+                           columns["merchant_category"].astype(str))
+        groups, inverse = np.unique(keys, return_inverse=True)
+        amounts = columns["amount"].astype(np.float64)
+        counts = np.bincount(inverse, minlength=len(groups))
+        means = np.bincount(inverse, weights=amounts, minlength=len(groups)) / counts
+        m2s = np.bincount(inverse, weights=(amounts - means[inverse]) ** 2, minlength=len(groups))
+
+        with self._lock:
+            for group, count, mean, m2 in zip(groups.tolist(), counts.tolist(), means.tolist(), m2s.tolist()):
+                key = tuple(group.split("\x1f", 1))
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = RunningStats()
+                stats.merge(count, mean, m2)
+                self._dirty.add(key)
+        return n
+
+    def rebuild_from_file(self, file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, reset: bool = True) -> Dict:
+        """Backfill baselines from a historical transaction file, streaming it in chunks."""
+        start = time.perf_counter()
+        if reset:
+            with self._lock:
+                self._stats.clear()
+                self._dirty.clear()
+            if self.db:
+                self.db.clear_spending_baselines()
+
+        transactions = 0
+        for chunk in iter_transaction_chunks(file_path, chunk_size):
+            transactions += self.update_columns(chunk)
+        saved = self.flush()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "transactions": transactions,
+            "baselines": len(self._stats),
+            "saved": saved,
+            "elapsed_s": round(elapsed, 3),
+            "tx_per_s": round(transactions / elapsed) if elapsed else None,
+        }
+
+    def rebuild_from_store(self, store, months=None, reset: bool = True) -> Dict:
+        """Backfill baselines from the columnar TransactionStore, mapping only the three columns needed."""
+        start = time.perf_counter()
+        if reset:
+            with self._lock:
+                self._stats.clear()
+                self._dirty.clear()
+            if self.db:
+                self.db.clear_spending_baselines()
+
+        transactions = 0
+        for segment in store.scan(["account_id", "merchant_category", "amount"], months=months):
+            transactions += self.update_columns(segment)
+        saved = self.flush()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "transactions": transactions,
+            "baselines": len(self._stats),
+            "saved": saved,
+            "elapsed_s": round(elapsed, 3),
+            "tx_per_s": round(transactions / elapsed) if elapsed else None,
+        }
+
+    # --- Persistence ---
+
+    def load(self) -> int:
+        if not self.db:
+            return 0
+        try:
+            rows = self.db.get_spending_baselines()
+        except Exception as e:
+            logger.warning(f"Could not load spending baselines: {e}")
+            return 0
+        with self._lock:
+            for account_id, category, count, mean, m2 in rows:
+                self._stats[(account_id, category)] = RunningStats(count, mean, m2)
+        return len(rows)
+
+    def flush(self) -> int:
+        """Write baselines changed since the last flush; returns the number written."""
+        with self._lock:
+            rows = [(k[0], k[1], s.count, s.mean, s.m2) for k in self._dirty for s in (self._stats[k],)]
+            self._dirty.clear()
+        if not rows or not self.db:
+            return 0
+        try:
+            return self.db.upsert_spending_baselines(rows)
+        except Exception:
+            with self._lock:
+                self._dirty.update((r[0], r[1]) for r in rows)
+            raise
+
+    def start_flushing(self):
+        """Flush dirty baselines in a daemon thread every flush_interval seconds."""
+        if self._flush_thread and self._flush_thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"Spending baseline flush failed: {e}")
+
+        self._stop.clear()
+        self._flush_thread = threading.Thread(target=run, name="baseline-flush", daemon=True)
+        self._flush_thread.start()
+
+    def stop(self) -> int:
+        """Stop the flush thread and write any remaining changes."""
+        self._stop.set()
+        return self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "baselines": len(self._stats),
+            "pending_flush": len(self._dirty),
+            "threshold_std": self.threshold,
+            "min_history": self.min_history,
+        }
+
+
+if __name__ == "__main__":
+    # Bulk rebuild job: python -m agents.spending_baselines <transactions file> [chunk_size]
+    if len(sys.argv) < 2:
+        print("Usage: python -m agents.spending_baselines <transactions file> [chunk_size]")
+        sys.exit(1)
+
+    from database.sqlite_helper import SQLiteHelper
+
+    baselines = SpendingBaselines(db=SQLiteHelper())
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CHUNK_SIZE
+    print(baselines.rebuild_from_file(sys.argv[1], chunk_size=chunk_size))
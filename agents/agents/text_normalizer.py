@@ -0,0 +1,101 @@
+# text_normalizer.py - Undo homoglyph, leetspeak and spacing tricks before keyword matching
+import re
+import time
+import unicodedata
+from typing import Dict, Iterable, List
+
+# Look-alike letters from other scripts -> ASCII (NFKC already folds full-width and styled letters)
+CONFUSABLES = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p",
+    "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ї": "i", "ј": "j", "ѕ": "s", "ԁ": "d",
+    "ɡ": "g", "ӏ": "l", "ԛ": "q", "ԝ": "w",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p",
+    "τ": "t", "υ": "u", "χ": "x", "ω": "w",
+    # Latin look-alikes
+    "ı": "i", "ł": "l", "ø": "o", "ß": "ss",
+}
+# Invisible characters used to split words (zero-width spaces inside "gift")
+INVISIBLE = "\u00ad\u200b\u200c\u200d\u2060\ufeff"
+
+LEET = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b",
+        "@": "a", "$": "s", "!": "i", "|": "l"}
+
+_TRANSLATION = str.maketrans({**CONFUSABLES, **{ch: None for ch in INVISIBLE}})
+_LEET_TRANSLATION = str.maketrans(LEET)
+
+# Three or more single characters separated by spaces/dots/dashes: "c a r d", "g.i.f.t"
+_SPACED_OUT = re.compile(r"(?<![\w@$|])[a-z0-9@$|](?:[ .\-_*]+[a-z0-9@$|](?![\w@$|])){2,}")
+_SPACED_SEPARATORS = re.compile(r"[ .\-_*]+")
+# Words containing leet characters: "g1ft", "b!tcoin", "p@yment" (plain words never reach the callback)
+_LEET_WORD = re.compile(r"[a-z0-9@$!|]*[013-578@$!|][a-z0-9@$!|]*")
+_LEET_CHARS = re.compile(r"[013-578@$!|]")
+
+
+def _join_spaced(match: re.Match) -> str:
+    return _SPACED_SEPARATORS.sub("", match.group(0))
+
+
+def _unleet(match: re.Match) -> str:
+    word = match.group(0)
+    if "@" in word and match.string[match.end():match.end() + 1] == ".":
+        return word  # an email address, not "p@yment"
+    core = word.rstrip("!")  # sentence punctuation, not leetspeak
+    leet = len(_LEET_CHARS.findall(core))
+    # "401k" or "24x7" are mostly digits; only de-leet words with more letters than leet characters
+    if leet == 0 or sum(ch.isalpha() for ch in core) <= leet:
+        return word
+    return core.translate(_LEET_TRANSLATION) + word[len(core):]
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form of a message for keyword matching: NFKC, lowercase,
+    confusables folded, invisible characters dropped, spaced-out letters
+    joined and leetspeak words decoded. Every step is a single linear pass.
+    'Buy a G1FT c a r d' -> 'buy a gift card', 'ＩＲＳ' -> 'irs'.
+    """
+    if not text:
+        return ""
+    if text.isascii():
+        text = text.lower()  # nothing for NFKC or the confusables table to fold
+    else:
+        text = unicodedata.normalize("NFKC", text).lower().translate(_TRANSLATION)
+    text = " ".join(text.split())
+    text = _SPACED_OUT.sub(_join_spaced, text)
+    return _LEET_WORD.sub(_unleet, text)
+
+
+def compile_keywords(keywords: Iterable[str]) -> re.Pattern:
+    """
+    One substring pattern for a keyword list. Multi-word keywords also match
+    with the spaces removed, since de-spacing turns 'g i f t c a r d' into 'giftcard'.
+    """
+    alternatives = sorted({re.escape(k.lower()).replace(r"\ ", " ?") for k in keywords}, key=len, reverse=True)
+    return re.compile("|".join(alternatives))
+
+
+def benchmark(messages: List[str] = None, repeat: int = 20_000) -> Dict:
+    """Per-message normalization cost in microseconds."""
+    messages = messages or [
+        "This is the ＩＲＳ. Pay the overdue tax with a g1ft c a r d today or face arrest!",
+        "Congratulations, you w0n the lottery! Send b!tcoin to claim your pr1ze.",
+        "Hi grandma, it's me. I need help, can you wire transfer 5000 dollars? Don't tell mom.",
+        "Your Micrоsоft computer has a v1rus, call tech support for remote access now",
+    ]
+    start = time.perf_counter()
+    for i in range(repeat):
+        normalize_text(messages[i % len(messages)])
+    elapsed = time.perf_counter() - start
+    avg_chars = sum(len(m) for m in messages) / len(messages)
+    return {
+        "messages": repeat,
+        "avg_chars": round(avg_chars),
+        "us_per_message": round(elapsed / repeat * 1e6, 2),
+        "samples": {m: normalize_text(m) for m in messages},
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,271 @@
+# text_rules.py - Declarative fraud text rules compiled into a single-pass matcher
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from agents.text_normalizer import compile_keywords, normalize_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEXT_RULES_PATH = os.path.join(os.path.dirname(__file__), "data", "text_rules.json")
+# Seconds between checks of the rule file's mtime; 0 disables hot reload
+RELOAD_INTERVAL = float(os.getenv("TEXT_RULES_RELOAD_INTERVAL", "5"))
+
+RISK_ORDER = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+
+@dataclass(frozen=True)
+class TextRule:
+    id: str
+    required: int  # bitmask of keyword sets that must all be present
+    risk_level: str
+    indicator: str
+    actions: Tuple[str, ...]
+
+
+class CompiledTextRules:
+    """
+    An immutable, compiled rule table. Every keyword of every set goes into
+    one prefix-trie regex, wrapped in a lookahead so overlapping keywords are
+    all seen; each keyword maps to a bitmask of the sets it (and any keyword
+    it contains) belongs to. One scan of the text yields the mask of present
+    sets, and a rule fires when its required bits are all set.
+    """
+
+    def __init__(self, data: Dict, source: str = None):
+        self.version = data.get("version")
+        self.source = source
+        keyword_sets = data.get("keyword_sets", {})
+        self.keyword_sets = {name: tuple(keywords) for name, keywords in keyword_sets.items()}
+        self.set_bits = {name: 1 << i for i, name in enumerate(keyword_sets)}
+
+        # Keys have spaces removed: multi-word keywords also match de-spaced text ("giftcard")
+        owners: Dict[str, int] = {}
+        for name, keywords in keyword_sets.items():
+            for keyword in keywords:
+                compact = keyword.lower().replace(" ", "")
+                owners[compact] = owners.get(compact, 0) | self.set_bits[name]
+        # A match on "payment" is also a match on "pay"; fold contained keywords into each mask
+        self.keyword_masks = {
+            keyword: mask | _contained_masks(keyword, owners) for keyword, mask in owners.items()
+        }
+
+        spellings = {keyword.lower() for keywords in keyword_sets.values() for keyword in keywords}
+        self.pattern = re.compile("(?=(" + _trie_pattern(spellings) + "))") if spellings else None
+
+        self.rules: List[TextRule] = []
+        for entry in data.get("rules", []):
+            missing = [name for name in entry["all_of"] if name not in self.set_bits]
+            if missing:
+                raise ValueError(f"Rule {entry['id']!r} uses unknown keyword sets: {missing}")
+            if entry["risk_level"] not in RISK_ORDER:
+                raise ValueError(f"Rule {entry['id']!r} has unknown risk level {entry['risk_level']!r}")
+            required = 0
+            for name in entry["all_of"]:
+                required |= self.set_bits[name]
+            self.rules.append(TextRule(
+                id=entry["id"],
+                required=required,
+                risk_level=entry["risk_level"],
+                indicator=entry["indicator"],
+                actions=tuple(entry.get("actions", [])),
+            ))
+        self.all_bits = sum(self.set_bits.values())
+
+    def present_sets(self, normalized: str) -> int:
+        """Bitmask of keyword sets with at least one keyword in the normalized text."""
+        mask = 0
+        if self.pattern is None:
+            return mask
+        keyword_masks = self.keyword_masks
+        for match in self.pattern.finditer(normalized):
+            mask |= keyword_masks[match.group(1).replace(" ", "")]
+            if mask == self.all_bits:
+                break
+        return mask
+
+    def evaluate(self, normalized: str) -> List[TextRule]:
+        """Rules that fire on the normalized text, in table order."""
+        mask = self.present_sets(normalized)
+        return [rule for rule in self.rules if rule.required & mask == rule.required]
+
+
+def _trie_pattern(words) -> str:
+    """
+    Regex for a word list factored into a prefix trie ('pay(?:ment)?'), so
+    each text position branches on its first character instead of trying
+    every keyword. Optional suffixes are greedy: the longest keyword wins.
+    """
+    root: Dict = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [(" ?" if ch == " " else re.escape(ch)) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        ends_here = "" in node
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if ends_here else "")
+
+    return build(root)
+
+
+def _contained_masks(keyword: str, owners: Dict[str, int]) -> int:
+    mask = 0
+    for other, other_mask in owners.items():
+        if other != keyword and other in keyword:
+            mask |= other_mask
+    return mask
+
+
+class TextRuleEngine:
+    """
+    Loads the rule table from a JSON data file and hot-reloads it when the
+    file changes. A reload compiles a complete new table and swaps it in with
+    one assignment, so a request evaluates against either the old or the new
+    table, never a mix; a table that fails to compile is logged and ignored.
+    """
+
+    def __init__(self, path: str = None, reload_interval: float = RELOAD_INTERVAL):
+        self.path = path or os.getenv("TEXT_RULES_PATH", DEFAULT_TEXT_RULES_PATH)
+        self.reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self.reloads = 0
+        self.table: CompiledTextRules = None
+        self.load()
+
+    def load(self) -> CompiledTextRules:
+        """Compile the data file and swap it in."""
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "r", encoding="utf-8") as f:
+            table = CompiledTextRules(json.load(f), source=self.path)
+        self.table = table
+        self._mtime = mtime
+        return table
+
+    def maybe_reload(self) -> bool:
+        """Reload if the data file changed; checked at most once per reload_interval."""
+        now = time.monotonic()
+        if not self.reload_interval or now < self._next_check:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False  # another request is already checking
+        try:
+            self._next_check = now + self.reload_interval
+            if os.path.getmtime(self.path) == self._mtime:
+                return False
+            self.load()
+            self.reloads += 1
+            logger.info(f"Reloaded text rules from {self.path} (version {self.table.version})")
+            return True
+        except Exception as e:
+            logger.warning(f"Keeping current text rules, reload of {self.path} failed: {e}")
+            return False
+        finally:
+            self._reload_lock.release()
+
+    def analyze(self, text: str, normalized: str = None) -> Dict:
+        """Risk level, indicators and actions for a message under the current rule table."""
+        self.maybe_reload()
+        table = self.table
+        fired = table.evaluate(normalized if normalized is not None else normalize_text(text))
+
+        risk_level = "LOW"
+        actions = []
+        for rule in fired:
+            if RISK_ORDER[rule.risk_level] > RISK_ORDER[risk_level]:
+                risk_level = rule.risk_level
+            actions.extend(rule.actions)
+        return {
+            "risk_level": risk_level,
+            "risk_indicators": [rule.indicator for rule in fired],
+            "actions": actions,
+            "rules": [rule.id for rule in fired],
+        }
+
+    def stats(self) -> Dict:
+        table = self.table
+        return {
+            "path": self.path,
+            "version": table.version,
+            "rules": len(table.rules),
+            "keyword_sets": len(table.set_bits),
+            "keywords": len(table.keyword_masks),
+            "reloads": self.reloads,
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_text_rules() -> TextRuleEngine:
+    """Process-wide text rule engine, loaded on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = TextRuleEngine()
+    return _engine
+
+
+def benchmark(messages: List[str] = None, repeat: int = 20_000) -> Dict:
+    """
+    Cost of the single-pass matcher per message, against evaluating each rule
+    on its own with one search per keyword set (the old if/any chain).
+    """
+    messages = [normalize_text(m) for m in messages or [
+        "This is the IRS. Pay the overdue tax with a gift card today or face arrest!",
+        "Congratulations, you won the lottery! Send bitcoin to claim your prize.",
+        "Your computer has a virus, call tech support for remote access now",
+        "I received a letter asking me to pay 2 lakh rupees to release my pension",
+        "Hi grandma, just checking in. See you at lunch on Sunday.",
+    ]]
+    table = get_text_rules().table
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        table.evaluate(messages[i % len(messages)])
+    combined = time.perf_counter() - start
+
+    set_patterns = {table.set_bits[name]: compile_keywords(keywords) for name, keywords in table.keyword_sets.items()}
+
+    per_rule = []
+    for rule in table.rules:
+        bits = [bit for bit in table.set_bits.values() if rule.required & bit]
+        hits = 0
+        start = time.perf_counter()
+        for i in range(repeat):
+            text = messages[i % len(messages)]
+            hits += all(set_patterns[bit].search(text) for bit in bits)
+        elapsed = time.perf_counter() - start
+        per_rule.append({"rule": rule.id, "us_per_message": round(elapsed / repeat * 1e6, 2),
+                         "hit_rate": round(hits / repeat, 2)})
+
+    return {
+        "messages": repeat,
+        "rules": len(table.rules),
+        "combined_us_per_message": round(combined / repeat * 1e6, 2),
+        "separate_us_per_message": round(sum(r["us_per_message"] for r in per_rule), 2),
+        "per_rule": per_rule,
+    }
+
+
+if __name__ == "__main__":
+    result = benchmark()
+    for row in result.pop("per_rule"):
+        print(row)
+    print(result)
@@ -0,0 +1,109 @@
+# transaction_ingest.py - Streaming, bounded-memory transaction file readers
+import csv
+import json
+import os
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from agents.transaction_rules import columns_from_records
+
+DEFAULT_CHUNK_SIZE = 50_000
+READ_BLOCK_SIZE = 1 << 16  # 64 KiB
+
+
+def detect_format(file_path: str) -> str:
+    """Pick a reader from the extension, sniffing the first byte for .json files."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ndjson", ".jsonl"):
+        return "ndjson"
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        while True:
+            ch = f.read(1)
+            if not ch or not ch.isspace():
+                break
+    return "json_array" if ch == "[" else "ndjson"
+
+
+def iter_ndjson(file_path: str) -> Iterator[Dict]:
+    """One JSON object per line; blank lines are skipped."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_json_array(file_path: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[Dict]:
+    """
+    Incrementally decode a top-level JSON array of objects.
+    Only the current read block plus one partial element is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8") as f:
+        buffer, pos, eof = "", 0, False
+        started = False
+        while True:
+            # Skip separators, refilling the buffer when it runs dry
+            while True:
+                while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ",")):
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = f.read(block_size), 0
+                eof = not buffer
+
+            if pos >= len(buffer):
+                if started:
+                    raise ValueError(f"{file_path}: unterminated JSON array")
+                return
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{file_path} is not a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Element spans the block boundary: keep the tail and read more
+                block = f.read(block_size)
+                eof = not block
+                buffer, pos = buffer[pos:] + block, 0
+                continue
+            yield record
+
+
+def iter_csv(file_path: str) -> Iterator[Dict]:
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def iter_transaction_records(file_path: str) -> Iterator[Dict]:
+    """Stream transaction dicts from NDJSON, a JSON array or CSV."""
+    fmt = detect_format(file_path)
+    if fmt == "csv":
+        return iter_csv(file_path)
+    if fmt == "json_array":
+        return iter_json_array(file_path)
+    return iter_ndjson(file_path)
+
+
+def iter_transaction_chunks(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, np.ndarray]]:
+    """Yield fixed-size columnar chunks ready for the rule engine."""
+    batch: List[Dict] = []
+    for record in iter_transaction_records(file_path):
+        batch.append(record)
+        if len(batch) >= chunk_size:
+            yield columns_from_records(batch)
+            batch = []
+    if batch:
+        yield columns_from_records(batch)
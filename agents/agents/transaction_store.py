@@ -0,0 +1,261 @@
+# transaction_store.py - Columnar on-disk transaction store with memory-mapped reads
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+from agents.transaction_ingest import DEFAULT_CHUNK_SIZE, iter_transaction_chunks
+from agents.transaction_rules import TRANSACTION_COLUMNS, as_columns, column_length
+
+DEFAULT_STORE_PATH = os.path.join(os.getenv('DATA_DIR', 'data'), 'transactions')
+ACCOUNT_BUCKETS = 64
+MANIFEST = "_manifest.json"
+# Per-partition lock file serializing manifest updates across processes
+LOCK_FILE = "_manifest.lock"
+# Low-cardinality text columns are dictionary-encoded: <name>.codes.npy indexes <name>.values.npy
+CATEGORICAL_COLUMNS = ("merchant_name", "merchant_category", "channel")
+
+
+def account_bucket(account_id: str, buckets: int = ACCOUNT_BUCKETS) -> int:
+    return zlib.crc32(str(account_id).encode("utf-8")) % buckets
+
+
+def transaction_month(timestamp: str) -> str:
+    """YYYY-MM from an ISO timestamp, 'unknown' when it can't be read."""
+    timestamp = str(timestamp)
+    if len(timestamp) >= 7 and timestamp[4] == "-" and timestamp[:4].isdigit() and timestamp[5:7].isdigit():
+        return timestamp[:7]
+    return "unknown"
+
+
+class TransactionStore:
+    """
+    Transactions stored column-per-file (.npy) under
+    month=YYYY-MM/bucket=NN/<segment>/, where the bucket is a hash of the
+    account; categorical text columns are dictionary-encoded. Each
+    partition's _manifest.json lists its live segments and is replaced
+    atomically, so readers never see a half-written append or compaction.
+    Writers take an flock on the partition's _manifest.lock around the
+    manifest read-modify-write, so appends and compactions from separate
+    processes cannot drop each other's segments. Reads memory-map only the
+    requested columns and partitions.
+    """
+
+    def __init__(self, root: str = None, buckets: int = ACCOUNT_BUCKETS):
+        self.root = root or DEFAULT_STORE_PATH
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    # --- Layout helpers ---
+
+    def _partition_dir(self, month: str, bucket: int) -> str:
+        return os.path.join(self.root, f"month={month}", f"bucket={bucket:02d}")
+
+    @contextmanager
+    def _partition_lock(self, partition: str):
+        """Exclusive lock on a partition's manifest, within this process and across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(partition, exist_ok=True)
+            with open(os.path.join(partition, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_manifest(self, partition: str) -> List[str]:
+        try:
+            with open(os.path.join(partition, MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)["segments"]
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, partition: str, segments: List[str]):
+        tmp_path = os.path.join(partition, f"{MANIFEST}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segments": segments}, f)
+        os.replace(tmp_path, os.path.join(partition, MANIFEST))
+
+    def _write_segment(self, partition: str, columns: Dict[str, np.ndarray]) -> str:
+        """Write a segment under a temporary name and rename it into place."""
+        os.makedirs(partition, exist_ok=True)
+        name = f"seg-{time.time_ns()}-{os.getpid()}"
+        tmp_dir = os.path.join(partition, f".{name}.tmp")
+        os.makedirs(tmp_dir)
+        for column, values in columns.items():
+            if column in CATEGORICAL_COLUMNS:
+                dictionary, codes = np.unique(values, return_inverse=True)
+                np.save(os.path.join(tmp_dir, f"{column}.values.npy"), dictionary)
+                np.save(os.path.join(tmp_dir, f"{column}.codes.npy"), codes.astype(np.int32))
+            else:
+                np.save(os.path.join(tmp_dir, f"{column}.npy"), np.ascontiguousarray(values))
+        os.replace(tmp_dir, os.path.join(partition, name))
+        return name
+
+    def partitions(self, months: Iterable[str] = None, accounts: Iterable[str] = None) -> List[str]:
+        """Partition directories matching the month and account filters."""
+        wanted_buckets = None if accounts is None else {account_bucket(a, self.buckets) for a in accounts}
+        month_dirs = (sorted(d for d in os.listdir(self.root) if d.startswith("month="))
+                      if months is None else [f"month={m}" for m in months])
+        result = []
+        for month_dir in month_dirs:
+            month_path = os.path.join(self.root, month_dir)
+            if not os.path.isdir(month_path):
+                continue
+            for bucket_dir in sorted(os.listdir(month_path)):
+                if wanted_buckets is None or int(bucket_dir.split("=", 1)[1]) in wanted_buckets:
+                    result.append(os.path.join(month_path, bucket_dir))
+        return result
+
+    # --- Writes ---
+
+    def append(self, data) -> int:
+        """Append transactions, one new segment per (month, account bucket) they touch."""
+        columns = as_columns(data)
+        n = column_length(columns)
+        if n == 0:
+            return 0
+
+        columns = {name: columns[name].astype(np.float64 if kind is float else str)
+                   for name, kind in TRANSACTION_COLUMNS.items()}
+        months = np.array([transaction_month(t) for t in columns["timestamp"].tolist()])
+        buckets = np.fromiter((account_bucket(a, self.buckets) for a in columns["account_id"].tolist()),
+                              dtype=np.int32, count=n)
+        keys = np.char.add(np.char.add(months, "/"), buckets.astype(str))
+        groups, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(groups) + 1))
+
+        for group_index, key in enumerate(groups.tolist()):
+            month, bucket = key.split("/")
+            rows = order[bounds[group_index]:bounds[group_index + 1]]
+            partition = self._partition_dir(month, int(bucket))
+            # The segment is invisible until listed, so only the manifest update needs the lock
+            segment = self._write_segment(partition, {name: values[rows] for name, values in columns.items()})
+            with self._partition_lock(partition):
+                self._write_manifest(partition, self._read_manifest(partition) + [segment])
+        return n
+
+    def ingest_file(self, file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Stream a transaction file (NDJSON, JSON array or CSV) into the store."""
+        return sum(self.append(chunk) for chunk in iter_transaction_chunks(file_path, chunk_size))
+
+    def compact(self, min_segments: int = 2) -> Dict:
+        """Merge each partition's segments into one, sorted by account and time."""
+        merged_partitions = removed_segments = 0
+        for partition in self.partitions():
+            with self._partition_lock(partition):
+                segments = self._read_manifest(partition)
+                if len(segments) < min_segments:
+                    continue
+                parts = [self._load_segment(partition, segment, list(TRANSACTION_COLUMNS)) for segment in segments]
+                columns = {name: np.concatenate([part[name] for part in parts]) for name in TRANSACTION_COLUMNS}
+                order = np.lexsort((columns["timestamp"], columns["account_id"]))
+                segment = self._write_segment(partition, {name: values[order] for name, values in columns.items()})
+                self._write_manifest(partition, [segment])
+            del parts, columns
+
+            # scan() maps all of a partition's segments before yielding any, so readers either hold
+            # mappings of the old files (which survive the unlink) or will read the new manifest
+            for old in segments:
+                shutil.rmtree(os.path.join(partition, old), ignore_errors=True)
+            merged_partitions += 1
+            removed_segments += len(segments)
+        return {"partitions_compacted": merged_partitions, "segments_merged": removed_segments}
+
+    # --- Reads ---
+
+    @staticmethod
+    def _load_column(path: str, name: str) -> np.ndarray:
+        """Memory-map one column; dictionary-encoded columns are decoded with a single gather."""
+        if name in CATEGORICAL_COLUMNS:
+            dictionary = np.load(os.path.join(path, f"{name}.values.npy"))
+            return dictionary[np.load(os.path.join(path, f"{name}.codes.npy"), mmap_mode="r")]
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+    def _load_segment(self, partition: str, segment: str, columns: List[str]) -> Dict[str, np.ndarray]:
+        path = os.path.join(partition, segment)
+        return {name: self._load_column(path, name) for name in columns}
+
+    def _load_partition(self, partition: str, columns: List[str], attempts: int = 5) -> List[Dict[str, np.ndarray]]:
+        """
+        Map every live segment of a partition. A compaction can delete the
+        segments between reading the manifest and opening them; the manifest
+        is then re-read, since nothing from the partition has been returned yet.
+        """
+        for attempt in range(attempts):
+            try:
+                return [self._load_segment(partition, segment, columns) for segment in self._read_manifest(partition)]
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+        return []
+
+    def scan(self, columns: List[str] = None, months: Iterable[str] = None,
+             accounts: Iterable[str] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Yield one column dict per segment, memory-mapped and holding only the
+        requested columns. An account filter prunes partitions, then rows.
+        Each partition's segments are all mapped before the first is yielded,
+        so a compaction while the caller iterates cannot pull files away.
+        """
+        columns = list(columns or TRANSACTION_COLUMNS)
+        accounts = None if accounts is None else list(accounts)
+        load = columns if accounts is None or "account_id" in columns else columns + ["account_id"]
+        for partition in self.partitions(months, accounts):
+            for data in self._load_partition(partition, load):
+                if accounts is not None:
+                    mask = np.isin(data["account_id"], accounts)
+                    if not mask.any():
+                        continue
+                    data = {name: data[name][mask] for name in columns}
+                yield data
+
+    def read(self, columns: List[str] = None, months: Iterable[str] = None,
+             accounts: Iterable[str] = None) -> Dict[str, np.ndarray]:
+        """Concatenate a scan into one column dict."""
+        columns = list(columns or TRANSACTION_COLUMNS)
+        parts = list(self.scan(columns, months, accounts))
+        if not parts:
+            return {name: np.zeros(0, dtype=np.float64 if TRANSACTION_COLUMNS.get(name) is float else str)
+                    for name in columns}
+        return {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+    def stats(self) -> Dict:
+        partitions = self.partitions()
+        segments = rows = size = 0
+        for partition in partitions:
+            for segment in self._read_manifest(partition):
+                segments += 1
+                path = os.path.join(partition, segment)
+                rows += len(np.load(os.path.join(path, "amount.npy"), mmap_mode="r"))
+                size += sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        return {"partitions": len(partitions), "segments": segments, "transactions": rows, "bytes": size}
+
+
+if __name__ == "__main__":
+    # python -m agents.transaction_store ingest <file> | compact | stats
+    store = TransactionStore()
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "ingest" and len(sys.argv) > 2:
+        print({"ingested": store.ingest_file(sys.argv[2])})
+    elif command == "compact":
+        print(store.compact())
+    else:
+        print(store.stats())
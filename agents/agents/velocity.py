@@ -0,0 +1,267 @@
+# velocity.py - Real-time per-account velocity scoring over sliding windows
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.getenv('DATA_DIR', 'data'), 'velocity_snapshot.json')
+LOCK_SHARDS = 16
+# Transactions stamped further than this into the future are scored at the current time instead
+MAX_CLOCK_SKEW_SECONDS = 300
+
+
+def to_epoch_seconds(timestamp: Union[None, int, float, str, datetime]) -> float:
+    """Accept epoch seconds, an ISO-8601 string or a datetime; default to now."""
+    if timestamp is None or timestamp == "":
+        return time.time()
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+
+
+class _AccountWindow:
+    """Fixed ring of time buckets holding transaction counts and amounts."""
+
+    __slots__ = ("counts", "amounts", "last_bucket", "total_count", "total_amount")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.amounts = [0.0] * buckets
+        self.last_bucket = None
+        self.total_count = 0
+        self.total_amount = 0.0
+
+    def advance(self, bucket: int):
+        """Expire buckets that fell out of the window; at most one pass over the ring."""
+        n = len(self.counts)
+        if self.last_bucket is None or bucket - self.last_bucket >= n:
+            self.counts = [0] * n
+            self.amounts = [0.0] * n
+            self.total_count = 0
+            self.total_amount = 0.0
+        else:
+            for b in range(self.last_bucket + 1, bucket + 1):
+                idx = b % n
+                self.total_count -= self.counts[idx]
+                self.total_amount -= self.amounts[idx]
+                self.counts[idx] = 0
+                self.amounts[idx] = 0.0
+        self.last_bucket = bucket
+
+    def add(self, bucket: int, amount: float) -> bool:
+        """Record a transaction; returns False if it is older than the whole window."""
+        n = len(self.counts)
+        if self.last_bucket is None or bucket > self.last_bucket:
+            self.advance(bucket)
+        elif bucket <= self.last_bucket - n:
+            return False
+        idx = bucket % n
+        self.counts[idx] += 1
+        self.amounts[idx] += amount
+        self.total_count += 1
+        self.total_amount += amount
+        return True
+
+
+class VelocityScorer:
+    """
+    Scores each incoming transaction against per-account hourly count and
+    amount limits. Windows are bucketed ring buffers (default 60 x 1 minute),
+    so scoring is O(1) per transaction and memory is constant per account.
+    Future timestamps beyond MAX_CLOCK_SKEW_SECONDS are clamped to now, so a
+    bad clock cannot push a window ahead and wipe its history. Transactions
+    older than the whole window (relative to now or to the account's latest
+    transaction) are not counted and come back with in_window False. State
+    is snapshotted to disk periodically and reloaded on start-up; each
+    snapshot also evicts accounts with nothing left in their window.
+    """
+
+    def __init__(self, max_transactions_per_hour: int = 5, max_amount_per_hour: float = 5000.0,
+                 risk_level: str = "HIGH", window_seconds: int = 3600, bucket_seconds: int = 60,
+                 snapshot_path: str = None, snapshot_interval: float = 60.0):
+        self.max_transactions = max_transactions_per_hour
+        self.max_amount = max_amount_per_hour
+        self.risk_level = risk_level
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.buckets = max(1, window_seconds // bucket_seconds)
+        self.snapshot_path = snapshot_path or DEFAULT_SNAPSHOT_PATH
+        self.snapshot_interval = snapshot_interval
+
+        self._shards: List[Dict[str, _AccountWindow]] = [{} for _ in range(LOCK_SHARDS)]
+        self._locks = [threading.Lock() for _ in range(LOCK_SHARDS)]
+        self._stop = threading.Event()
+        self._snapshot_thread = None
+        # The snapshot thread and stop() both save; one writer at a time owns the .tmp file
+        self._save_lock = threading.Lock()
+        # Per-shard counters, updated under the shard lock
+        self._scored = [0] * LOCK_SHARDS
+        self._flagged = [0] * LOCK_SHARDS
+        self._clamped = [0] * LOCK_SHARDS
+        self._stale = [0] * LOCK_SHARDS
+        self.evicted = 0
+
+        self.load_snapshot()
+
+    @classmethod
+    def from_fraud_patterns(cls, pattern: Dict, **kwargs) -> "VelocityScorer":
+        """Build a scorer from the fraud agent's velocity_fraud pattern config."""
+        return cls(max_transactions_per_hour=pattern.get("max_transactions_per_hour", 5),
+                   max_amount_per_hour=pattern.get("max_amount_per_hour", 5000.0),
+                   risk_level=pattern.get("risk_level", "HIGH"), **kwargs)
+
+    def _shard(self, account_id: str) -> int:
+        return hash(account_id) % LOCK_SHARDS
+
+    def score(self, account_id: str, amount: float, timestamp=None) -> Dict:
+        """Add the transaction to its account window and score it against the limits."""
+        started = time.perf_counter()
+        epoch, now = to_epoch_seconds(timestamp), time.time()
+        clamped = epoch > now + MAX_CLOCK_SKEW_SECONDS
+        if clamped:
+            epoch = now
+        bucket = int(epoch // self.bucket_seconds)
+        shard = self._shard(account_id)
+
+        expired = bucket <= int(now // self.bucket_seconds) - self.buckets
+
+        with self._locks[shard]:
+            window = self._shards[shard].get(account_id)
+            if window is None and not expired:
+                window = self._shards[shard][account_id] = _AccountWindow(self.buckets)
+            in_window = window is not None and not expired and window.add(bucket, float(amount))
+            count, total = (window.total_count, window.total_amount) if window is not None else (0, 0.0)
+            flagged = in_window and (count > self.max_transactions or total > self.max_amount)
+            self._scored[shard] += in_window
+            self._stale[shard] += not in_window
+            self._flagged[shard] += flagged
+            self._clamped[shard] += clamped
+
+        violations = []
+        if in_window and count > self.max_transactions:
+            violations.append(f"{count} transactions in the last hour (limit {self.max_transactions})")
+        if in_window and total > self.max_amount:
+            violations.append(f"${total:,.2f} spent in the last hour (limit ${self.max_amount:,.2f})")
+
+        return {
+            "account_id": account_id,
+            "risk_level": self.risk_level if violations else "LOW",
+            "velocity_score": round(max(count / self.max_transactions, total / self.max_amount), 3),
+            "transactions_in_window": count,
+            "amount_in_window": round(total, 2),
+            "violations": violations,
+            "in_window": in_window,
+            "latency_us": round((time.perf_counter() - started) * 1e6, 1),
+        }
+
+    def account_window(self, account_id: str) -> Optional[Dict]:
+        shard = self._shard(account_id)
+        with self._locks[shard]:
+            window = self._shards[shard].get(account_id)
+            if window is None:
+                return None
+            window.advance(max(window.last_bucket, int(time.time() // self.bucket_seconds)))
+            return {"transactions": window.total_count, "amount": round(window.total_amount, 2)}
+
+    # --- Persistence ---
+
+    def save_snapshot(self) -> int:
+        """
+        Write all windows to disk atomically, evicting accounts whose window
+        has emptied; returns the number of accounts saved.
+        """
+        with self._save_lock:
+            return self._save_snapshot()
+
+    def _save_snapshot(self) -> int:
+        accounts = {}
+        current_bucket = int(time.time() // self.bucket_seconds)
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                idle = []
+                for account_id, window in shard.items():
+                    window.advance(max(window.last_bucket, current_bucket))
+                    if window.total_count:
+                        accounts[account_id] = [window.last_bucket, list(window.counts), list(window.amounts)]
+                    else:
+                        idle.append(account_id)
+                for account_id in idle:
+                    del shard[account_id]
+                self.evicted += len(idle)
+
+        snapshot = {"bucket_seconds": self.bucket_seconds, "buckets": self.buckets,
+                    "saved_at": time.time(), "accounts": accounts}
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, self.snapshot_path)
+        return len(accounts)
+
+    def load_snapshot(self) -> int:
+        """Restore windows saved by save_snapshot; expired buckets drop out on next use."""
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load velocity snapshot: {e}")
+            return 0
+
+        if snapshot.get("bucket_seconds") != self.bucket_seconds or snapshot.get("buckets") != self.buckets:
+            logger.warning("Velocity snapshot window layout changed; starting with empty windows")
+            return 0
+
+        current_bucket = int(time.time() // self.bucket_seconds)
+        for account_id, (last_bucket, counts, amounts) in snapshot.get("accounts", {}).items():
+            window = _AccountWindow(self.buckets)
+            window.counts, window.amounts = list(counts), [float(a) for a in amounts]
+            window.last_bucket = last_bucket
+            window.total_count, window.total_amount = sum(counts), float(sum(amounts))
+            window.advance(max(last_bucket, current_bucket))
+            if window.total_count:
+                self._shards[self._shard(account_id)][account_id] = window
+        return sum(len(shard) for shard in self._shards)
+
+    def start_snapshots(self):
+        """Snapshot in a daemon thread every snapshot_interval seconds."""
+        if self._snapshot_thread and self._snapshot_thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(self.snapshot_interval):
+                try:
+                    self.save_snapshot()
+                except Exception as e:
+                    logger.warning(f"Velocity snapshot failed: {e}")
+
+        self._stop.clear()
+        self._snapshot_thread = threading.Thread(target=run, name="velocity-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def stop(self) -> int:
+        """Stop the snapshot thread and write a final snapshot."""
+        self._stop.set()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join(timeout=10)
+        return self.save_snapshot()
+
+    def stats(self) -> Dict:
+        return {
+            "accounts_tracked": sum(len(shard) for shard in self._shards),
+            "accounts_evicted": self.evicted,
+            "transactions_scored": sum(self._scored),
+            "transactions_flagged": sum(self._flagged),
+            "future_timestamps_clamped": sum(self._clamped),
+            "stale_transactions": sum(self._stale),
+            "max_transactions_per_hour": self.max_transactions,
+            "max_amount_per_hour": self.max_amount,
+        }
@@ -6,6 +6,7 @@ from typing import Dict, List, Tuple, Any
 import numpy as np
 import os
 from dataclasses import dataclass
+from agents.text_rules import get_text_rules
 
 @dataclass
 class FraudAlert:
@@ -70,33 +71,11 @@ class ElderlyFraudAgentWithGemini:
     
     def analyze_text_for_fraud(self, text: str) -> Dict:
         """Analyze text input for fraud indicators"""
-        risk_indicators = []
-        risk_level = "LOW"
-        actions = []
-        
-        text_lower = text.lower()
-        
-        # High-risk patterns
-        if any(keyword in text_lower for keyword in ["ssn", "social security", "bank account", "credit card", "password"]):
-            risk_indicators.append("Request for sensitive personal information")
-            risk_level = "HIGH"
-            actions.extend(["BLOCK_CALLER", "ALERT_FAMILY"])
-        
-        if any(keyword in text_lower for keyword in ["urgent", "immediate", "act now", "limited time"]):
-            risk_indicators.append("High-pressure tactics detected")
-            if risk_level != "HIGH":
-                risk_level = "MEDIUM"
-            actions.append("VERIFY_INDEPENDENTLY")
-        
-        if any(keyword in text_lower for keyword in ["gift card", "bitcoin", "wire transfer", "money order"]):
-            risk_indicators.append("Suspicious payment method requested")
-            risk_level = "HIGH"
-            actions.extend(["DO_NOT_PAY", "ALERT_FAMILY"])
-        
-        if any(keyword in text_lower for keyword in ["irs", "arrest", "warrant", "police"]):
-            risk_indicators.append("Government impersonation scam indicators")
-            risk_level = "HIGH"
-            actions.extend(["HANG_UP", "CONTACT_AUTHORITIES"])
+        # Same rule table as the deployed agent (agents/data/text_rules.json)
+        matched = get_text_rules().analyze(text)
+        risk_indicators = matched["risk_indicators"]
+        risk_level = matched["risk_level"]
+        actions = matched["actions"]
         
         # Generate detailed structured response based on risk
         if risk_level == "HIGH":
@@ -2,28 +2,7 @@
 import google.generativeai as genai
 import os
 from typing import Dict, List
-
-# Mock Database
-POLICY_DATABASE = {
-    "arogya sanjeevani": {
-        "policy_name": "Arogya Sanjeevani Policy",
-        "coverage_range": "₹1 Lakh to ₹5 Lakhs",
-        "pre_existing_disease_waiting_period": "48 months",
-        "key_features": ["Standardized benefits across all insurers", "Covers hospitalization, pre and post-hospitalization costs", "Cumulative bonus available."]
-    },
-    "star comprehensive": {
-        "policy_name": "Star Comprehensive Insurance Policy",
-        "coverage_range": "₹5 Lakhs to ₹1 Crore",
-        "pre_existing_disease_waiting_period": "36 months",
-        "key_features": ["No cap on room rent", "Covers health check-ups", "Personal accident cover included."]
-    },
-    "hdfc ergo optima restore": {
-        "policy_name": "HDFC ERGO Optima Restore",
-        "coverage_range": "₹5 Lakhs to ₹50 Lakhs",
-        "pre_existing_disease_waiting_period": "36 months",
-        "key_features": ["Restores 100% of sum insured if exhausted", "Multiplier benefit increases sum insured for claim-free years", "Daily hospital cash benefit."]
-    }
-}
+from agents.policy_catalog import get_policy_catalog
 
 def calculate_estimated_premium(age: int, city: str, coverage_amount: int) -> dict:
     """Calculates an estimated annual health insurance premium."""
@@ -41,12 +20,15 @@ def calculate_tax_deduction(premium_amount: int, is_senior_citizen: bool = False
     return {"eligible_deduction": f"₹{deduction:,.2f}", "limit_under_80D": f"₹{limit:,.2f}"}
 
 def lookup_policy_details(policy_name: str) -> dict:
-    """Looks up the details for a specific health insurance policy from the simple database."""
-    policy_key = policy_name.lower().strip()
-    if policy_key in POLICY_DATABASE:
-        return POLICY_DATABASE[policy_key]
-    else:
+    """Looks up the details for a specific health insurance policy from the policy catalog."""
+    policy = get_policy_catalog().get(policy_name)
+    if policy is None:
         return {"error": f"Policy '{policy_name}' not found in the database."}
+    return policy.details()
+
+def compare_policies(policy_names: List[str]) -> dict:
+    """Compares two or more health insurance policies side by side."""
+    return get_policy_catalog().compare(policy_names)
 
 class HealthcareFinanceAgent:
     def __init__(self, api_key: str = None):
@@ -1,6 +1,8 @@
 # coordinator.py
 import os
+import time
 import logging
+import threading
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
@@ -8,12 +10,21 @@ from datetime import datetime
 from agents.fraud_agent import ElderlyFraudAgentWithGemini
 from agents.healthcare_agent import HealthcareFinanceAgent
 from agents.estate_agent import EstateAgent
-from agents.family_agent import FamilyAgent
+from agents.family_agent import FamilyAgent, FamilyAlertBatcher
+from agents.velocity import VelocityScorer
+from agents.spending_baselines import SpendingBaselines
+from agents.merchant_index import get_merchant_index
+from agents.indicator_reputation import IndicatorReputationIndex, scam_rules, source_key
+from agents.text_normalizer import compile_keywords, normalize_text
+from agents.text_rules import get_text_rules
+from agents.rule_metrics import get_rule_metrics
+from agents.scam_pattern_index import ScamPatternIndex
+from agents.document_index import UserDocumentIndex
+from agents.embeddings import get_embedder
+from agents.pattern_learner import ScamPatternLearner
 
-# Import database helpers
+# Import database helpers (ChromaHelper is imported on demand by the retrieval warmup)
 from database.sqlite_helper import SQLiteHelper
-# Temporarily disable ChromaDB for deployment
-# from database.chroma_helper import ChromaHelper
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,8 +39,21 @@ class AgentCoordinator:
     def __init__(self):
         # Initialize database helpers
         self.db = SQLiteHelper()
-        # Temporarily disable ChromaDB for deployment compatibility
+        # ChromaDB is opt-in (ENABLE_CHROMADB); scam pattern similarity runs in-process
+        # (one matrix-vector product per request) and user documents in per-user partitions
         self.chroma = None
+        self.scam_index = None
+        self.documents = None
+        self.pattern_learner = None
+        # Retrieval loads indexes and the embedding model off the startup path; the fraud
+        # path skips pattern enhancement until this is set
+        self.retrieval_ready = threading.Event()
+        self.retrieval_warmup_s = None
+        if os.getenv('ENABLE_RETRIEVAL', 'true').lower() == 'true':
+            if os.getenv('RETRIEVAL_WARMUP', 'background').lower() == 'blocking':
+                self._warm_retrieval()
+            else:
+                threading.Thread(target=self._warm_retrieval, name="retrieval-warmup", daemon=True).start()
         
         # Get API key from environment
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
@@ -39,6 +63,44 @@ class AgentCoordinator:
         # Initialize agents
         self.agents = self._initialize_agents()
         
+        # Real-time velocity scoring, configured from the fraud agent's velocity_fraud pattern
+        velocity_pattern = self.agents["fraud"].fraud_patterns["velocity_fraud"] if self.agents["fraud"] else {}
+        self.velocity = VelocityScorer.from_fraud_patterns(
+            velocity_pattern, snapshot_interval=float(os.getenv('VELOCITY_SNAPSHOT_INTERVAL', '60'))
+        )
+        self.velocity.start_snapshots()
+        
+        # Per-account, per-category spending baselines for amount-anomaly z-scores
+        anomaly_pattern = self.agents["fraud"].fraud_patterns["amount_anomaly"] if self.agents["fraud"] else {}
+        self.baselines = SpendingBaselines.from_fraud_patterns(
+            anomaly_pattern, db=self.db, flush_interval=float(os.getenv('BASELINE_FLUSH_INTERVAL', '60'))
+        )
+        self.baselines.start_flushing()
+        if self.agents["fraud"]:
+            self.agents["fraud"].baselines = self.baselines
+        
+        # Family alert text is generated in batches (one Gemini call per batch) off the request path
+        self.alert_batcher = None
+        if self.agents["family"] and self.agents["family"].model:
+            self.alert_batcher = FamilyAlertBatcher(self.agents["family"], self.db)
+            self.alert_batcher.start()
+        
+        # Merchant descriptor -> expected categories, for category-mismatch checks
+        self.merchants = get_merchant_index()
+        
+        # Phone numbers, links and payment IDs seen in earlier risky incidents
+        self.reputation = IndicatorReputationIndex()
+        try:
+            loaded = self.reputation.load_from_incidents(self.db)
+            logger.info(f"Indicator reputation index built from {loaded} incidents")
+        except Exception as e:
+            logger.error(f"Failed to build indicator reputation index: {e}")
+        if self.agents["fraud"]:
+            self.agents["fraud"].reputation = self.reputation
+        
+        # Compile the fraud text rule table now rather than on the first request
+        get_text_rules()
+        
         # Intent detection keywords
         self.intent_keywords = {
             "fraud": [
@@ -61,12 +123,46 @@ class AgentCoordinator:
                 "grandchildren", "spouse", "relatives", "emergency contact"
             ]
         }
+        # Compiled once; matched against normalize_text() output
+        self.intent_patterns = {intent: compile_keywords(keywords) for intent, keywords in self.intent_keywords.items()}
+        self.family_escalation_pattern = compile_keywords(["emergency", "urgent", "help", "scam", "fraud"])
         
         # Risk priority mapping
         self.risk_priority = {"HIGH": 3, "MEDIUM": 2, "LOW": 1}
         
         logger.info("AgentCoordinator initialized successfully")
     
+    def _warm_retrieval(self):
+        """Open the similarity indexes, preload the embedding model and optionally ChromaDB, then mark ready"""
+        started = time.perf_counter()
+        try:
+            self.scam_index = ScamPatternIndex()
+            logger.info(f"Scam pattern index ready ({len(self.scam_index)} patterns)")
+            # Grow the index from new HIGH incidents, skipping near-duplicates of known patterns
+            if os.getenv('ENABLE_PATTERN_LEARNING', 'true').lower() == 'true':
+                self.pattern_learner = ScamPatternLearner(self.scam_index, self.db)
+                self.pattern_learner.start()
+        except Exception as e:
+            logger.error(f"Failed to load scam pattern index: {e}")
+        try:
+            self.documents = UserDocumentIndex()
+        except Exception as e:
+            logger.error(f"Failed to open user document index: {e}")
+        try:
+            # Lazily loaded models (MiniLM) load on their first call; take that hit here, not on a request
+            get_embedder().embedder.embed(["warmup"])
+        except Exception as e:
+            logger.error(f"Failed to preload embedding model: {e}")
+        if os.getenv('ENABLE_CHROMADB', 'false').lower() == 'true':
+            try:
+                from database.chroma_helper import ChromaHelper
+                self.chroma = ChromaHelper()
+            except Exception as e:
+                logger.error(f"Failed to initialize ChromaDB: {e}")
+        self.retrieval_warmup_s = round(time.perf_counter() - started, 3)
+        self.retrieval_ready.set()
+        logger.info(f"Retrieval ready in {self.retrieval_warmup_s}s")
+    
     def _initialize_agents(self) -> Dict:
         """Initialize all specialized agents"""
         agents = {}
@@ -101,21 +197,25 @@ class AgentCoordinator:
         
         return agents
     
-    def detect_intents(self, text: str) -> List[str]:
+    def detect_intents(self, text: str, normalized: str = None) -> List[str]:
         """Detect which agents should be activated based on input text"""
-        text_lower = text.lower()
+        text_lower = normalized if normalized is not None else normalize_text(text)
         activated_intents = []
         
-        for intent, keywords in self.intent_keywords.items():
-            if any(keyword in text_lower for keyword in keywords):
+        for intent, pattern in self.intent_patterns.items():
+            if pattern.search(text_lower):
                 activated_intents.append(intent)
         
+        # A known scam phone number, link or payment ID always needs the fraud agent
+        if "fraud" not in activated_intents and self.reputation.check(text):
+            activated_intents.insert(0, "fraud")
+        
         # Default to fraud agent if no specific intent detected
         if not activated_intents:
             activated_intents = ["fraud"]
         
         # Always activate family agent for HIGH risk situations
-        if any(keyword in text_lower for keyword in ["emergency", "urgent", "help", "scam", "fraud"]):
+        if self.family_escalation_pattern.search(text_lower):
             if "family" not in activated_intents:
                 activated_intents.append("family")
         
@@ -152,18 +252,21 @@ class AgentCoordinator:
             "agent_type": agent_name
         }
     
-    def _call_fraud_agent(self, text: str) -> Dict:
+    def _call_fraud_agent(self, text: str, normalized: str = None) -> Dict:
         """Call fraud agent with text analysis"""
         if not self.agents["fraud"]:
             return {"error": "Fraud agent not available"}
         
         try:
             # Use text analysis method for conversational input
-            result = self.agents["fraud"].analyze_text_for_fraud(text)
+            result = self.agents["fraud"].analyze_text_for_fraud(text, normalized=normalized)
             
-            # Enhance with ChromaDB patterns if available
-            if self.chroma:
-                enhancement = self.chroma.enhance_fraud_analysis(text)
+            # Enhance with similar known scam patterns if available; the message is only
+            # embedded when the lexical stage finds no near-verbatim pattern. Without a fired
+            # text rule an embedding-only match can raise the message to MEDIUM at most.
+            if self.scam_index and self.retrieval_ready.is_set():
+                corroborated = bool(scam_rules(result.get("metadata", {}).get("rules_fired", [])))
+                enhancement = self.scam_index.enhance_fraud_analysis(text, corroborated=corroborated)
                 if enhancement["enhancement"]:
                     enhancement_data = enhancement["enhancement"]
                     
@@ -249,7 +352,7 @@ class AgentCoordinator:
                 "error": str(e)
             }
     
-    def process_request(self, user_id: str, text: str, meta: Dict = None) -> Dict:
+    def process_request(self, user_id: str, text: str, meta: Dict = None, source: str = None) -> Dict:
         """
         Main coordination function - processes user request and returns unified response
         
@@ -257,6 +360,7 @@ class AgentCoordinator:
             user_id: User identifier
             text: User input text
             meta: Optional metadata (channel, language, flags)
+            source: Request source observed by the server (client address), for indicator reputation
         
         Returns:
             Dict with response, risk_level, agent_traces, actions, logs_id
@@ -264,8 +368,11 @@ class AgentCoordinator:
         logger.info(f"Processing request for user {user_id}: '{text[:100]}...'")
         
         try:
+            # Undo homoglyph/leetspeak/spacing obfuscation once; every keyword matcher reads this
+            normalized = normalize_text(text)
+            
             # Detect which agents to activate
-            intents = self.detect_intents(text)
+            intents = self.detect_intents(text, normalized=normalized)
             
             # Call activated agents
             agent_responses = {}
@@ -275,7 +382,7 @@ class AgentCoordinator:
                 agent_traces.append(intent)
                 
                 if intent == "fraud":
-                    agent_responses["fraud"] = self._call_fraud_agent(text)
+                    agent_responses["fraud"] = self._call_fraud_agent(text, normalized=normalized)
                 elif intent == "healthcare":
                     agent_responses["healthcare"] = self._call_healthcare_agent(text)
                 elif intent == "estate":
@@ -306,13 +413,23 @@ class AgentCoordinator:
                 response=final_response,
                 agent_traces=agent_traces,
                 actions=all_actions,
-                confidence_score=confidence_score
+                confidence_score=confidence_score,
+                source=source_key(source)
             )
+            fraud_metadata = agent_responses.get("fraud", {}).get("metadata", {})
+            if "rules_fired" in fraud_metadata:
+                # Counted against the final risk, after pattern upgrades and the other agents' verdicts
+                get_rule_metrics().record(fraud_metadata["rules_fired"], overall_risk,
+                                          fraud_metadata.get("rule_timings_ns"))
+            self.reputation.record(text, overall_risk, fraud_metadata.get("rules_fired", []),
+                                   source=source_key(source), incident_id=incident_id)
             
             # Generate family alert if needed
             family_alert_id = None
             if overall_risk == "HIGH" and self._should_alert_family(user_id, all_actions):
                 family_alert_id = self._generate_family_alert(user_id, incident_id, final_response, overall_risk)
+                if family_alert_id:
+                    get_rule_metrics().record_family_alert(fraud_metadata.get("rules_fired", []))
             
             # Prepare final response
             response = {
@@ -436,11 +553,11 @@ class AgentCoordinator:
     def _generate_family_alert(self, user_id: str, incident_id: int, response: str, risk_level: str) -> Optional[int]:
         """Generate and store family alert"""
         try:
+            # Keep the user id out of the prompt so identical alerts can share one LLM call
+            event_description = f"Security alert: {response}"
             if self.agents["family"]:
-                alert_message = self.agents["family"].generate_family_alert(
-                    f"Security alert for user {user_id}: {response}", 
-                    risk_level
-                )
+                # Stored with the template text now; the batcher writes the Gemini text shortly after
+                alert_message = self.agents["family"]._basic_family_alert(event_description, risk_level)
             else:
                 alert_message = f"🚨 FAMILY ALERT: We detected a {risk_level.lower()} security concern. Please contact your family member to verify their safety."
             
@@ -450,6 +567,8 @@ class AgentCoordinator:
                 alert_type="SECURITY",
                 alert_message=alert_message
             )
+            if self.alert_batcher and alert_id:
+                self.alert_batcher.enqueue(alert_id, event_description, risk_level)
             
             logger.info(f"Generated family alert {alert_id} for user {user_id}")
             return alert_id
@@ -458,6 +577,56 @@ class AgentCoordinator:
             logger.error(f"Failed to generate family alert: {e}")
             return None
     
+    def score_transaction(self, account_id: str, amount: float, timestamp=None,
+                          merchant_category: str = None, merchant_name: str = None) -> Dict:
+        """Score one incoming transaction against its velocity window, spending baseline and merchant"""
+        started = time.perf_counter()
+        result = self.velocity.score(account_id, amount, timestamp)
+        anomaly = self.baselines.score(account_id, merchant_category, amount)
+        
+        if self.risk_priority[anomaly["risk_level"]] > self.risk_priority[result["risk_level"]]:
+            result["risk_level"] = anomaly["risk_level"]
+        result["violations"] = result["violations"] + anomaly["violations"]
+        result["amount_zscore"] = anomaly["amount_zscore"]
+        result["baseline_mean"] = anomaly["baseline_mean"]
+        
+        if merchant_name and merchant_category and self.merchants.is_category_mismatch(merchant_name, merchant_category):
+            merchant = self.merchants.lookup(merchant_name)
+            result["violations"].append(
+                f"{merchant.name} ({merchant.kind.replace('_', ' ')}) charged as {merchant_category.replace('_', ' ')}"
+            )
+            if result["risk_level"] == "LOW":
+                result["risk_level"] = "MEDIUM"
+        
+        result["latency_us"] = round((time.perf_counter() - started) * 1e6, 1)
+        return result
+    
+    def shutdown(self):
+        """Persist in-memory state before the process exits"""
+        try:
+            saved = self.velocity.stop()
+            logger.info(f"Saved velocity windows for {saved} accounts")
+        except Exception as e:
+            logger.error(f"Failed to save velocity snapshot: {e}")
+        try:
+            saved = self.baselines.stop()
+            logger.info(f"Flushed {saved} spending baselines")
+        except Exception as e:
+            logger.error(f"Failed to flush spending baselines: {e}")
+        if self.alert_batcher:
+            try:
+                written = self.alert_batcher.stop()
+                logger.info(f"Wrote {written} queued family alerts")
+            except Exception as e:
+                logger.error(f"Failed to write queued family alerts: {e}")
+        if self.pattern_learner:
+            self.pattern_learner.stop()
+        if self.scam_index:
+            try:
+                self.scam_index.embedder.flush()
+            except Exception as e:
+                logger.error(f"Failed to persist embedding cache: {e}")
+    
     def get_health_status(self) -> Dict:
         """Get system health status"""
         return {
@@ -470,7 +639,10 @@ class AgentCoordinator:
             },
             "database": {
                 "sqlite": self.db is not None,
-                "chromadb": self.chroma is not None and self.chroma.client is not None
+                "chromadb": self.chroma is not None and self.chroma.client is not None,
+                "scam_index": self.scam_index is not None,
+                "documents": self.documents is not None,
+                "retrieval_ready": self.retrieval_ready.is_set()
             },
             "timestamp": datetime.now().isoformat()
         }
\ No newline at end of file
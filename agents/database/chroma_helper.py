@@ -1,114 +1,101 @@
 # chroma_helper.py
 import chromadb
 import os
+import threading
+import time
 import uuid
 from typing import List, Dict, Optional
 from pathlib import Path
 import json
+from agents.scam_pattern_index import load_seed_patterns
+from agents.embeddings import ChromaEmbeddingFunction, get_embedder
+from agents.document_ingest import EMBED_BATCH_SIZE, ingest_report, iter_chunk_batches, merge_chunks
 
 class ChromaHelper:
-    def __init__(self, chroma_dir: str = None):
+    def __init__(self, chroma_dir: str = None, background: bool = False):
+        """
+        Open the client, create the collections, seed scam patterns and load
+        the embedding model. With background=True that runs on a daemon
+        thread: `ready` is set when it finishes, and until then every query
+        returns no results (the collections are still None).
+        """
         self.chroma_dir = chroma_dir or os.path.join(os.getenv('DATA_DIR', 'data'), 'chroma_db')
         self.enable_retrieval = os.getenv('ENABLE_RETRIEVAL', 'true').lower() == 'true'
+        self.client = None
+        self.scam_collection = None
+        self.docs_collection = None
+        self.ready = threading.Event()
         
         if not self.enable_retrieval:
             print("📝 ChromaDB retrieval is disabled via ENABLE_RETRIEVAL flag")
-            self.client = None
-            self.scam_collection = None
-            self.docs_collection = None
+            self.ready.set()
             return
         
+        if background:
+            threading.Thread(target=self._initialize, name="chroma-warmup", daemon=True).start()
+        else:
+            self._initialize()
+    
+    def _initialize(self):
         # Ensure directory exists
         Path(self.chroma_dir).mkdir(parents=True, exist_ok=True)
         
+        # Embed through the shared query cache when it runs the collections' own model (MiniLM);
+        # a different model would not match vectors already stored in the collections
+        self.embedder = get_embedder()
+        self.collection_options = {}
+        if self.embedder.name == "minilm-l6-v2":
+            self.collection_options["embedding_function"] = ChromaEmbeddingFunction(self.embedder)
+        
+        started = time.perf_counter()
         try:
             # Initialize ChromaDB client with persistent storage
-            self.client = chromadb.PersistentClient(path=self.chroma_dir)
+            client = chromadb.PersistentClient(path=self.chroma_dir)
             
             # Create collections
-            self.scam_collection = self.client.get_or_create_collection(
+            scam_collection = client.get_or_create_collection(
                 name="scam_scripts",
-                metadata={"description": "Known scam patterns and scripts for fraud detection"}
+                metadata={"description": "Known scam patterns and scripts for fraud detection"},
+                **self.collection_options
             )
             
-            self.docs_collection = self.client.get_or_create_collection(
+            docs_collection = client.get_or_create_collection(
                 name="user_documents", 
-                metadata={"description": "User uploaded documents for analysis"}
+                metadata={"description": "User uploaded documents for analysis"},
+                **self.collection_options
             )
             
             # Seed with initial scam patterns if collection is empty
-            self._seed_scam_patterns()
+            self._seed_scam_patterns(scam_collection)
             
-            print(f"✅ ChromaDB initialized at {self.chroma_dir}")
+            # The embedding model loads on its first call; make that a warmup query, not a user's
+            scam_collection.query(query_texts=["warmup"], n_results=1)
+            
+            # Publish only fully initialized collections to concurrent readers
+            self.client = client
+            self.scam_collection = scam_collection
+            self.docs_collection = docs_collection
+            print(f"✅ ChromaDB initialized at {self.chroma_dir} in {time.perf_counter() - started:.2f}s")
             
         except Exception as e:
             print(f"⚠️ Warning: Could not initialize ChromaDB: {e}")
-            self.client = None
-            self.scam_collection = None
-            self.docs_collection = None
+        finally:
+            self.ready.set()
     
-    def _seed_scam_patterns(self):
+    def _seed_scam_patterns(self, collection=None):
         """Seed collection with common scam patterns"""
-        if not self.scam_collection or self.scam_collection.count() > 0:
+        collection = collection or self.scam_collection
+        if not collection or collection.count() > 0:
             return
         
-        scam_patterns = [
-            {
-                "text": "This is the IRS calling about your tax debt. You must pay immediately or face arrest.",
-                "category": "government_impersonation",
-                "risk_level": "HIGH",
-                "elderly_concern": "Government agencies never threaten arrest for unpaid taxes over the phone"
-            },
-            {
-                "text": "Your grandson is in jail and needs bail money. Send $2000 via Western Union immediately.",
-                "category": "family_emergency", 
-                "risk_level": "HIGH",
-                "elderly_concern": "Always verify family emergencies by calling the person directly"
-            },
-            {
-                "text": "You've won a lottery! Just pay the processing fee to claim your prize.",
-                "category": "lottery_scam",
-                "risk_level": "HIGH", 
-                "elderly_concern": "Legitimate lotteries never require upfront fees"
-            },
-            {
-                "text": "Your bank account has been compromised. Please provide your login details to secure it.",
-                "category": "phishing",
-                "risk_level": "HIGH",
-                "elderly_concern": "Banks never ask for login credentials over the phone"
-            },
-            {
-                "text": "You qualify for a free medical alert system. Just provide your Medicare number.",
-                "category": "medicare_scam",
-                "risk_level": "HIGH",
-                "elderly_concern": "Never give Medicare information to unsolicited callers"
-            },
-            {
-                "text": "Your computer has a virus. Allow me to remote access to fix it for $200.",
-                "category": "tech_support",
-                "risk_level": "HIGH",
-                "elderly_concern": "Legitimate tech companies don't make unsolicited calls about viruses"
-            },
-            {
-                "text": "Urgent payment required for your medical bill or it will go to collections.",
-                "category": "medical_billing",
-                "risk_level": "MEDIUM",
-                "elderly_concern": "Always verify medical bills with your healthcare provider directly"
-            },
-            {
-                "text": "Act now to lower your credit card interest rates. This offer expires today.",
-                "category": "credit_card",
-                "risk_level": "MEDIUM", 
-                "elderly_concern": "High-pressure tactics are red flags for scams"
-            }
-        ]
+        scam_patterns = load_seed_patterns()
         
         try:
             texts = [pattern["text"] for pattern in scam_patterns]
             metadatas = [{k: v for k, v in pattern.items() if k != "text"} for pattern in scam_patterns]
             ids = [str(uuid.uuid4()) for _ in scam_patterns]
             
-            self.scam_collection.add(
+            collection.add(
                 documents=texts,
                 metadatas=metadatas,
                 ids=ids
@@ -119,14 +106,20 @@ class ChromaHelper:
         except Exception as e:
             print(f"⚠️ Warning: Could not seed scam patterns: {e}")
     
-    def query_scam_patterns(self, query_text: str, n_results: int = 3) -> List[Dict]:
+    def _query_input(self, query_text: str, query_embedding=None) -> Dict:
+        """Query by a precomputed embedding when the caller has one, else by text"""
+        if query_embedding is not None:
+            return {"query_embeddings": [list(map(float, query_embedding))]}
+        return {"query_texts": [query_text]}
+    
+    def query_scam_patterns(self, query_text: str, n_results: int = 3, query_embedding=None) -> List[Dict]:
         """Query similar scam patterns"""
         if not self.scam_collection:
             return []
         
         try:
             results = self.scam_collection.query(
-                query_texts=[query_text],
+                **self._query_input(query_text, query_embedding),
                 n_results=n_results,
                 include=["documents", "metadatas", "distances"]
             )
@@ -171,34 +164,45 @@ class ChromaHelper:
     
     def add_document(self, user_id: str, document_text: str, document_type: str, 
                     filename: str = None, metadata: Dict = None) -> str:
-        """Add user document for analysis"""
+        """Add user document for analysis (chunked; see add_documents)"""
         if not self.docs_collection:
             return None
         
+        document = {"text": document_text, "document_type": document_type,
+                    "filename": filename, "metadata": metadata}
+        report = self.add_documents(user_id, [document])
+        return document["document_id"] if report.get("chunks") and not report.get("error") else None
+    
+    def add_documents(self, user_id: str, documents: List[Dict], batch_size: int = EMBED_BATCH_SIZE) -> Dict:
+        """
+        Bulk-ingest documents: split each into overlapping chunks, embed
+        chunks in batches of batch_size and add each batch with one
+        collection call. Documents are dicts with "text" and optional
+        "document_type", "filename" and "metadata"; their assigned
+        "document_id" is written back. Returns counts and pages per second.
+        """
+        if not self.docs_collection:
+            return {"error": "ChromaDB not available"}
+        
+        stats, batches = {}, 0
+        start = time.perf_counter()
         try:
-            doc_id = str(uuid.uuid4())
-            doc_metadata = {
-                "user_id": user_id,
-                "document_type": document_type,
-                "filename": filename or "unknown",
-                "upload_timestamp": str(chromadb.utils.embedding_functions.DefaultEmbeddingFunction().generate_timestamp()),
-                **(metadata or {})
-            }
-            
-            self.docs_collection.add(
-                documents=[document_text],
-                metadatas=[doc_metadata],
-                ids=[doc_id]
-            )
-            
-            return doc_id
-            
+            for ids, texts, metadatas in iter_chunk_batches(user_id, documents, batch_size, stats=stats):
+                batch = {"documents": texts, "metadatas": metadatas, "ids": ids}
+                if "embedding_function" not in self.collection_options:
+                    # Collection embeds with its own model; it still embeds the batch in one call
+                    self.docs_collection.add(**batch)
+                else:
+                    self.docs_collection.add(**batch, embeddings=self.embedder.embedder.embed(texts).tolist())
+                batches += 1
         except Exception as e:
-            print(f"⚠️ Warning: Could not add document: {e}")
-            return None
+            print(f"⚠️ Warning: Could not add documents: {e}")
+            return {**ingest_report(stats, batches, time.perf_counter() - start), "error": str(e)}
+        
+        return ingest_report(stats, batches, time.perf_counter() - start)
     
     def query_user_documents(self, user_id: str, query_text: str, 
-                           document_type: str = None, n_results: int = 3) -> List[Dict]:
+                           document_type: str = None, n_results: int = 3, query_embedding=None) -> List[Dict]:
         """Query user's documents"""
         if not self.docs_collection:
             return []
@@ -210,7 +214,7 @@ class ChromaHelper:
                 where_clause["document_type"] = document_type
             
             results = self.docs_collection.query(
-                query_texts=[query_text],
+                **self._query_input(query_text, query_embedding),
                 n_results=n_results,
                 where=where_clause,
                 include=["documents", "metadatas", "distances"]
@@ -243,17 +247,16 @@ class ChromaHelper:
                 include=["documents", "metadatas"]
             )
             
-            documents = []
+            chunks = []
             if results['documents']:
                 for i, doc in enumerate(results['documents']):
-                    document = {
+                    chunks.append({
                         "id": results['ids'][i] if results['ids'] else None,
                         "text": doc,
                         "metadata": results['metadatas'][i] if results['metadatas'] else {}
-                    }
-                    documents.append(document)
+                    })
             
-            return documents
+            return merge_chunks(chunks)
             
         except Exception as e:
             print(f"⚠️ Warning: Could not get user documents: {e}")
@@ -265,6 +268,8 @@ class ChromaHelper:
             return False
         
         try:
+            # Chunked documents share a document_id; older whole-document entries are keyed by it
+            self.docs_collection.delete(where={"document_id": document_id})
             self.docs_collection.delete(ids=[document_id])
             return True
             
@@ -275,7 +280,7 @@ class ChromaHelper:
     def get_collection_stats(self) -> Dict:
         """Get ChromaDB collection statistics"""
         if not self.client:
-            return {"error": "ChromaDB not available"}
+            return {"error": "ChromaDB not available" if self.ready.is_set() else "ChromaDB still initializing"}
         
         try:
             stats = {
@@ -289,13 +294,19 @@ class ChromaHelper:
         except Exception as e:
             return {"error": f"Could not get stats: {e}"}
     
-    def enhance_fraud_analysis(self, input_text: str) -> Dict:
+    def embed_query(self, text: str):
+        """Embed a request's text once for all collection queries (None if the collections use another model)"""
+        if not self.enable_retrieval or self.embedder.name != "minilm-l6-v2":
+            return None
+        return self.embedder.embed_one(text)
+    
+    def enhance_fraud_analysis(self, input_text: str, query_embedding=None) -> Dict:
         """Enhance fraud analysis with similar scam patterns"""
         if not self.enable_retrieval or not self.scam_collection:
             return {"enhancement": None, "similar_patterns": []}
         
         try:
-            similar_patterns = self.query_scam_patterns(input_text, n_results=2)
+            similar_patterns = self.query_scam_patterns(input_text, n_results=2, query_embedding=query_embedding)
             
             if not similar_patterns:
                 return {"enhancement": None, "similar_patterns": []}
@@ -29,6 +29,7 @@ class SQLiteHelper:
                     agent_traces TEXT, -- JSON array of agent names
                     actions TEXT, -- JSON array of actions
                     confidence_score REAL,
+                    source TEXT, -- hashed request source observed by the server (not client-supplied)
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(user_id)
                 );
@@ -65,6 +66,17 @@ class SQLiteHelper:
                     FOREIGN KEY (incident_id) REFERENCES incidents(id)
                 );
                 
+                -- Per-account, per-category running spend statistics (Welford)
+                CREATE TABLE IF NOT EXISTS spending_baselines (
+                    account_id TEXT NOT NULL,
+                    merchant_category TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    mean REAL NOT NULL,
+                    m2 REAL NOT NULL, -- sum of squared deviations from the mean
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_id, merchant_category)
+                );
+                
                 -- Create indexes for better performance
                 CREATE INDEX IF NOT EXISTS idx_incidents_user_id ON incidents(user_id);
                 CREATE INDEX IF NOT EXISTS idx_incidents_created_at ON incidents(created_at);
@@ -72,10 +84,14 @@ class SQLiteHelper:
                 CREATE INDEX IF NOT EXISTS idx_pending_alerts_user_id ON pending_alerts(user_id);
                 CREATE INDEX IF NOT EXISTS idx_pending_alerts_status ON pending_alerts(status);
             """)
+            # Columns added after the first release; CREATE TABLE IF NOT EXISTS leaves older tables as they were
+            incident_columns = {row[1] for row in conn.execute("PRAGMA table_info(incidents)")}
+            if "source" not in incident_columns:
+                conn.execute("ALTER TABLE incidents ADD COLUMN source TEXT")
     
     def insert_incident(self, user_id: str, input_text: str, risk_level: str, 
                        response: str, agent_traces: List[str] = None, 
-                       actions: List[str] = None, confidence_score: float = None) -> int:
+                       actions: List[str] = None, confidence_score: float = None, source: str = None) -> int:
         """Insert new incident and return incident ID"""
         agent_traces_json = json.dumps(agent_traces or [])
         actions_json = json.dumps(actions or [])
@@ -84,10 +100,10 @@ class SQLiteHelper:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO incidents (user_id, input_text, risk_level, response, 
-                                     agent_traces, actions, confidence_score)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                                     agent_traces, actions, confidence_score, source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (user_id, input_text, risk_level, response, 
-                  agent_traces_json, actions_json, confidence_score))
+                  agent_traces_json, actions_json, confidence_score, source))
             
             return cursor.lastrowid
     
@@ -113,6 +129,32 @@ class SQLiteHelper:
             
             return incidents
     
+    def iter_incident_texts(self, risk_levels: List[str] = None, after_id: int = 0):
+        """Yield (id, user_id, input_text, risk_level) for incidents at the given risk levels after after_id, oldest first"""
+        risk_levels = risk_levels or ["MEDIUM", "HIGH"]
+        placeholders = ",".join("?" for _ in risk_levels)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, user_id, input_text, risk_level FROM incidents
+                WHERE risk_level IN ({placeholders}) AND id > ?
+                ORDER BY id
+            """, [*risk_levels, after_id])
+            yield from cursor
+    
+    def iter_incident_reports(self, risk_levels: List[str] = None):
+        """Yield (id, source, input_text, risk_level, created_at epoch seconds) for incidents at the given risk levels, oldest first"""
+        risk_levels = risk_levels or ["MEDIUM", "HIGH"]
+        placeholders = ",".join("?" for _ in risk_levels)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, source, input_text, risk_level, CAST(strftime('%s', created_at) AS REAL) FROM incidents
+                WHERE risk_level IN ({placeholders})
+                ORDER BY id
+            """, risk_levels)
+            yield from cursor
+    
     def get_incident_by_id(self, incident_id: int) -> Optional[Dict]:
         """Get incident by ID"""
         with sqlite3.connect(self.db_path) as conn:
@@ -206,6 +248,18 @@ class SQLiteHelper:
             
             return cursor.rowcount > 0
     
+    def update_alert_message(self, alert_id: int, alert_message: str) -> bool:
+        """Replace an alert's message (batched generation fills in the final text)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE pending_alerts 
+                SET alert_message = ?
+                WHERE id = ?
+            """, (alert_message, alert_id))
+            
+            return cursor.rowcount > 0
+    
     def upsert_user(self, user_id: str, name: str = None, age: int = None) -> bool:
         """Insert or update user info"""
         with sqlite3.connect(self.db_path) as conn:
@@ -231,6 +285,32 @@ class SQLiteHelper:
             
             return dict(row) if row else None
     
+    def upsert_spending_baselines(self, rows: List[tuple]) -> int:
+        """Bulk upsert (account_id, merchant_category, count, mean, m2) rows"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                INSERT INTO spending_baselines (account_id, merchant_category, count, mean, m2, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(account_id, merchant_category) DO UPDATE SET
+                    count = excluded.count, mean = excluded.mean, m2 = excluded.m2,
+                    updated_at = CURRENT_TIMESTAMP
+            """, rows)
+            return len(rows)
+    
+    def get_spending_baselines(self) -> List[tuple]:
+        """All (account_id, merchant_category, count, mean, m2) rows"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT account_id, merchant_category, count, mean, m2 FROM spending_baselines")
+            return cursor.fetchall()
+    
+    def clear_spending_baselines(self) -> int:
+        """Delete all baselines (before a full rebuild)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM spending_baselines")
+            return cursor.rowcount
+    
     def get_stats(self) -> Dict:
         """Get database statistics"""
         with sqlite3.connect(self.db_path) as conn:
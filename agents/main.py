@@ -9,6 +9,9 @@ import logging
 from datetime import datetime
 from dotenv import load_dotenv
 from coordinator import AgentCoordinator
+from agents.llm_gateway import usage_tracker, single_flight
+from agents.text_rules import get_text_rules
+from agents.rule_metrics import get_rule_metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -57,6 +60,11 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Failed to initialize AgentCoordinator: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if coordinator:
+        coordinator.shutdown()
+
 # Request/Response models
 class RouteRequest(BaseModel):
     user_id: str = Field(..., description="User identifier")
@@ -73,6 +81,37 @@ class RouteResponse(BaseModel):
     timestamp: str = Field(..., description="Response timestamp")
     family_alert_id: Optional[str] = Field(None, description="Family alert ID if generated")
 
+class TransactionScoreRequest(BaseModel):
+    account_id: str = Field(..., description="Account identifier")
+    amount: float = Field(..., ge=0, description="Transaction amount")
+    timestamp: Optional[str] = Field(None, description="ISO-8601 time or epoch seconds; defaults to now")
+    transaction_id: Optional[str] = Field(None, description="Transaction identifier")
+    merchant_category: Optional[str] = Field(None, description="Merchant category for the spending baseline")
+    merchant_name: Optional[str] = Field(None, description="Raw merchant descriptor for the category-mismatch check")
+
+class TransactionScoreResponse(BaseModel):
+    transaction_id: Optional[str] = None
+    account_id: str
+    risk_level: str
+    velocity_score: float
+    transactions_in_window: int
+    amount_in_window: float
+    violations: List[str]
+    in_window: bool = Field(True, description="False when the timestamp is older than the velocity window, so it was not counted")
+    amount_zscore: Optional[float] = None
+    baseline_mean: Optional[float] = None
+    latency_us: float
+
+class DocumentUpload(BaseModel):
+    text: str = Field(..., description="Extracted document text; form feeds separate pages")
+    document_type: str = Field("general", description="Document type, e.g. will, insurance, statement")
+    filename: Optional[str] = Field(None, description="Original file name")
+    document_id: Optional[str] = Field(None, description="Document identifier; generated if omitted")
+    metadata: Optional[Dict] = Field(default_factory=dict, description="Extra metadata stored with each chunk")
+
+class DocumentUploadRequest(BaseModel):
+    documents: List[DocumentUpload] = Field(..., min_items=1, description="Documents to store")
+
 class HealthResponse(BaseModel):
     status: str
     agents: Dict[str, bool]
@@ -91,7 +130,8 @@ async def root():
     return {
         "message": "WisdomWealth Agent API is running",
         "version": "1.0.0",
-        "endpoints": ["/health", "/route"],
+        "endpoints": ["/health", "/route", "/transactions/score", "/documents/{user_id}",
+                      "/documents/{user_id}/search"],
         "timestamp": datetime.now().isoformat()
     }
 
@@ -114,8 +154,10 @@ async def health_check():
             detail=f"Health check failed: {str(e)}"
         )
 
+# Plain def: FastAPI runs it in its threadpool, so concurrent requests (and their
+# LLM calls) overlap instead of queueing behind one another on the event loop
 @app.post("/route", response_model=RouteResponse, summary="Process user request")
-async def route_request(request: RouteRequest, http_request: Request):
+def route_request(request: RouteRequest, http_request: Request):
     """
     Main routing endpoint - processes user requests through appropriate agents
     
@@ -154,7 +196,8 @@ async def route_request(request: RouteRequest, http_request: Request):
         result = coordinator.process_request(
             user_id=request.user_id,
             text=request.text,
-            meta=request.meta
+            meta=request.meta,
+            source=client_ip
         )
         
         # Handle coordinator errors
@@ -184,6 +227,40 @@ async def route_request(request: RouteRequest, http_request: Request):
         
         return RouteResponse(**fallback_response)
 
+# async on purpose: scoring is a sub-millisecond in-memory update, so skipping
+# the threadpool hop keeps card-authorization latency low
+@app.post("/transactions/score", response_model=TransactionScoreResponse, summary="Score a transaction in real time")
+async def score_transaction(request: TransactionScoreRequest):
+    """
+    Real-time velocity check for a single transaction
+    
+    - **account_id**: Account the transaction belongs to
+    - **amount**: Transaction amount
+    - **timestamp**: Optional transaction time (ISO-8601 or epoch seconds)
+    - **merchant_category**: Optional category for the amount-anomaly check
+    - **merchant_name**: Optional raw descriptor (e.g. "SHELL OIL 57442") for the category-mismatch check
+    """
+    if not coordinator:
+        raise HTTPException(
+            status_code=503,
+            detail="AgentCoordinator not available"
+        )
+    
+    timestamp = request.timestamp
+    if timestamp:
+        try:
+            timestamp = float(timestamp)
+        except ValueError:
+            pass
+    
+    try:
+        result = coordinator.score_transaction(request.account_id, request.amount, timestamp,
+                                               request.merchant_category, request.merchant_name)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid timestamp: {e}")
+    
+    return TransactionScoreResponse(transaction_id=request.transaction_id, **result)
+
 @app.get("/stats", summary="Get system statistics")
 async def get_stats():
     """Get system statistics (incidents, users, etc.)"""
@@ -203,6 +280,18 @@ async def get_stats():
         return {
             "database": db_stats,
             "chromadb": chroma_stats,
+            "llm_usage": usage_tracker.snapshot(),
+            "llm_coalescing": single_flight.stats(),
+            "velocity": coordinator.velocity.stats(),
+            "spending_baselines": coordinator.baselines.stats(),
+            "indicator_reputation": coordinator.reputation.stats(),
+            "text_rules": get_text_rules().stats(),
+            "scam_patterns": coordinator.scam_index.stats() if coordinator.scam_index else {},
+            "embedding_cache": coordinator.scam_index.embedder.stats() if coordinator.scam_index else {},
+            "documents": coordinator.documents.stats() if coordinator.documents else {},
+            "retrieval": {"ready": coordinator.retrieval_ready.is_set(), "warmup_s": coordinator.retrieval_warmup_s},
+            "pattern_learning": coordinator.pattern_learner.stats() if coordinator.pattern_learner else {},
+            "family_alert_batching": coordinator.alert_batcher.stats() if coordinator.alert_batcher else {},
             "agents": {
                 "fraud": coordinator.agents["fraud"] is not None,
                 "healthcare": coordinator.agents["healthcare"] is not None,
@@ -216,6 +305,15 @@ async def get_stats():
         logger.error(f"Stats error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics/rules", summary="Fraud rule hit counters")
+async def get_rule_metrics_endpoint():
+    """Hits, co-fires, resulting risk levels, family alerts and (if enabled) latency per fraud rule"""
+    return {
+        **get_rule_metrics().snapshot(),
+        "text_rules_version": get_text_rules().table.version,
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.get("/incidents/{user_id}", summary="Get user incidents")
 async def get_user_incidents(user_id: str, limit: int = 10):
     """Get recent incidents for a user"""
@@ -260,6 +358,62 @@ async def get_pending_alerts(user_id: str):
         logger.error(f"Alerts error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _document_index():
+    if not coordinator or not coordinator.documents:
+        raise HTTPException(status_code=503, detail="Document index not available (retrieval may still be warming up)")
+    return coordinator.documents
+
+@app.post("/documents/{user_id}", summary="Store user documents")
+def upload_documents(user_id: str, request: DocumentUploadRequest):
+    """Chunk, embed and store documents in the user's partition"""
+    documents = _document_index()
+    try:
+        uploads = [d.dict() for d in request.documents]
+        report = documents.add_documents(user_id, uploads)
+        return {
+            "user_id": user_id,
+            "document_ids": [d["document_id"] for d in uploads],
+            **report,
+            "timestamp": datetime.now().isoformat()
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"Document upload error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/documents/{user_id}", summary="List user documents")
+def list_documents(user_id: str):
+    """Stored documents for a user, reassembled from their chunks"""
+    documents = _document_index().get_user_documents(user_id)
+    return {
+        "user_id": user_id,
+        "documents": documents,
+        "count": len(documents),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/documents/{user_id}/search", summary="Search user documents")
+def search_documents(user_id: str, q: str, document_type: Optional[str] = None, n_results: int = 3):
+    """Most similar chunks of the user's own documents (no embedding at all when they have none)"""
+    results = _document_index().query_user_documents(user_id, q, document_type, n_results)
+    return {
+        "user_id": user_id,
+        "results": results,
+        "count": len(results),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.delete("/documents/{user_id}/{document_id}", summary="Delete a user document")
+def delete_document(user_id: str, document_id: str):
+    """Remove every chunk of one document"""
+    return {
+        "user_id": user_id,
+        "document_id": document_id,
+        "deleted": _document_index().delete_document(user_id, document_id),
+        "timestamp": datetime.now().isoformat()
+    }
+
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc):